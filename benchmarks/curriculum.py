@@ -0,0 +1,120 @@
+"""Time-to-accuracy of the point-budget curriculum on a dense traveling wave.
+
+A NIFMultiScale model is trained on a traveling wave sampled on a dense grid,
+once on all the points at every epoch and once with a `PointBudgetCurriculum`
+that keeps one point per cell of a spatial grid, per time snapshot, during the
+first stages. After every epoch the model is evaluated on all the points, and
+the training time (excluding the evaluations) needed to reach each target mse is
+reported.
+
+Usage:
+    python benchmarks/curriculum.py --nt 20 --nx 5000 --epochs 30
+"""
+import argparse
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from nif import NIFMultiScale
+from nif.data import PointBudgetCurriculum
+from nif.data import PointWiseData
+
+
+def traveling_wave(nt, nx):
+    t, x = np.meshgrid(np.linspace(0, 1, nt), np.linspace(0, 1, nx), indexing="ij")
+    u = np.exp(-1000 * (x - 0.2 - 0.6 * t) ** 2)
+    raw = np.stack([t.ravel(), x.ravel(), u.ravel()], -1).astype(np.float32)
+    pw_data = PointWiseData(raw[:, :1], raw[:, 1:2], raw[:, 2:])
+    pw_data.data = (raw - raw.mean(0)) / raw.std(0)
+    return pw_data
+
+
+def train(pw_data, curriculum, args):
+    tf.keras.utils.set_random_seed(0)
+    cfg_shape_net = {
+        "connectivity": "full",
+        "input_dim": 1,
+        "output_dim": 1,
+        "units": args.width,
+        "nlayers": 2,
+        "weight_init_factor": 0.01,
+        "omega_0": 30.0,
+        "use_resblock": True,
+    }
+    cfg_parameter_net = {
+        "use_resblock": False,
+        "input_dim": 1,
+        "latent_dim": 2,
+        "units": 30,
+        "nlayers": 2,
+        "activation": "swish",
+    }
+    model = NIFMultiScale(cfg_shape_net, cfg_parameter_net).build()
+    model.compile(tf.keras.optimizers.Adam(args.lr), loss="mse")
+
+    features = pw_data.data[:, :2]
+    target = pw_data.data[:, 2:]
+    if curriculum is None:
+        dataset = tf.data.Dataset.from_tensor_slices((features, target))
+        dataset = dataset.shuffle(len(features), seed=0).batch(args.batch_size)
+    else:
+        make_dataset = pw_data.get_curriculum_dataset(
+            curriculum, args.batch_size, seed=0
+        )
+
+    # one `fit` per epoch for both schedules, so they pay the same overhead
+    train_time = 0.0
+    history = []
+    for epoch in range(args.epochs):
+        if curriculum is not None:
+            dataset = make_dataset(epoch)
+        t0 = time.perf_counter()
+        model.fit(dataset, initial_epoch=epoch, epochs=epoch + 1, verbose=0)
+        train_time += time.perf_counter() - t0
+        mse = model.evaluate(features, target, batch_size=8192, verbose=0)
+        history.append((train_time, mse))
+    return history
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--nt", type=int, default=20)
+    parser.add_argument("--nx", type=int, default=5000)
+    parser.add_argument("--epochs", type=int, default=30)
+    parser.add_argument("--batch-size", type=int, default=512)
+    parser.add_argument("--width", type=int, default=32)
+    parser.add_argument("--lr", type=float, default=1e-3)
+    parser.add_argument("--initial-cells", type=int, default=64)
+    parser.add_argument("--n-stages", type=int, default=4)
+    parser.add_argument("--epochs-per-stage", type=int, default=3)
+    parser.add_argument("--targets", type=float, nargs="+", default=[0.1, 0.03, 0.01])
+    args = parser.parse_args()
+
+    pw_data = traveling_wave(args.nt, args.nx)
+    lower = pw_data.data[:, 1].min()
+    upper = pw_data.data[:, 1].max()
+    curriculum = PointBudgetCurriculum(
+        [1],
+        [lower],
+        [upper],
+        initial_cells=args.initial_cells,
+        n_stages=args.n_stages,
+        epochs_per_stage=args.epochs_per_stage,
+        group_columns=[0],
+    )
+    print(
+        "{:>12s} {:>12s} {:>10s}".format("schedule", "final mse", "train s")
+        + "".join(" {:>12s}".format("s to {:g}".format(t)) for t in args.targets)
+    )
+    for name, curriculum_ in [("full", None), ("curriculum", curriculum)]:
+        history = train(pw_data, curriculum_, args)
+        row = "{:>12s} {:12.4e} {:10.2f}".format(name, history[-1][1], history[-1][0])
+        for target_mse in args.targets:
+            reached = [t for t, mse in history if mse <= target_mse]
+            row += " {:12.2f}".format(reached[0]) if reached else " {:>12s}".format("-")
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
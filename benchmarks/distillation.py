@@ -0,0 +1,163 @@
+"""Distillation of a large NIFMultiScale into a small one.
+
+A wide teacher is trained on a demo dataset, then a narrow student is trained with
+`nif.distillation.distill` on samples streamed from the teacher, until its relative
+L2 error with respect to the teacher is below the tolerance. The sampling weighted
+by the Jacobian of the teacher is compared with uniform sampling. The number of
+steps and the time to reach the tolerance, the error on the dataset and the
+inference time on `--n-predict` uniform points of the input box are reported.
+The learning rate of the student decays to zero over `--max-steps` with a cosine,
+as the stochastic error of a constant rate otherwise dominates the tolerance. The default `omega_0`
+of 10 keeps the teacher smooth between the points of the dataset; with 30 it
+oscillates between them and cannot be reproduced over the whole box.
+
+Usage:
+    python benchmarks/distillation.py --demo TravelingWave --teacher-width 64 --student-width 32
+"""
+import argparse
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from nif import demo
+from nif import NIFMultiScale
+from nif.distillation import distill
+
+
+def make_model(width, pnet_width, omega_0):
+    cfg_shape_net = {
+        "connectivity": "full",
+        "input_dim": 1,
+        "output_dim": 1,
+        "units": width,
+        "nlayers": 2,
+        "weight_init_factor": 0.01,
+        "omega_0": omega_0,
+        "use_resblock": True,
+    }
+    cfg_parameter_net = {
+        "use_resblock": False,
+        "input_dim": 1,
+        "latent_dim": 2,
+        "units": pnet_width,
+        "nlayers": 2,
+        "activation": "swish",
+    }
+    return NIFMultiScale(cfg_shape_net, cfg_parameter_net)
+
+
+def evaluate(model_ori, features, target, points, args):
+    """
+    Returns the mean squared error on the dataset and the inference time on
+    `points`, evaluated in chunks of `--eval-batch-size`.
+    """
+    model = model_ori.model()
+    prediction = model.predict(features, batch_size=args.eval_batch_size, verbose=0)
+    model.predict(points[: args.eval_batch_size], verbose=0)
+    t0 = time.perf_counter()
+    model.predict(points, batch_size=args.eval_batch_size, verbose=0)
+    elapsed = time.perf_counter() - t0
+    return float(np.mean((prediction - target) ** 2)), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--demo",
+        default="TravelingWave",
+        choices=["TravelingWave", "TravelingWaveHighFreq"],
+    )
+    parser.add_argument("--epochs", type=int, default=300)
+    parser.add_argument("--batch-size", type=int, default=1024)
+    parser.add_argument("--eval-batch-size", type=int, default=8192)
+    parser.add_argument("--n-predict", type=int, default=1000000)
+    parser.add_argument("--teacher-width", type=int, default=64)
+    parser.add_argument("--student-width", type=int, default=32)
+    parser.add_argument("--tolerance", type=float, default=5e-2)
+    parser.add_argument("--max-steps", type=int, default=4000)
+    parser.add_argument("--eval-size", type=int, default=16384)
+    parser.add_argument("--lr", type=float, default=1e-3)
+    parser.add_argument("--omega-0", type=float, default=10.0)
+    args = parser.parse_args()
+
+    data = getattr(demo, args.demo)().data
+    features = data[:, :2].astype(np.float32)
+    target = data[:, 2:3].astype(np.float32)
+    rng = np.random.default_rng(0)
+    points = rng.uniform(
+        features.min(0), features.max(0), size=(args.n_predict, features.shape[1])
+    ).astype(np.float32)
+
+    tf.keras.utils.set_random_seed(0)
+    teacher = make_model(args.teacher_width, 30, args.omega_0)
+    model = teacher.build()
+    model.compile(tf.keras.optimizers.Adam(args.lr), loss="mse")
+    model.fit(
+        features, target, batch_size=args.batch_size, epochs=args.epochs, verbose=0
+    )
+    mse, predict_time = evaluate(teacher, features, target, points, args)
+    rows = [("teacher", teacher.po_dim, "", "", "", mse, predict_time)]
+
+    for name, uniform_fraction in [("student, uniform", 1.0), ("student", 0.25)]:
+        tf.keras.utils.set_random_seed(0)
+        student = make_model(args.student_width, 20, args.omega_0)
+        t0 = time.perf_counter()
+        history = distill(
+            teacher,
+            student,
+            features.min(0),
+            features.max(0),
+            tolerance=args.tolerance,
+            optimizer=tf.keras.optimizers.Adam(
+                tf.keras.optimizers.schedules.CosineDecay(args.lr, args.max_steps)
+            ),
+            batch_size=args.batch_size,
+            uniform_fraction=uniform_fraction,
+            max_steps=args.max_steps,
+            eval_size=args.eval_size,
+            verbose=0,
+        )
+        elapsed = time.perf_counter() - t0
+        mse, predict_time = evaluate(student, features, target, points, args)
+        rows.append(
+            (
+                name,
+                student.po_dim,
+                history["step"][-1],
+                "{:.1f}".format(elapsed),
+                "{:.2e}".format(history["relative_error"][-1]),
+                mse,
+                predict_time,
+            )
+        )
+
+    print(
+        "{:>18s} {:>8s} {:>8s} {:>10s} {:>12s} {:>12s} {:>10s} {:>8s}".format(
+            "model",
+            "po_dim",
+            "steps",
+            "distill s",
+            "rel. error",
+            "data mse",
+            "predict s",
+            "speedup",
+        )
+    )
+    for name, po_dim, steps, elapsed, error, mse, predict_time in rows:
+        print(
+            "{:>18s} {:8d} {:>8} {:>10s} {:>12s} {:12.4e} {:10.4f} {:8.2f}".format(
+                name,
+                po_dim,
+                steps,
+                elapsed,
+                error,
+                mse,
+                predict_time,
+                rows[0][-1] / predict_time,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
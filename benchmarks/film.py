@@ -0,0 +1,85 @@
+"""Compare NIFMultiScale with per-point generated weights and NIFMultiScaleFiLM.
+
+Both models are trained on a demo dataset with the same shape net size and the
+same parameter net. NIFMultiScaleFiLM shares the shape net weights across all
+points and the parameter net only generates a scale and a shift per layer, so
+`po_dim` is `2 * (nlayers + 1) * units` instead of O(nlayers * units**2).
+
+Usage:
+    python benchmarks/film.py --demo TravelingWave --epochs 200 --width 64
+"""
+import argparse
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from nif import demo
+from nif import NIFMultiScale
+from nif import NIFMultiScaleFiLM
+
+
+def train(model_class, connectivity, data, args):
+    tf.keras.utils.set_random_seed(0)
+    cfg_shape_net = {
+        "connectivity": connectivity,
+        "input_dim": 1,
+        "output_dim": 1,
+        "units": args.width,
+        "nlayers": 2,
+        "weight_init_factor": 0.01,
+        "omega_0": 30.0,
+        "use_resblock": True,
+    }
+    cfg_parameter_net = {
+        "use_resblock": False,
+        "input_dim": 1,
+        "latent_dim": 2,
+        "units": 30,
+        "nlayers": 2,
+        "activation": "swish",
+    }
+    model_ori = model_class(cfg_shape_net, cfg_parameter_net)
+    model = model_ori.build()
+    model.compile(tf.keras.optimizers.Adam(args.lr), loss="mse")
+
+    features = data[:, :2].astype(np.float32)
+    target = data[:, 2:3].astype(np.float32)
+    t0 = time.perf_counter()
+    model.fit(
+        features, target, batch_size=args.batch_size, epochs=args.epochs, verbose=0
+    )
+    elapsed = time.perf_counter() - t0
+    mse = model.evaluate(features, target, batch_size=args.batch_size, verbose=0)
+    return model_ori.po_dim, elapsed / args.epochs, mse
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--demo",
+        default="TravelingWave",
+        choices=["TravelingWave", "TravelingWaveHighFreq"],
+    )
+    parser.add_argument("--epochs", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=512)
+    parser.add_argument("--width", type=int, default=64)
+    parser.add_argument("--lr", type=float, default=1e-3)
+    args = parser.parse_args()
+
+    data = getattr(demo, args.demo)().data
+    print("{:>20s} {:>8s} {:>12s} {:>12s}".format("model", "po_dim", "s/epoch", "mse"))
+    for model_class, connectivity in [
+        (NIFMultiScale, "full"),
+        (NIFMultiScaleFiLM, "film"),
+    ]:
+        po_dim, time_per_epoch, mse = train(model_class, connectivity, data, args)
+        print(
+            "{:>20s} {:8d} {:12.4f} {:12.4e}".format(
+                model_class.__name__, po_dim, time_per_epoch, mse
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Import time of the package and of its submodules.
+
+Each statement is run in a fresh process, which is what every worker process of a
+pipeline pays, and the best wall-clock time over `--n-repeat` runs is reported,
+with whether TensorFlow, TensorFlow Probability and the TensorFlow Model
+Optimization Toolkit were imported by it.
+
+Usage:
+    python benchmarks/import_time.py --n-repeat 5
+"""
+import argparse
+import subprocess
+import sys
+
+STATEMENTS = [
+    "import numpy",
+    "import tensorflow",
+    "import nif",
+    "from nif.inference import NumpyModel",
+    "from nif import NIFMultiScale",
+    "from nif import data",
+    "from nif import demo",
+    "from nif import optimizers",
+    "import nif; nif.configure_gpus(verbose=False)",
+]
+
+HEAVY_MODULES = [
+    ("tf", "tensorflow"),
+    ("tfp", "tensorflow_probability"),
+    ("tfmot", "tensorflow_model_optimization"),
+]
+
+WORKER = """
+import time
+start = time.perf_counter()
+{}
+elapsed = time.perf_counter() - start
+import sys
+print(elapsed, *[name in sys.modules for name in {}])
+"""
+
+
+def run(statement):
+    """
+    Returns the import time in seconds and the heavy modules imported, or None if
+    the statement failed.
+    """
+    process = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            WORKER.format(statement, [module for _, module in HEAVY_MODULES]),
+        ],
+        capture_output=True,
+        text=True,
+    )
+    if process.returncode != 0:
+        return None
+    output = process.stdout.split()[-1 - len(HEAVY_MODULES) :]
+    imported = [
+        name for (name, _), flag in zip(HEAVY_MODULES, output[1:]) if flag == "True"
+    ]
+    return float(output[0]), imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n-repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print("{:>46s} {:>10s} {:>16s}".format("statement", "time s", "imports"))
+    for statement in STATEMENTS:
+        results = [run(statement) for _ in range(args.n_repeat)]
+        if None in results:
+            print("{:>46s} {:>10s}".format(statement, "failed"))
+            continue
+        print(
+            "{:>46s} {:10.3f} {:>16s}".format(
+                statement,
+                min(elapsed for elapsed, _ in results),
+                ",".join(results[0][1]) or "-",
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Benchmark forward vs reverse mode in `compute_output_and_grad`.
+
+For a fixed batch and network, the number of requested inputs `len(x_index)`
+and outputs `len(y_index)` is swept. Reverse mode costs one backward pass per
+output while forward mode costs one tangent pass per input. As a tangent pass
+costs about twice a backward pass, e.g., 6 ms vs 3.5 ms on one CPU core with the
+defaults, forward mode wins when there are at least twice as many outputs as
+inputs, which is what `mode="auto"` picks. The faster mode of each pair is
+reported next to the choice of `auto`.
+
+Usage:
+    python benchmarks/jacobian_modes.py --batch-size 4096 --repeat 20
+"""
+import argparse
+import time
+
+import tensorflow as tf
+
+from nif.layers.gradient import compute_output_and_grad
+
+
+def build_model(n_input, n_output, width, depth):
+    layers = [tf.keras.layers.InputLayer(input_shape=(n_input,))]
+    for _ in range(depth):
+        layers.append(tf.keras.layers.Dense(width, activation="tanh"))
+    layers.append(tf.keras.layers.Dense(n_output))
+    return tf.keras.Sequential(layers)
+
+
+def time_mode(model, x, x_index, y_index, mode, repeat):
+    fn = tf.function(
+        lambda x_: compute_output_and_grad(model, x_, x_index, y_index, mode)
+    )
+    fn(x)  # trace
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        _, dys_dxs = fn(x)
+    dys_dxs.numpy()
+    return (time.perf_counter() - t0) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch-size", type=int, default=4096)
+    parser.add_argument("--width", type=int, default=64)
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1, 2, 3, 4, 6, 8, 12, 16]
+    )
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(
+        "{:>6s} {:>6s} {:>12s} {:>12s} {:>8s} {:>8s}".format(
+            "n_x", "n_y", "forward[ms]", "reverse[ms]", "faster", "auto"
+        )
+    )
+    for n_x in args.sizes:
+        for n_y in args.sizes:
+            model = build_model(n_x, n_y, args.width, args.depth)
+            x = tf.random.normal([args.batch_size, n_x])
+            x_index = list(range(n_x))
+            y_index = list(range(n_y))
+            t_fwd = time_mode(model, x, x_index, y_index, "forward", args.repeat)
+            t_rev = time_mode(model, x, x_index, y_index, "reverse", args.repeat)
+            faster = "forward" if t_fwd < t_rev else "reverse"
+            auto = "forward" if 2 * n_x <= n_y else "reverse"
+            print(
+                "{:6d} {:6d} {:12.3f} {:12.3f} {:>8s} {:>8s}".format(
+                    n_x, n_y, 1e3 * t_fwd, 1e3 * t_rev, faster, auto
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
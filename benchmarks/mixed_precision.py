@@ -0,0 +1,97 @@
+"""Compare float32 and reduced-precision training of NIFMultiScale on the demos.
+
+For each policy, the same model is trained on a demo dataset with the same
+seed, then the throughput (points per second) and the final float32 MSE on the
+whole dataset are reported. With `mixed_bfloat16` or `mixed_float16`, the
+parameter net output, i.e., the per-point weights of the shape net, and the
+batched einsums of the shape net are in reduced precision, while the
+variables, the output of the shape net and the loss stay in float32.
+
+Reduced precision is meant for GPUs with tensor cores. On a CPU, it is slower
+than float32, e.g., 2x with `mixed_bfloat16` and 8x with `mixed_float16` on
+TravelingWave with one core of a Xeon with AMX, for a similar MSE.
+
+Usage:
+    python benchmarks/mixed_precision.py --demo TravelingWave --epochs 20
+"""
+import argparse
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from nif import demo
+from nif import NIFMultiScale
+
+
+def get_config(n_para, n_x, n_target, width):
+    cfg_shape_net = {
+        "connectivity": "full",
+        "input_dim": n_x,
+        "output_dim": n_target,
+        "units": width,
+        "nlayers": 2,
+        "weight_init_factor": 0.01,
+        "omega_0": 30.0,
+        "use_resblock": True,
+    }
+    cfg_parameter_net = {
+        "use_resblock": False,
+        "input_dim": n_para,
+        "latent_dim": 2,
+        "units": 30,
+        "nlayers": 2,
+        "activation": "swish",
+    }
+    return cfg_shape_net, cfg_parameter_net
+
+
+def train(data, n_para, n_x, n_target, policy, args):
+    tf.keras.utils.set_random_seed(0)
+    cfg_shape_net, cfg_parameter_net = get_config(n_para, n_x, n_target, args.width)
+    model_ori = NIFMultiScale(cfg_shape_net, cfg_parameter_net, policy)
+    model = model_ori.build()
+    model.compile(tf.keras.optimizers.Adam(args.lr), loss="mse")
+
+    features = data[:, : n_para + n_x].astype(np.float32)
+    target = data[:, n_para + n_x : n_para + n_x + n_target].astype(np.float32)
+    model.fit(features, target, batch_size=args.batch_size, epochs=1, verbose=0)
+    t0 = time.perf_counter()
+    model.fit(
+        features, target, batch_size=args.batch_size, epochs=args.epochs, verbose=0
+    )
+    elapsed = time.perf_counter() - t0
+
+    pred = model.predict(features, batch_size=args.batch_size, verbose=0)
+    mse = np.mean(np.square(pred.astype(np.float64) - target))
+    return features.shape[0] * args.epochs / elapsed, mse
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--demo",
+        default="TravelingWave",
+        choices=["TravelingWave", "TravelingWaveHighFreq"],
+    )
+    parser.add_argument("--epochs", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=512)
+    parser.add_argument("--width", type=int, default=30)
+    parser.add_argument("--lr", type=float, default=1e-3)
+    parser.add_argument(
+        "--policies",
+        nargs="+",
+        default=["float32", "mixed_bfloat16", "mixed_float16"],
+    )
+    args = parser.parse_args()
+
+    dataset = getattr(demo, args.demo)()
+    n_para, n_x, n_target = 1, 1, 1
+    print("{:>16s} {:>14s} {:>12s}".format("policy", "points/s", "mse"))
+    for policy in args.policies:
+        throughput, mse = train(dataset.data, n_para, n_x, n_target, policy, args)
+        print("{:>16s} {:>14.0f} {:>12.4e}".format(policy, throughput, mse))
+
+
+if __name__ == "__main__":
+    main()
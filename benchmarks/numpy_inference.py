@@ -0,0 +1,225 @@
+"""Startup, memory and speed of the NumPy inference of exported NIF models.
+
+A NIFMultiScale and a NIFMultiScaleLastLayerParameterized are trained on a demo
+dataset, then saved as a configuration with Keras weights, and exported with
+`nif.inference.export_numpy`. Each is loaded in a fresh process, either by
+rebuilding the Keras model and loading its weights, or by
+`nif.inference.NumpyModel`, and the time from the first import to the first
+prediction and the peak resident memory of the process are reported. The time to
+predict `--points` points per parameter value of the dataset is then compared in
+this process, with the error of NumPy relative to Keras.
+
+Usage:
+    python benchmarks/numpy_inference.py --demo TravelingWave --epochs 100
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from nif import demo
+from nif import NIFMultiScale
+from nif import NIFMultiScaleLastLayerParameterized
+from nif.inference import export_numpy
+from nif.inference import NumpyModel
+
+# prints the time since `start` and the peak resident memory in kB of the process,
+# from /proc on Linux since `ru_maxrss` is inherited from the parent through exec
+REPORT = """
+elapsed = time.perf_counter() - start
+try:
+    with open("/proc/self/status") as status:
+        memory = [line.split()[1] for line in status if line.startswith("VmHWM")][0]
+except (OSError, IndexError):
+    import resource
+    memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(elapsed, memory)
+"""
+
+# the first prediction of a saved model in a fresh process, with the class name,
+# the configuration, the weights, the exported model and the inputs as arguments
+KERAS_WORKER = (
+    """
+import time
+start = time.perf_counter()
+import json
+import sys
+import numpy as np
+import nif
+config = json.load(open(sys.argv[2]))
+model_ori = getattr(nif, sys.argv[1])(config["cfg_shape_net"], config["cfg_parameter_net"])
+model = model_ori.model()
+model.load_weights(sys.argv[3])
+model.predict(np.load(sys.argv[5]), verbose=0)
+"""
+    + REPORT
+)
+
+NUMPY_WORKER = (
+    """
+import time
+start = time.perf_counter()
+import sys
+import numpy as np
+from nif.inference import NumpyModel
+NumpyModel(sys.argv[4]).predict(np.load(sys.argv[5]))
+"""
+    + REPORT
+)
+
+
+def train(model_class, connectivity, dataset, args):
+    tf.keras.utils.set_random_seed(0)
+    cfg_shape_net = {
+        "connectivity": connectivity,
+        "input_dim": dataset.n_x,
+        "output_dim": dataset.n_o,
+        "units": args.width,
+        "nlayers": 2,
+        "weight_init_factor": 0.01,
+        "omega_0": 30.0,
+        "use_resblock": True,
+    }
+    cfg_parameter_net = {
+        "use_resblock": False,
+        "input_dim": dataset.n_p,
+        "latent_dim": 2 if connectivity == "full" else 8,
+        "units": 30,
+        "nlayers": 2,
+        "activation": "swish",
+    }
+    model_ori = model_class(cfg_shape_net, cfg_parameter_net)
+    model = model_ori.build()
+    model.compile(tf.keras.optimizers.Adam(args.lr), loss="mse")
+    model.fit(
+        np.hstack([dataset.parameter, dataset.x]),
+        dataset.u,
+        batch_size=args.batch_size,
+        epochs=args.epochs,
+        verbose=0,
+    )
+    return model_ori
+
+
+def run_worker(code, model_ori, paths):
+    """
+    Returns the startup time in seconds and the peak memory in MB of a worker.
+    """
+    output = subprocess.run(
+        [sys.executable, "-c", code, type(model_ori).__name__] + paths,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.split()
+    return float(output[-2]), float(output[-1]) / 1024
+
+
+def timed(fn, n_repeat):
+    fn()
+    elapsed = []
+    for _ in range(n_repeat):
+        t0 = time.perf_counter()
+        fn()
+        elapsed.append(time.perf_counter() - t0)
+    return min(elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--demo",
+        default="TravelingWave",
+        choices=["TravelingWave", "TravelingWaveHighFreq", "CylinderFlow"],
+    )
+    parser.add_argument("--epochs", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=1024)
+    parser.add_argument("--width", type=int, default=64)
+    parser.add_argument("--lr", type=float, default=1e-3)
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--n-repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    dataset = getattr(demo, args.demo)()
+    rng = np.random.default_rng(0)
+    param = np.unique(dataset.parameter, axis=0)
+    query = np.hstack(
+        [
+            np.repeat(param, args.points, axis=0),
+            rng.uniform(
+                dataset.x.min(0),
+                dataset.x.max(0),
+                (param.shape[0] * args.points, dataset.n_x),
+            ),
+        ]
+    ).astype(np.float32)
+
+    print(
+        "{:>36s} {:>10s} {:>11s} {:>12s} {:>10s} {:>14s}".format(
+            "model",
+            "runtime",
+            "startup s",
+            "memory MB",
+            "predict s",
+            "rel. max error",
+        )
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        paths = [
+            os.path.join(directory, name)
+            for name in ["config.json", "weights.h5", "model.npz", "inputs.npy"]
+        ]
+        np.save(paths[3], np.hstack([dataset.parameter, dataset.x]).astype(np.float32))
+        for model_class, connectivity in [
+            (NIFMultiScale, "full"),
+            (NIFMultiScaleLastLayerParameterized, "last_layer"),
+        ]:
+            model_ori = train(model_class, connectivity, dataset, args)
+            model = model_ori.model()
+            model_ori.save_config(paths[0])
+            model.save_weights(paths[1])
+            export_numpy(model_ori, paths[2])
+
+            numpy_model = NumpyModel(paths[2], args.threads)
+            reference = model.predict(query, batch_size=4096, verbose=0)
+            error = (
+                np.abs(numpy_model.predict(query) - reference).max()
+                / np.abs(reference).max()
+            )
+            rows = [
+                (
+                    "keras",
+                    run_worker(KERAS_WORKER, model_ori, paths),
+                    timed(
+                        lambda: model.predict(query, batch_size=4096, verbose=0),
+                        args.n_repeat,
+                    ),
+                    "",
+                ),
+                (
+                    "numpy",
+                    run_worker(NUMPY_WORKER, model_ori, paths),
+                    timed(lambda: numpy_model.predict(query), args.n_repeat),
+                    "{:.2e}".format(error),
+                ),
+            ]
+            for runtime, (startup, memory), predict_time, error in rows:
+                print(
+                    "{:>36s} {:>10s} {:11.3f} {:12.1f} {:10.3f} {:>14s}".format(
+                        model_class.__name__,
+                        runtime,
+                        startup,
+                        memory,
+                        predict_time,
+                        error,
+                    )
+                )
+
+
+if __name__ == "__main__":
+    main()
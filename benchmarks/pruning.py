@@ -0,0 +1,133 @@
+"""Structured width pruning of a trained NIFMultiScale.
+
+A model is trained on a demo dataset, its parameter net width is pruned with
+`nif.pruning.prune_width`, and the pruned model is fine-tuned with a smaller
+learning rate. The error, the number of weights, `po_dim`, the time per training
+epoch and the inference time are reported for the original model, the pruned
+model before and after fine-tuning, and a model of the pruned size trained from
+scratch for the same total epochs.
+
+Usage:
+    python benchmarks/pruning.py --demo TravelingWave --epochs 300 --pnet-width 30 --pruned-pnet-width 20
+"""
+import argparse
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from nif import demo
+from nif import NIFMultiScale
+from nif.pruning import prune_width
+
+
+def make_config(width, pnet_width):
+    cfg_shape_net = {
+        "connectivity": "full",
+        "input_dim": 1,
+        "output_dim": 1,
+        "units": width,
+        "nlayers": 2,
+        "weight_init_factor": 0.01,
+        "omega_0": 30.0,
+        "use_resblock": True,
+    }
+    cfg_parameter_net = {
+        "use_resblock": False,
+        "input_dim": 1,
+        "latent_dim": 2,
+        "units": pnet_width,
+        "nlayers": 2,
+        "activation": "swish",
+    }
+    return cfg_shape_net, cfg_parameter_net
+
+
+def fit(model_ori, features, target, epochs, lr, args):
+    model = model_ori.build()
+    model.compile(tf.keras.optimizers.Adam(lr), loss="mse")
+    t0 = time.perf_counter()
+    model.fit(features, target, batch_size=args.batch_size, epochs=epochs, verbose=0)
+    return (time.perf_counter() - t0) / max(epochs, 1)
+
+
+def evaluate(model_ori, features, target, args):
+    model = model_ori.model()
+    model.predict(features[: args.batch_size], verbose=0)
+    t0 = time.perf_counter()
+    prediction = model.predict(features, batch_size=args.batch_size, verbose=0)
+    elapsed = time.perf_counter() - t0
+    return float(np.mean((prediction - target) ** 2)), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--demo",
+        default="TravelingWave",
+        choices=["TravelingWave", "TravelingWaveHighFreq"],
+    )
+    parser.add_argument("--epochs", type=int, default=300)
+    parser.add_argument("--finetune-epochs", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=1024)
+    parser.add_argument("--width", type=int, default=64)
+    parser.add_argument("--pnet-width", type=int, default=30)
+    parser.add_argument("--pruned-pnet-width", type=int, default=20)
+    parser.add_argument("--lr", type=float, default=1e-3)
+    parser.add_argument("--finetune-lr", type=float, default=1e-4)
+    args = parser.parse_args()
+
+    data = getattr(demo, args.demo)().data
+    features = data[:, :2].astype(np.float32)
+    target = data[:, 2:3].astype(np.float32)
+
+    rows = []
+    tf.keras.utils.set_random_seed(0)
+    model_ori = NIFMultiScale(*make_config(args.width, args.pnet_width))
+    time_per_epoch = fit(model_ori, features, target, args.epochs, args.lr, args)
+    rows.append(("original", model_ori, time_per_epoch))
+
+    model_pruned = prune_width(
+        model_ori,
+        features[:: max(1, features.shape[0] // 4096)],
+        parameter_net_units=args.pruned_pnet_width,
+    )
+    rows.append(("pruned", model_pruned, float("nan")))
+    mse_pruned = evaluate(model_pruned, features, target, args)
+
+    time_per_epoch = fit(
+        model_pruned, features, target, args.finetune_epochs, args.finetune_lr, args
+    )
+    rows.append(("pruned + fine-tuned", model_pruned, time_per_epoch))
+
+    tf.keras.utils.set_random_seed(0)
+    model_small = NIFMultiScale(*make_config(args.width, args.pruned_pnet_width))
+    time_per_epoch = fit(
+        model_small, features, target, args.epochs + args.finetune_epochs, args.lr, args
+    )
+    rows.append(("small from scratch", model_small, time_per_epoch))
+
+    print(
+        "{:>20s} {:>8s} {:>8s} {:>12s} {:>12s} {:>12s}".format(
+            "model", "weights", "po_dim", "s/epoch", "predict s", "mse"
+        )
+    )
+    for name, model_ori_, time_per_epoch in rows:
+        if name == "pruned":
+            mse, predict_time = mse_pruned
+        else:
+            mse, predict_time = evaluate(model_ori_, features, target, args)
+        print(
+            "{:>20s} {:8d} {:8d} {:12.4f} {:12.4f} {:12.4e}".format(
+                name,
+                model_ori_.model().count_params(),
+                model_ori_.po_dim,
+                time_per_epoch,
+                predict_time,
+                mse,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
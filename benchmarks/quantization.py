@@ -0,0 +1,177 @@
+"""Post-training quantization of the NIF inference graphs with TensorFlow Lite.
+
+A NIFMultiScale and a NIFMultiScaleLastLayerParameterized are trained on a demo
+dataset. Each inference graph is quantized with `nif.quantization.quantize`,
+calibrated on a subset of the training points, and the error of each output field
+of the reconstructed solution, relative to the float model, is reported with the
+speedup of the quantized graph on all the points of the dataset over the float
+Keras model and over the float32 TensorFlow Lite graph, which separates the gain
+of the quantization from the one of the runtime:
+
+- `model_p_to_w`, followed by the float `model_x_to_u_given_w`,
+- `model_x_to_u_given_w`, given the float weights,
+- the shape net specialized to each parameter value of the dataset,
+- `model_x_to_phi` of NIFMultiScaleLastLayerParameterized.
+
+Usage:
+    python benchmarks/quantization.py --demo TravelingWave --epochs 200 --threads 4
+"""
+import argparse
+
+import numpy as np
+import tensorflow as tf
+
+from nif import demo
+from nif import NIFMultiScale
+from nif import NIFMultiScaleLastLayerParameterized
+from nif.quantization import quantization_report
+from nif.quantization import quantize
+from nif.quantization import relative_errors
+from nif.quantization import specialize_shape_net
+from nif.quantization import TFLiteModel
+
+
+def train(model_class, connectivity, dataset, args):
+    tf.keras.utils.set_random_seed(0)
+    cfg_shape_net = {
+        "connectivity": connectivity,
+        "input_dim": dataset.n_x,
+        "output_dim": dataset.n_o,
+        "units": args.width,
+        "nlayers": 2,
+        "weight_init_factor": 0.01,
+        "omega_0": 30.0,
+        "use_resblock": connectivity == "full",
+    }
+    cfg_parameter_net = {
+        "use_resblock": False,
+        "input_dim": dataset.n_p,
+        "latent_dim": 2 if connectivity == "full" else 8,
+        "units": 30,
+        "nlayers": 2,
+        "activation": "swish",
+    }
+    model_ori = model_class(cfg_shape_net, cfg_parameter_net)
+    model = model_ori.build()
+    model.compile(tf.keras.optimizers.Adam(args.lr), loss="mse")
+    model.fit(
+        np.hstack([dataset.parameter, dataset.x]),
+        dataset.u,
+        batch_size=args.batch_size,
+        epochs=args.epochs,
+        verbose=0,
+    )
+    return model_ori
+
+
+def benchmark_graphs(model_ori, model_ll, dataset, activations, args):
+    """
+    Yields the name, relative errors of the solution and speedup of each graph.
+    """
+    p = dataset.parameter.astype(np.float32)
+    x = dataset.x.astype(np.float32)
+    calibration = slice(None, None, args.calibration_stride)
+
+    def report(model, inputs, calibration_inputs):
+        tflite_model = TFLiteModel(
+            quantize(model, calibration_inputs, activations), args.threads
+        )
+        return tflite_model, quantization_report(
+            model, tflite_model, inputs, batch_size=args.eval_batch_size
+        )
+
+    p_to_w = model_ori.model_p_to_w()
+    x_to_u_given_w = model_ori.model_x_to_u_given_w()
+    w = p_to_w.predict(p, batch_size=args.eval_batch_size, verbose=0)
+    u = x_to_u_given_w.predict([x, w], batch_size=args.eval_batch_size, verbose=0)
+
+    tflite_model, result = report(p_to_w, p, p[calibration])
+    u_quantized = x_to_u_given_w.predict(
+        [x, tflite_model.predict(p)], batch_size=args.eval_batch_size, verbose=0
+    )
+    yield "model_p_to_w", relative_errors(u, u_quantized, args.fields), result
+
+    tflite_model, result = report(
+        x_to_u_given_w, [x, w], [x[calibration], w[calibration]]
+    )
+    u_quantized = tflite_model.predict([x, w], batch_size=args.eval_batch_size)
+    yield "model_x_to_u_given_w", relative_errors(u, u_quantized, args.fields), result
+
+    u_quantized = np.zeros_like(u)
+    time_float, time_quantized = 0.0, 0.0
+    for param in np.unique(p, axis=0):
+        index = np.flatnonzero(np.all(p == param, axis=1))
+        tflite_model, result = report(
+            specialize_shape_net(model_ori, param), x[index], x[index[calibration]]
+        )
+        u_quantized[index] = tflite_model.predict(x[index])
+        time_float += result["time_float"]
+        time_quantized += result["time_quantized"]
+    result = {"speedup": time_float / time_quantized, "time_quantized": time_quantized}
+    yield "specialized shape net", relative_errors(u, u_quantized, args.fields), result
+
+    x_to_phi = model_ll.model_x_to_phi()
+    lr = model_ll.model_p_to_lr().predict(p, verbose=0)
+    bias = model_ll.last_bias_layer.last_layer_bias.numpy()
+    phi = x_to_phi.predict(x, batch_size=args.eval_batch_size, verbose=0)
+    tflite_model, result = report(x_to_phi, x, x[calibration])
+    u_ll = np.einsum("aoh,ah->ao", phi, lr) + bias
+    u_quantized = np.einsum("aoh,ah->ao", tflite_model.predict(x), lr) + bias
+    yield "model_x_to_phi", relative_errors(u_ll, u_quantized, args.fields), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--demo",
+        default="TravelingWave",
+        choices=["TravelingWave", "TravelingWaveHighFreq", "CylinderFlow"],
+    )
+    parser.add_argument("--epochs", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=1024)
+    parser.add_argument("--eval-batch-size", type=int, default=65536)
+    parser.add_argument("--calibration-stride", type=int, default=8)
+    parser.add_argument("--width", type=int, default=64)
+    parser.add_argument("--lr", type=float, default=1e-3)
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    dataset = getattr(demo, args.demo)()
+    args.fields = ["u{}".format(i) for i in range(dataset.n_o)]
+    model_ori = train(NIFMultiScale, "full", dataset, args)
+    model_ll = train(NIFMultiScaleLastLayerParameterized, "last_layer", dataset, args)
+
+    print(
+        "{:>22s} {:>12s} {:>8s} {:>16s} {:>16s} {:>8s} {:>10s}".format(
+            "graph",
+            "activations",
+            "field",
+            "rel. L2 error",
+            "rel. max error",
+            "speedup",
+            "vs tflite",
+        )
+    )
+    # the float32 TensorFlow Lite graphs come first, as the baseline of the others
+    time_tflite = {}
+    for activations in ["float32", None, "int16", "int8"]:
+        for name, errors, result in benchmark_graphs(
+            model_ori, model_ll, dataset, activations, args
+        ):
+            time_tflite.setdefault(name, result["time_quantized"])
+            for field in args.fields:
+                print(
+                    "{:>22s} {:>12s} {:>8s} {:16.4e} {:16.4e} {:8.2f} {:10.2f}".format(
+                        name,
+                        str(activations),
+                        field,
+                        errors["relative_l2_error"][field],
+                        errors["relative_max_error"][field],
+                        result["speedup"],
+                        time_tflite[name] / result["time_quantized"],
+                    )
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Peak memory and time of a training step with and without recomputation.
+
+For each shape net configuration, a NIFMultiScale is trained for one step on a
+batch of random points in a fresh process, with `cfg_shape_net["recompute"]` off
+and on. The peak resident memory of the process above the same run with a tiny
+batch, i.e., the memory of the step itself, and the time per step of a second
+run of a few steps are reported. On a GPU, the peak of its allocator is reported
+instead.
+
+Usage:
+    python benchmarks/recompute.py --width 64 --nlayers 1 2 3 --batch-size 2048
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+# trains a model for one step, then for `n_steps` timed steps, and prints the peak
+# memory in MB, from the GPU allocator or /proc, and the seconds per step
+WORKER = """
+import json
+import sys
+import time
+import numpy as np
+import tensorflow as tf
+from nif import NIFMultiScale
+cfg_shape_net, cfg_parameter_net, batch_size, n_steps = json.loads(sys.argv[1])
+model = NIFMultiScale(cfg_shape_net, cfg_parameter_net).build()
+model.compile(tf.keras.optimizers.Adam(1e-4), loss="mse")
+rng = np.random.default_rng(0)
+x = rng.uniform(size=(batch_size, 2)).astype(np.float32)
+y = rng.uniform(size=(batch_size, 1)).astype(np.float32)
+model.fit(x, y, batch_size=batch_size, epochs=1, verbose=0)
+if tf.config.list_physical_devices("GPU"):
+    memory = tf.config.experimental.get_memory_info("GPU:0")["peak"] / 2**20
+else:
+    with open("/proc/self/status") as status:
+        memory = [int(l.split()[1]) for l in status if l.startswith("VmHWM")][0] / 1024
+t0 = time.perf_counter()
+model.fit(np.tile(x, (n_steps, 1)), np.tile(y, (n_steps, 1)), batch_size=batch_size,
+          epochs=1, verbose=0)
+print(memory, (time.perf_counter() - t0) / n_steps)
+"""
+
+
+def run_worker(cfg_shape_net, cfg_parameter_net, batch_size, n_steps):
+    """
+    Returns the peak memory in MB and the seconds per step of a fresh process.
+    """
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            WORKER,
+            json.dumps([cfg_shape_net, cfg_parameter_net, batch_size, n_steps]),
+        ],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.split()
+    return float(output[-2]), float(output[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--width", type=int, default=64)
+    parser.add_argument("--nlayers", type=int, nargs="+", default=[1, 2, 3])
+    parser.add_argument("--batch-size", type=int, default=2048)
+    parser.add_argument("--n-steps", type=int, default=5)
+    args = parser.parse_args()
+
+    cfg_parameter_net = {
+        "use_resblock": False,
+        "input_dim": 1,
+        "latent_dim": 2,
+        "units": 30,
+        "nlayers": 2,
+        "activation": "swish",
+    }
+    print(
+        "{:>8s} {:>8s} {:>10s} {:>14s} {:>10s}".format(
+            "nlayers", "po_dim", "recompute", "step memory MB", "s/step"
+        )
+    )
+    for nlayers in args.nlayers:
+        cfg_shape_net = {
+            "connectivity": "full",
+            "input_dim": 1,
+            "output_dim": 1,
+            "units": args.width,
+            "nlayers": nlayers,
+            "weight_init_factor": 0.01,
+            "omega_0": 30.0,
+            "use_resblock": True,
+        }
+        # the memory of the process besides the step, e.g., TensorFlow and tracing
+        baseline, _ = run_worker(cfg_shape_net, cfg_parameter_net, 16, 1)
+        # the weights and biases of the first layer, the resblocks and the last layer
+        po_dim = 2 * nlayers * args.width * (args.width + 1) + 3 * args.width + 1
+        for recompute in [False, True]:
+            memory, time_per_step = run_worker(
+                dict(cfg_shape_net, recompute=recompute),
+                cfg_parameter_net,
+                args.batch_size,
+                args.n_steps,
+            )
+            print(
+                "{:>8d} {:>8d} {:>10s} {:14.0f} {:10.3f}".format(
+                    nlayers, po_dim, str(recompute), memory - baseline, time_per_step
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Benchmark the bias_add and the folded omega_0 of the SIREN layers.
+
+A stack of SIREN/SIREN_ResNet layers, shaped like a parameter net or the shape
+net of `NIFMultiScaleLastLayerParameterized`, is trained for a few steps with the
+layers, which compute `sin(x @ (omega_0 * w) + b)` with `tf.nn.bias_add`, and with
+two references evaluating the same layers, with the same variables, as
+`sin(omega_0 * (x @ w) + b)`, with a plain addition or with `tf.nn.bias_add`. The
+outputs are also compared.
+
+Usage:
+    python benchmarks/siren_kernels.py --batch-size 8192 --width 64 --nlayers 4
+"""
+import argparse
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from nif.layers import SIREN
+from nif.layers import SIREN_ResNet
+
+
+def build_stack(n_input, n_output, width, nlayers, omega_0, use_resblock):
+    tf.random.set_seed(0)
+    layers = [SIREN(n_input, width, "first", omega_0)]
+    for _ in range(nlayers):
+        if use_resblock:
+            layers.append(SIREN_ResNet(width, width, omega_0))
+        else:
+            layers.append(SIREN(width, width, "hidden", omega_0))
+    layers.append(SIREN(width, n_output, "bottleneck", omega_0))
+    return tf.keras.Sequential(layers)
+
+
+def reference_call(model, x, add):
+    """
+    Evaluates the stack with omega_0 scaling the matmul outputs, and the biases
+    added by `add`.
+    """
+    for layer_ in model.layers:
+        if isinstance(layer_, SIREN_ResNet):
+            h = tf.math.sin(add(layer_.omega_0 * tf.matmul(x, layer_.w), layer_.b))
+            x = 0.5 * (
+                x
+                + tf.math.sin(add(layer_.omega_0 * tf.matmul(h, layer_.w2), layer_.b2))
+            )
+        elif layer_.layer_position == "bottleneck":
+            x = add(tf.matmul(x, layer_.w), layer_.b)
+        else:
+            x = tf.math.sin(add(layer_.omega_0 * tf.matmul(x, layer_.w), layer_.b))
+    return x
+
+
+def time_train_step(model, call, x, y, repeat):
+    optimizer = tf.keras.optimizers.SGD(1e-6)
+
+    @tf.function
+    def train_step(x_, y_):
+        with tf.GradientTape() as tape:
+            loss = tf.reduce_mean(tf.square(call(x_) - y_))
+        gradients = tape.gradient(loss, model.trainable_variables)
+        optimizer.apply_gradients(zip(gradients, model.trainable_variables))
+        return loss
+
+    train_step(x, y)  # trace
+    best = np.inf
+    for _ in range(5):
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            loss = train_step(x, y)
+        loss.numpy()
+        best = min(best, (time.perf_counter() - t0) / repeat)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch-size", type=int, default=8192)
+    parser.add_argument("--n-input", type=int, default=2)
+    parser.add_argument("--n-output", type=int, default=64)
+    parser.add_argument("--width", type=int, default=64)
+    parser.add_argument("--nlayers", type=int, default=4)
+    parser.add_argument("--omega-0", type=float, default=30.0)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    x = tf.random.uniform([args.batch_size, args.n_input], -1.0, 1.0)
+    y = tf.random.normal([args.batch_size, args.n_output])
+    for use_resblock in [False, True]:
+        model = build_stack(
+            args.n_input,
+            args.n_output,
+            args.width,
+            args.nlayers,
+            args.omega_0,
+            use_resblock,
+        )
+        model(x)
+        references = {
+            "add": lambda x_: reference_call(model, x_, tf.add),
+            "bias_add": lambda x_: reference_call(model, x_, tf.nn.bias_add),
+        }
+        max_diff = max(np.abs(model(x) - call(x)).max() for call in references.values())
+        times = {
+            name: time_train_step(model, call, x, y, args.repeat)
+            for name, call in references.items()
+        }
+        times["folded"] = time_train_step(model, model, x, y, args.repeat)
+        print(
+            "resblock={}: add {:.3f} ms, bias_add {:.3f} ms, folded omega_0 {:.3f} ms, "
+            "speedup {:.2f}x over add, {:.2f}x over bias_add, max |diff| {:.2e}".format(
+                use_resblock,
+                1e3 * times["add"],
+                1e3 * times["bias_add"],
+                1e3 * times["folded"],
+                times["add"] / times["folded"],
+                times["bias_add"] / times["folded"],
+                max_diff,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
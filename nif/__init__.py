@@ -1,28 +1,110 @@
-import tensorflow as tf
-from tensorflow.keras import mixed_precision
+"""Neural Implicit Flow.
+
+The submodules and the models are imported on first access (PEP 562), so that
+`import nif` is cheap and, e.g., `from nif.inference import NumpyModel` does not
+import TensorFlow, while `nif.optimizers` alone pulls in TensorFlow Probability.
+GPUs are left as configured by TensorFlow; call `nif.configure_gpus()` to enable
+memory growth on all of them.
+
+Usage:
+    import nif
+
+    nif.configure_gpus()
+    model_ori = nif.NIFMultiScale(cfg_shape_net, cfg_parameter_net)
+"""
+import importlib
 
 from .__about__ import __version__
-from nif import data
-from nif import demo
-from nif import optimizers
-from nif.model import NIF
-from nif.model import NIFMultiScale
-from nif.model import NIFMultiScaleLastLayerParameterized
-
-gpus = tf.config.experimental.list_physical_devices("GPU")
-if len(gpus) > 0:
-    for gpu in gpus:
-        tf.config.experimental.set_memory_growth(gpu, True)
-    logical_gpus = tf.config.experimental.list_physical_devices("GPU")
-    print(len(gpus), "Physical GPUs,", len(logical_gpus), "Logical GPUs")
+
+_SUBMODULES = {
+    "data",
+    "demo",
+    "distillation",
+    "evaluation",
+    "inference",
+    "optimizers",
+    "pruning",
+    "quantization",
+}
+
+# attribute name -> (module, attribute or None for the module itself)
+_ATTRIBUTES = {
+    "tf": ("tensorflow", None),
+    "mixed_precision": ("tensorflow.keras", "mixed_precision"),
+    "NIF": ("nif.model", "NIF"),
+    "NIFModel": ("nif.model", "NIFModel"),
+    "NIFMultiScale": ("nif.model", "NIFMultiScale"),
+    "NIFMultiScaleDomainDecomposition": (
+        "nif.model",
+        "NIFMultiScaleDomainDecomposition",
+    ),
+    "NIFMultiScaleFiLM": ("nif.model", "NIFMultiScaleFiLM"),
+    "NIFMultiScaleLastLayerParameterized": (
+        "nif.model",
+        "NIFMultiScaleLastLayerParameterized",
+    ),
+}
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        value = importlib.import_module("." + name, __name__)
+    elif name in _ATTRIBUTES:
+        module_name, attribute = _ATTRIBUTES[name]
+        value = importlib.import_module(module_name)
+        if attribute is not None:
+            value = getattr(value, attribute)
+    else:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    # cache it, so that `__getattr__` is only called on the first access
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
+
+
+def configure_gpus(verbose=True):
+    """
+    Enables memory growth on all the physical GPUs, which must be done before they
+    are initialized, i.e., before any model is built.
+
+    Args:
+        verbose (bool, optional): Whether to print the number of physical and
+            logical GPUs. Defaults to True.
+
+    Returns:
+        list: The physical GPUs.
+    """
+    import tensorflow as tf
+
+    gpus = tf.config.experimental.list_physical_devices("GPU")
+    if len(gpus) > 0:
+        for gpu in gpus:
+            tf.config.experimental.set_memory_growth(gpu, True)
+        logical_gpus = tf.config.experimental.list_physical_devices("GPU")
+        if verbose:
+            print(len(gpus), "Physical GPUs,", len(logical_gpus), "Logical GPUs")
+    return gpus
+
 
 __all__ = [
     "data",
     "tf",
     "NIFMultiScale",
     "NIFMultiScaleLastLayerParameterized",
+    "NIFMultiScaleFiLM",
+    "NIFMultiScaleDomainDecomposition",
     "NIF",
+    "NIFModel",
     "mixed_precision",
     "optimizers",
+    "pruning",
+    "quantization",
     "demo",
+    "distillation",
+    "evaluation",
+    "inference",
+    "configure_gpus",
 ]
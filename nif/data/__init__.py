@@ -1,4 +1,11 @@
+from nif.data.curriculum import PointBudgetCurriculum
 from nif.data.point_wise_data import PointWiseData
 from nif.data.tfr_dataset import TFRDataset
+from nif.data.tfr_dataset import TFRIteratorState
 
-__all__ = ["PointWiseData", "TFRDataset"]
+__all__ = [
+    "PointWiseData",
+    "PointBudgetCurriculum",
+    "TFRDataset",
+    "TFRIteratorState",
+]
@@ -0,0 +1,119 @@
+import tensorflow as tf
+
+
+class PointBudgetCurriculum(object):
+    """A coarse-to-fine point-budget schedule for point-wise data.
+
+    At stage `s = epoch // epochs_per_stage`, the stratified columns (usually the
+    spatial coordinates) are binned into a uniform grid with
+    `initial_cells * growth_factor**s` cells per dimension and only one randomly
+    chosen point per occupied cell is kept. After `n_stages` stages every point
+    is used. Points with different values in `group_columns` (usually the
+    parameter, e.g., time) are stratified separately so every snapshot keeps a
+    spatially uniform subsample.
+
+    The sampling is done in-graph, so it can be applied inside a `tf.data`
+    pipeline, see `TFRDataset.get_tfr_shuffled_dataset` and
+    `PointWiseData.get_curriculum_dataset`.
+
+    Usage:
+        curriculum = PointBudgetCurriculum([1], [-1.0], [1.0], group_columns=[0])
+        make_dataset = pw_data.get_curriculum_dataset(curriculum, batch_size=512)
+        for epoch in range(100):
+            model.fit(make_dataset(epoch), initial_epoch=epoch, epochs=epoch + 1)
+
+    Args:
+        columns (list): Indices of the feature columns to stratify.
+        lower (list): Lower bounds of the stratified columns.
+        upper (list): Upper bounds of the stratified columns.
+        initial_cells (int): Number of cells per dimension at the first stage.
+            Defaults to 8.
+        growth_factor (float): Growth factor of the number of cells per dimension
+            from one stage to the next. Defaults to 2.0.
+        n_stages (int): Number of subsampled stages before switching to the full
+            data. Defaults to 4.
+        epochs_per_stage (int): Number of epochs in each stage. Defaults to 1.
+        group_columns (list, optional): Indices of the feature columns defining
+            separate groups. Defaults to None.
+        seed (int): Random seed for choosing the point in each cell. Defaults to 0.
+    """
+
+    def __init__(
+        self,
+        columns,
+        lower,
+        upper,
+        initial_cells=8,
+        growth_factor=2.0,
+        n_stages=4,
+        epochs_per_stage=1,
+        group_columns=None,
+        seed=0,
+    ):
+        self.columns = list(columns)
+        self.lower = tf.constant(lower, tf.float32)
+        self.upper = tf.constant(upper, tf.float32)
+        self.initial_cells = initial_cells
+        self.growth_factor = growth_factor
+        self.n_stages = n_stages
+        self.epochs_per_stage = epochs_per_stage
+        self.group_columns = list(group_columns) if group_columns else None
+        self.seed = seed
+
+    def cells_per_dim(self, epoch):
+        """Returns the number of cells per dimension at a given epoch.
+
+        Args:
+            epoch (int or tf.Tensor): The epoch index.
+
+        Returns:
+            tf.Tensor: The number of cells per dimension.
+        """
+        stage = tf.cast(epoch // self.epochs_per_stage, tf.float32)
+        return tf.cast(
+            tf.round(self.initial_cells * self.growth_factor**stage), tf.int64
+        )
+
+    def sample(self, features, epoch):
+        """Returns the mask of the points kept at a given epoch.
+
+        Args:
+            features (tf.Tensor): Point-wise features with shape (batch, n_feature).
+            epoch (int or tf.Tensor): The epoch index.
+
+        Returns:
+            tf.Tensor: A boolean mask with shape (batch,).
+        """
+        epoch = tf.cast(epoch, tf.int64)
+        n_points = tf.shape(features)[0]
+
+        def stratified_mask():
+            n_cells = self.cells_per_dim(epoch)
+            x = tf.gather(tf.cast(features, tf.float32), self.columns, axis=1)
+            x = (x - self.lower) / (self.upper - self.lower)
+            cell = tf.cast(tf.floor(x * tf.cast(n_cells, tf.float32)), tf.int64)
+            cell = tf.clip_by_value(cell, 0, n_cells - 1)
+
+            # linear index of the cell, plus the group of the point
+            key = tf.zeros_like(cell[:, 0])
+            for d in range(len(self.columns)):
+                key = key * n_cells + cell[:, d]
+            if self.group_columns is not None:
+                groups = tf.gather(features, self.group_columns, axis=1)
+                group_id = tf.raw_ops.UniqueV2(x=groups, axis=[0])[1]
+                key = key + tf.cast(group_id, tf.int64) * n_cells ** len(self.columns)
+            unique_key, segment = tf.unique(key)
+            n_segment = tf.shape(unique_key)[0]
+
+            # keep the point with the smallest random priority in each cell
+            priority = tf.random.stateless_uniform(
+                [n_points], seed=tf.stack([tf.constant(self.seed, tf.int64), epoch])
+            )
+            min_priority = tf.math.unsorted_segment_min(priority, segment, n_segment)
+            return tf.equal(priority, tf.gather(min_priority, segment))
+
+        return tf.cond(
+            epoch // self.epochs_per_stage < self.n_stages,
+            stratified_mask,
+            lambda: tf.ones([n_points], tf.bool),
+        )
@@ -1,4 +1,5 @@
 import numpy as np
+import tensorflow as tf
 
 
 class PointWiseData(object):
@@ -47,6 +48,59 @@ class PointWiseData(object):
         """Returns the output data."""
         return self.data[:, self.n_p + self.n_x : self.n_p + self.n_x + self.n_o]
 
+    def get_curriculum_dataset(self, curriculum, batch_size, shuffle=True, seed=None):
+        """Returns a factory of per-epoch datasets following a coarse-to-fine
+        point-budget schedule.
+
+        The number of points kept by `curriculum` changes between epochs, while
+        `model.fit` assumes that every epoch of a dataset of unknown size has as
+        many steps as the first one, so every epoch is a separate dataset, to be
+        passed to its own `model.fit(..., initial_epoch=epoch, epochs=epoch + 1)`.
+        The subsampling is done in-graph when the dataset is iterated.
+
+        Args:
+            curriculum (PointBudgetCurriculum): The point-budget schedule, whose
+                columns index into the features, i.e., parameter and state data.
+            batch_size (int): The batch size.
+            shuffle (bool): Whether to shuffle the kept points. Defaults to True.
+            seed (int, optional): Random seed for shuffling, combined with the
+                epoch so that every epoch is shuffled differently. Defaults to None.
+
+        Returns:
+            callable: A function mapping the epoch index to a `tf.data.Dataset`
+            yielding `(features, target)` or `(features, target, weight)` batches.
+        """
+        arrays = [
+            self.data[:, : self.n_p + self.n_x],
+            self.data[:, self.n_p + self.n_x : self.n_p + self.n_x + self.n_o],
+        ]
+        if self.sample_weight is not None:
+            arrays.append(self.sample_weight.reshape(-1, 1))
+
+        def epoch_dataset(epoch, arrays_):
+            index = tf.where(curriculum.sample(arrays_[0], epoch))[:, 0]
+            if shuffle and seed is None:
+                index = tf.random.shuffle(index)
+            elif shuffle:
+                priority = tf.random.stateless_uniform(
+                    tf.shape(index), seed=tf.stack([tf.constant(seed, tf.int64), epoch])
+                )
+                index = tf.gather(index, tf.argsort(priority))
+            kept = tuple(tf.gather(a, index) for a in arrays_)
+            return tf.data.Dataset.from_tensor_slices(kept)
+
+        def make_dataset(epoch):
+            # the arrays are an element of the pipeline rather than constants
+            # captured by `epoch_dataset`, so they keep their dtype and stay out of
+            # its graph
+            dataset = tf.data.Dataset.from_tensors(
+                (tf.constant(epoch, tf.int64), tuple(arrays))
+            )
+            dataset = dataset.flat_map(epoch_dataset)
+            return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+        return make_dataset
+
     @staticmethod
     def standard_normalize(raw_data, area_weighted=False):
         """Performs standard normalization on raw data.
@@ -114,13 +114,23 @@ class TFRDataset(object):
         )
         return batch_dataset
 
-    def get_tfr_meta_dataset(self, tfr_path, epoch, tfr_shuffle_buffer_size=1):
+    def get_tfr_meta_dataset(
+        self, tfr_path, epoch, tfr_shuffle_buffer_size=1, iterator_state=None
+    ):
         """Get a meta TensorFlow Dataset object from a folder of TFRecord files.
 
+        If `iterator_state` is given, the file order is shuffled with its seed and
+        the files that have already been handed out are skipped before any of them
+        is read, so a job restored from a checkpoint resumes where it stopped.
+        Iterate with `iterator_state.track(meta_dataset)` to keep the position
+        up to date.
+
         Args:
             tfr_path (str): The path to the folder containing the TFRecord files.
             epoch (int): The number of epochs to iterate through.
             tfr_shuffle_buffer_size (int): The shuffle buffer size.
+            iterator_state (TFRIteratorState, optional): The checkpointable state
+                of the iteration. Defaults to None.
 
         Returns:
             tf.data.Dataset: A TensorFlow Dataset object.
@@ -130,38 +140,223 @@ class TFRDataset(object):
         # I cannot use point wise data line by line for example.
         # because it will end up with an unacceptable create-file time.
 
-        filenames = tf.io.gfile.glob(f"{tfr_path}/*.tfrecord")
+        filenames = sorted(tf.io.gfile.glob(f"{tfr_path}/*.tfrecord"))
         self.num_pts_per_file = len(filenames)
 
-        def prepare_sample(example):
-            schema = {}
-            for j in range(self.n_feature):
-                schema["input_" + str(j)] = tf.io.FixedLenSequenceFeature(
-                    [], tf.float32, allow_missing=True
-                )
-            for j in range(self.n_target):
-                schema["output_" + str(j)] = tf.io.FixedLenSequenceFeature(
-                    [], tf.float32, allow_missing=True
-                )
-            if self.area_weight:
-                schema["weight"] = tf.io.FixedLenSequenceFeature(
-                    [], tf.float32, allow_missing=True
-                )
-            data_dict = tf.io.parse_single_example(example, schema)
-            return list(data_dict.values())
+        if iterator_state is not None:
+            seed = int(iterator_state.seed.numpy())
+            position = int(iterator_state.position.numpy())
+        else:
+            seed = None
+            position = 0
 
-        dataset = tf.data.TFRecordDataset(filenames)
-        dataset = dataset.map(prepare_sample, num_parallel_calls=self.AUTOTUNE)
+        # each tfrecord file holds a single example, so we shuffle and skip the
+        # file names before reading anything.
+        dataset = tf.data.Dataset.from_tensor_slices(filenames)
         if tfr_shuffle_buffer_size > 1:
-            dataset = dataset.shuffle(buffer_size=tfr_shuffle_buffer_size)
+            dataset = dataset.shuffle(buffer_size=tfr_shuffle_buffer_size, seed=seed)
         # dataset = dataset.shuffle(buffer_size=len(filenames))
         dataset = dataset.repeat(epoch)
+        dataset = dataset.skip(position)
+        dataset = dataset.flat_map(tf.data.TFRecordDataset)
+        dataset = dataset.map(self._parse_example, num_parallel_calls=self.AUTOTUNE)
         dataset = dataset.batch(
             1
         )  # each time only take on tfrecord out. then we will do sub-batching inside.
         dataset = dataset.prefetch(self.AUTOTUNE)
         return dataset
 
+    def get_tfr_shuffled_dataset(
+        self,
+        tfr_path,
+        batch_size,
+        epoch,
+        cycle_length=4,
+        shuffle_buffer_size=100000,
+        seed=None,
+        curriculum=None,
+    ):
+        """Get a point-wise TensorFlow Dataset with a two-level shuffle over TFRecord files.
+
+        The order of the TFRecord files is reshuffled at every epoch, `cycle_length`
+        files are read concurrently and their points are interleaved, and the
+        interleaved points are mixed again in a bounded row-level shuffle buffer.
+        This gives a near-global shuffle without rewriting the TFRecord files
+        between epochs. Unlike `get_tfr_meta_dataset`, the returned dataset is
+        already batched point-wise and can be fed to `model.fit` directly.
+
+        Args:
+            tfr_path (str): The path to the folder containing the TFRecord files.
+            batch_size (int): The batch size.
+            epoch (int): The number of epochs to iterate through.
+            cycle_length (int): The number of TFRecord files read concurrently.
+                Defaults to 4.
+            shuffle_buffer_size (int): The number of points in the row-level
+                shuffle buffer. Defaults to 100000.
+            seed (int, optional): Random seed for both the file-level and the
+                row-level shuffle. Defaults to None.
+            curriculum (PointBudgetCurriculum, optional): A point-budget schedule
+                subsampling the points of each file in-graph, depending on the
+                epoch. The epoch is the index of the repetition within the
+                returned dataset, which covers all `epoch` epochs, so it must be
+                passed to `model.fit` with `epochs=1`. Defaults to None.
+
+        Returns:
+            tf.data.Dataset: A TensorFlow Dataset object yielding `(features, target)`
+            or `(features, target, weight)` batches.
+
+        """
+        filenames = sorted(tf.io.gfile.glob(f"{tfr_path}/*.tfrecord"))
+        self.num_pts_per_file = len(filenames)
+
+        # 1. file-level shuffle, reshuffled at every epoch
+        dataset = tf.data.Dataset.from_tensor_slices(filenames)
+        dataset = dataset.shuffle(
+            len(filenames), seed=seed, reshuffle_each_iteration=True
+        )
+        dataset = dataset.repeat(epoch)
+        # attach the epoch index to each file for the curriculum
+        n_files = len(filenames)
+        dataset = dataset.enumerate().map(lambda i, f: (f, i // n_files))
+
+        # 2. read several files concurrently and interleave their points
+        dataset = dataset.interleave(
+            lambda f, e: self._gen_point_dataset_from_file(f, e, curriculum),
+            cycle_length=min(cycle_length, len(filenames)),
+            block_length=1,
+            num_parallel_calls=self.AUTOTUNE,
+            deterministic=seed is not None,
+        )
+
+        # 3. row-level shuffle with a bounded buffer
+        dataset = dataset.shuffle(shuffle_buffer_size, seed=seed)
+        dataset = dataset.batch(batch_size).prefetch(self.AUTOTUNE)
+        return dataset
+
+    def _gen_point_dataset_from_file(self, filename, epoch=0, curriculum=None):
+        """Generate a point-wise TensorFlow Dataset from a single TFRecord file.
+
+        Every file holds all its points in a single example, so the curriculum
+        mask is applied after the whole file is read and parsed: subsampling
+        saves the shuffling, batching and training on the dropped points, not
+        the I/O and the parsing of the file.
+
+        Args:
+            filename (tf.Tensor): The path to the TFRecord file.
+            epoch (tf.Tensor): The epoch index. Defaults to 0.
+            curriculum (PointBudgetCurriculum, optional): A point-budget schedule.
+                Defaults to None.
+
+        Returns:
+            tf.data.Dataset: A TensorFlow Dataset object yielding single points.
+
+        """
+
+        def subsample(*columns):
+            arrays = self._stack_columns(columns)
+            if curriculum is not None:
+                mask = curriculum.sample(arrays[0], epoch)
+                arrays = tuple(tf.boolean_mask(a, mask) for a in arrays)
+            return arrays
+
+        dataset = tf.data.TFRecordDataset(filename)
+        dataset = dataset.map(self._parse_example).map(subsample)
+        return dataset.flat_map(lambda *x: tf.data.Dataset.from_tensor_slices(x))
+
+    def _stack_columns(self, columns):
+        """Stack the per-column tensors of a parsed TFRecord file into point-wise arrays.
+
+        Args:
+            columns (list): The parsed columns, each of which is a 1D tensor.
+
+        Returns:
+            tuple: `(features, target)` or `(features, target, weight)`.
+
+        """
+        features = tf.stack(columns[: self.n_feature], -1)
+        target = tf.stack(columns[self.n_feature : self.n_feature + self.n_target], -1)
+        if self.area_weight:
+            weight = tf.reshape(columns[-1], (-1, 1))
+            return features, target, weight
+        return features, target
+
+    def _parse_example(self, example):
+        """Parse a serialized TFRecord example into a list of columns.
+
+        Args:
+            example (tf.Tensor): A serialized `tf.train.Example`.
+
+        Returns:
+            list: A list of 1D tensors, one for each feature, target and weight.
+
+        """
+        schema = {}
+        for j in range(self.n_feature):
+            schema["input_" + str(j)] = tf.io.FixedLenSequenceFeature(
+                [], tf.float32, allow_missing=True
+            )
+        for j in range(self.n_target):
+            schema["output_" + str(j)] = tf.io.FixedLenSequenceFeature(
+                [], tf.float32, allow_missing=True
+            )
+        if self.area_weight:
+            schema["weight"] = tf.io.FixedLenSequenceFeature(
+                [], tf.float32, allow_missing=True
+            )
+        data_dict = tf.io.parse_single_example(example, schema)
+        return list(data_dict.values())
+
+
+class TFRIteratorState(tf.Module):
+    """Checkpointable position of an iteration over a meta TFRecord dataset.
+
+    The state only holds the shuffle seed and the number of TFRecord files that
+    have been handed out, so it is cheap to save with `tf.train.Checkpoint`
+    alongside the model and the optimizer.
+
+    Usage:
+    state = TFRIteratorState(seed=42)
+    ckpt = tf.train.Checkpoint(model=model, optimizer=optimizer, data=state)
+    ckpt.restore(tf.train.latest_checkpoint(ckpt_dir))
+    meta_dataset = fh.get_tfr_meta_dataset(tfr_path, epoch, 16, iterator_state=state)
+    for batch_file in state.track(meta_dataset):
+        model.fit(fh.gen_dataset_from_batch_file(batch_file, batch_size))
+        ckpt.save(ckpt_dir + "/ckpt")
+
+    Args:
+        seed (int, optional): Random seed for the file-level shuffle. A random
+            seed is drawn if None. Defaults to None.
+        name (str, optional): Name of the module. Defaults to None.
+    """
+
+    def __init__(self, seed=None, name=None):
+        super(TFRIteratorState, self).__init__(name=name)
+        if seed is None:
+            seed = np.random.randint(np.iinfo(np.int32).max)
+        self.seed = tf.Variable(seed, dtype=tf.int64, trainable=False, name="seed")
+        self.position = tf.Variable(0, dtype=tf.int64, trainable=False, name="position")
+
+    def track(self, meta_dataset):
+        """Iterate over a meta dataset while advancing the position.
+
+        The position is advanced when a file is handed out, so a checkpoint saved
+        after training on that file resumes from the next one.
+
+        Args:
+            meta_dataset (tf.data.Dataset): A dataset from `get_tfr_meta_dataset`
+                created with this state.
+
+        Yields:
+            The elements of `meta_dataset`.
+        """
+        for batch_file in meta_dataset:
+            self.position.assign_add(1)
+            yield batch_file
+
+    def reset(self):
+        """Reset the position to the beginning of the iteration."""
+        self.position.assign(0)
+
 
 def mkdir(directory):
     """Create a directory if it does not exist.
@@ -0,0 +1,201 @@
+"""Knowledge distillation of a trained NIF into a smaller one.
+
+The student is trained to reproduce the teacher, rather than the data, on
+(parameter, point) pairs drawn on the fly from the input box, so there is no
+stored dataset and the student sees fresh samples all along. A pool of uniform
+candidates is evaluated by the teacher, and the batches of the next steps are
+drawn from it with a probability growing with the norm of the Jacobian of the
+teacher output with respect to its input, so the sharp features, e.g., fronts and
+boundary layers, get most of the samples. A fraction of the probability stays
+uniform to keep covering the whole box. The Jacobian is estimated by a finite
+difference of the teacher along a random diagonal of the box, which only costs a
+forward pass, whereas backpropagating to the input through the parameter net is
+an order of magnitude slower, and the pool is renewed every `pool_factor` steps,
+so the teacher evaluates about two points per sample.
+
+The training stops once the relative L2 error between the student and the teacher,
+estimated on fresh uniform samples, is below the tolerance. The teacher is thus
+reproduced over the whole box, not only at its training points: a teacher that
+oscillates between them, e.g., a SIREN with a large `omega_0` trained on a coarse
+grid, is hard to distill into a smaller network, and `distill` warns when the
+tolerance is not reached within `max_steps`.
+
+Usage:
+student = NIFMultiScale(cfg_shape_net_small, cfg_parameter_net_small)
+history = distill(teacher, student, lower=x.min(0), upper=x.max(0), tolerance=1e-2)
+student.model().predict(x)
+"""
+
+__all__ = ["distill"]
+
+import warnings
+
+import numpy as np
+import tensorflow as tf
+
+
+def distill(
+    teacher,
+    student,
+    lower,
+    upper,
+    tolerance=1e-2,
+    optimizer=None,
+    batch_size=1024,
+    pool_factor=8,
+    uniform_fraction=0.25,
+    difference_step=1e-3,
+    max_steps=100000,
+    eval_every=500,
+    eval_size=65536,
+    verbose=1,
+):
+    """
+    Trains a student NIF to reproduce a teacher NIF until a given accuracy.
+
+    Args:
+        teacher (NIF): The trained model, any subclass of `NIF` with `model()`.
+        student (NIF): The model to train, e.g., a `NIFMultiScale` with fewer units.
+            It is built with `build()`, so its regularizations apply.
+        lower (array-like): Lower bound of the inputs, i.e., the parameters followed
+            by the shape net input, with shape (pi_dim + si_dim,).
+        upper (array-like): Upper bound of the inputs, with shape (pi_dim + si_dim,).
+        tolerance (float, optional): The training stops once the relative L2 error
+            of the student with respect to the teacher is below it. Defaults to 1e-2.
+        optimizer (tf.keras.optimizers.Optimizer, optional): Optimizer of the
+            student. Defaults to None, i.e., Adam with a learning rate of 1e-3.
+        batch_size (int, optional): Number of samples per step, which is also the
+            number of points per evaluation of the teacher. Defaults to 1024.
+        pool_factor (int, optional): Number of candidates of a pool per sample of a
+            batch, which is also the number of steps drawing from a pool. Defaults
+            to 8.
+        uniform_fraction (float, optional): Part of the sampling probability that
+            is uniform over the candidates, the rest being proportional to the norm
+            of the Jacobian of the teacher. Defaults to 0.25.
+        difference_step (float, optional): Step of the finite difference of the
+            teacher estimating the Jacobian, as a fraction of `upper - lower`.
+            Defaults to 1e-3.
+        max_steps (int, optional): Maximum number of steps. Defaults to 100000.
+        eval_every (int, optional): Number of steps between two estimations of the
+            error. Defaults to 500.
+        eval_size (int, optional): Number of uniform samples of each estimation of
+            the error. Defaults to 65536.
+        verbose (int, optional): Whether to print the error of each estimation.
+            Defaults to 1.
+
+    Returns:
+        dict: The `"step"`, `"loss"` and `"relative_error"` of each estimation, and
+        whether the tolerance was reached as `"converged"`. A warning is emitted if
+        it was not within `max_steps`.
+    """
+    dtype = teacher.variable_Dtype
+    lower = tf.constant(np.asarray(lower), dtype)
+    upper = tf.constant(np.asarray(upper), dtype)
+    input_dim = teacher.pi_dim + teacher.si_dim
+    if lower.shape != (input_dim,) or upper.shape != (input_dim,):
+        raise ValueError("`lower` and `upper` should have shape (pi_dim + si_dim,)")
+    if max_steps < 1 or eval_every < 1:
+        raise ValueError("`max_steps` and `eval_every` should be at least 1")
+    pool_size = batch_size * pool_factor
+
+    teacher_model = teacher.model()
+    student_model = student.build()
+    student_model.compile(
+        optimizer or tf.keras.optimizers.Adam(1e-3), loss="mean_squared_error"
+    )
+
+    def uniform(n):
+        return lower + (upper - lower) * tf.random.uniform([n, input_dim], dtype=dtype)
+
+    def teacher_in_batches(features):
+        # the teacher generates its shape net weights per point, so it is evaluated
+        # one batch at a time to bound the memory
+        u = tf.map_fn(
+            lambda x: tf.cast(teacher_model(x), dtype),
+            tf.reshape(features, [-1, batch_size, input_dim]),
+            parallel_iterations=1,
+        )
+        return tf.reshape(u, [-1, teacher.so_dim])
+
+    @tf.function
+    def draw_pool():
+        pool = uniform(pool_size)
+        # the teacher at the candidates and at the candidates moved by a small step
+        # along a random diagonal of the box, whose squared difference estimates the
+        # squared norm of the Jacobian without bias
+        direction = (
+            2.0 * tf.cast(tf.random.uniform([pool_size, input_dim]) < 0.5, dtype) - 1.0
+        )
+        shift = difference_step * (upper - lower) * direction
+        u_all = teacher_in_batches(tf.concat([pool, pool + shift], 0))
+        u_pool = u_all[:pool_size]
+        score = tf.norm(u_all[pool_size:] - u_pool, axis=1)
+        probability = uniform_fraction / pool_size + (1.0 - uniform_fraction) * (
+            score / (tf.reduce_sum(score) + np.finfo(np.float32).tiny)
+        )
+        return pool, u_pool, tf.math.log(probability)[tf.newaxis]
+
+    @tf.function
+    def train_step(pool, u_pool, log_probability):
+        index = tf.random.categorical(log_probability, batch_size)[0]
+        features = tf.gather(pool, index)
+        target = tf.gather(u_pool, index)
+        return student_model.train_step((features, target))["loss"]
+
+    @tf.function
+    def train_step_uniform():
+        features = uniform(batch_size)
+        target = tf.cast(teacher_model(features), dtype)
+        return student_model.train_step((features, target))["loss"]
+
+    @tf.function(reduce_retracing=True)
+    def squared_errors(features):
+        u_teacher = tf.cast(teacher_model(features), dtype)
+        u_student = tf.cast(student_model(features), dtype)
+        return (
+            tf.reduce_sum(tf.square(u_student - u_teacher)),
+            tf.reduce_sum(tf.square(u_teacher)),
+        )
+
+    def relative_error():
+        error, norm = 0.0, 0.0
+        for start in range(0, eval_size, batch_size):
+            error_chunk, norm_chunk = squared_errors(
+                uniform(min(batch_size, eval_size - start))
+            )
+            error += float(error_chunk)
+            norm += float(norm_chunk)
+        return np.sqrt(error / max(norm, np.finfo(np.float32).tiny))
+
+    history = {"step": [], "loss": [], "relative_error": [], "converged": False}
+    step = 0
+    while step < max_steps:
+        for _ in range(min(eval_every, max_steps - step)):
+            if uniform_fraction >= 1.0:
+                loss = train_step_uniform()
+            else:
+                # each pool of candidates serves `pool_factor` steps
+                if step % pool_factor == 0:
+                    candidates = draw_pool()
+                loss = train_step(*candidates)
+            step += 1
+        history["step"].append(step)
+        history["loss"].append(float(loss))
+        history["relative_error"].append(relative_error())
+        if verbose:
+            print(
+                "step {}: loss {:.4e}, relative error {:.4e}".format(
+                    step, history["loss"][-1], history["relative_error"][-1]
+                )
+            )
+        if history["relative_error"][-1] <= tolerance:
+            history["converged"] = True
+            break
+    if not history["converged"]:
+        warnings.warn(
+            "distillation stopped after {} steps with a relative error of {:.3e}, "
+            "above the tolerance {:.3e}".format(
+                step, history["relative_error"][-1], tolerance
+            )
+        )
+    return history
@@ -0,0 +1,177 @@
+"""Streaming evaluation of per-snapshot error metrics.
+
+The evaluator streams point-wise batches, e.g., from
+`TFRDataset.get_tfr_shuffled_dataset` or from a fixed-mesh `tf.data.Dataset`,
+through a model and accumulates area-weighted errors for every snapshot with
+segment reductions. Predictions are never retained, so memory only depends on
+the number of snapshots, not on the size of the dataset.
+"""
+
+__all__ = ["SnapshotErrorEvaluator"]
+
+import numpy as np
+import tensorflow as tf
+
+
+class SnapshotErrorEvaluator(object):
+    """Accumulates area-weighted MSE and relative L2 error per snapshot.
+
+    A snapshot is identified by its parameter value, i.e., the first `n_para`
+    columns of the features. Each point is assigned to the nearest entry of
+    `snapshot_parameters`.
+
+    Usage:
+    evaluator = SnapshotErrorEvaluator(model, snapshot_parameters, n_target=2)
+    dataset = fh.get_tfr_shuffled_dataset(tfr_path, 2**16, 1, shuffle_buffer_size=1)
+    table = evaluator.evaluate(dataset)
+
+    Args:
+        model (tf.keras.Model): The model mapping features to targets.
+        snapshot_parameters (numpy.ndarray): Parameter values of the snapshots with
+            shape (number of snapshots, number of parameters).
+        n_target (int): The number of targets.
+    """
+
+    def __init__(self, model, snapshot_parameters, n_target):
+        self.model = model
+        snapshot_parameters = np.asarray(snapshot_parameters, dtype=np.float32)
+        if snapshot_parameters.ndim == 1:
+            snapshot_parameters = snapshot_parameters.reshape(-1, 1)
+        self.snapshot_parameters = snapshot_parameters
+        self.n_snapshot, self.n_para = snapshot_parameters.shape
+        self.n_target = n_target
+
+        if self.n_para == 1:
+            # 1-D parameters: the nearest snapshot is found exactly by a binary search
+            # among the midpoints between the sorted snapshots
+            order = np.argsort(snapshot_parameters[:, 0], kind="stable")
+            sorted_parameters = snapshot_parameters[order, 0]
+            self._order = tf.constant(order, tf.int32)
+            self._midpoints = tf.constant(
+                0.5 * (sorted_parameters[1:] + sorted_parameters[:-1])
+            )
+        else:
+            # centered so that the expansion of the squared distance in
+            # `_snapshot_index` does not cancel catastrophically in float32
+            self._center = tf.constant(snapshot_parameters.mean(0))
+            snapshots = snapshot_parameters - snapshot_parameters.mean(0)
+            self._snapshots = tf.constant(snapshots)
+            self._snapshots_sq_norm = tf.constant(np.sum(snapshots**2, axis=1))
+        # accumulate in double precision to stay accurate over billions of points
+        self.n_points = tf.Variable(
+            tf.zeros([self.n_snapshot], tf.float64), trainable=False
+        )
+        self.sum_weight = tf.Variable(
+            tf.zeros([self.n_snapshot], tf.float64), trainable=False
+        )
+        self.sum_weighted_sq_error = tf.Variable(
+            tf.zeros([self.n_snapshot, n_target], tf.float64), trainable=False
+        )
+        self.sum_weighted_sq_target = tf.Variable(
+            tf.zeros([self.n_snapshot, n_target], tf.float64), trainable=False
+        )
+
+    def reset(self):
+        """Reset all accumulators to zero."""
+        for v in [
+            self.n_points,
+            self.sum_weight,
+            self.sum_weighted_sq_error,
+            self.sum_weighted_sq_target,
+        ]:
+            v.assign(tf.zeros_like(v))
+
+    def _snapshot_index(self, parameter):
+        """Assign each point to the nearest snapshot.
+
+        Args:
+            parameter (tf.Tensor): Parameter columns with shape (batch, n_para).
+
+        Returns:
+            tf.Tensor: Snapshot indices with shape (batch,).
+        """
+        if self.n_para == 1:
+            sorted_index = tf.searchsorted(
+                self._midpoints, parameter[:, 0], out_type=tf.int32
+            )
+            return tf.gather(self._order, sorted_index)
+        # |p - s|^2 = |p|^2 - 2 p.s + |s|^2, where |p|^2 does not change the argmin,
+        # so no (batch, n_snapshot, n_para) tensor is formed
+        parameter = parameter - self._center
+        dist = self._snapshots_sq_norm - 2.0 * tf.matmul(
+            parameter, self._snapshots, transpose_b=True
+        )
+        return tf.argmin(dist, axis=-1, output_type=tf.int32)
+
+    @tf.function
+    def update(self, features, target, weight=None):
+        """Accumulate the errors of one batch.
+
+        Args:
+            features (tf.Tensor): Input features with shape (batch, n_feature).
+            target (tf.Tensor): Targets with shape (batch, n_target).
+            weight (tf.Tensor, optional): Area weights with shape (batch, 1).
+                Defaults to None, i.e., uniform weights.
+        """
+        features = tf.cast(features, tf.float32)
+        target = tf.cast(target, tf.float32)
+        pred = tf.cast(self.model(features, training=False), tf.float32)
+        if weight is None:
+            weight = tf.ones_like(target[:, :1])
+        weight = tf.reshape(tf.cast(weight, tf.float32), [-1, 1])
+
+        index = self._snapshot_index(features[:, : self.n_para])
+
+        def segment_sum(x):
+            return tf.cast(
+                tf.math.unsorted_segment_sum(x, index, self.n_snapshot), tf.float64
+            )
+
+        self.n_points.assign_add(segment_sum(tf.ones_like(weight[:, 0])))
+        self.sum_weight.assign_add(segment_sum(weight[:, 0]))
+        self.sum_weighted_sq_error.assign_add(
+            segment_sum(weight * tf.square(pred - target))
+        )
+        self.sum_weighted_sq_target.assign_add(segment_sum(weight * tf.square(target)))
+
+    def evaluate(self, dataset, reset=True):
+        """Stream a dataset through the model and return the per-snapshot table.
+
+        Args:
+            dataset (tf.data.Dataset): A dataset yielding `(features, target)` or
+                `(features, target, weight)` batches.
+            reset (bool, optional): Whether to reset the accumulators first.
+                Defaults to True.
+
+        Returns:
+            dict: The per-snapshot error table, see `result`.
+        """
+        if reset:
+            self.reset()
+        for batch in dataset:
+            self.update(*batch)
+        return self.result()
+
+    def result(self):
+        """Returns the per-snapshot error table.
+
+        Returns:
+            dict: A dictionary of numpy arrays with keys `parameter`
+            (n_snapshot, n_para), `n_points` (n_snapshot,), `area` (n_snapshot,),
+            `mse` (n_snapshot, n_target) and `relative_l2` (n_snapshot, n_target).
+            Snapshots without any point are filled with NaN.
+        """
+        n_points = self.n_points.numpy()
+        sum_weight = self.sum_weight.numpy()
+        sum_sq_error = self.sum_weighted_sq_error.numpy()
+        sum_sq_target = self.sum_weighted_sq_target.numpy()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mse = sum_sq_error / sum_weight[:, np.newaxis]
+            relative_l2 = np.sqrt(sum_sq_error / sum_sq_target)
+        return {
+            "parameter": self.snapshot_parameters,
+            "n_points": n_points.astype(np.int64),
+            "area": sum_weight,
+            "mse": mse,
+            "relative_l2": relative_l2,
+        }
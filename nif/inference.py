@@ -0,0 +1,556 @@
+"""TensorFlow-free inference of trained NIF models with NumPy.
+
+`export_numpy` writes the weights of the parameter net and of the shape net of a
+trained model, with the layout of their layers, to a single `.npz` file.
+`NumpyModel` loads and evaluates it with NumPy only, so a worker that only
+evaluates trained models neither imports TensorFlow nor builds a Keras model.
+
+The points are evaluated by batches on a thread pool, NumPy releasing the GIL in
+its matmuls and ufuncs. With a full connectivity, the parameter net is evaluated
+once per unique parameter value, and the points sharing it, e.g., a snapshot, go
+through a plain network with the generated weights rather than a matmul with
+per-point weights.
+
+`NIF`, `NIFMultiScale` and `NIFMultiScaleLastLayerParameterized` are supported,
+including low-rank shape net weights, their shared base matrices and the
+hash-grid input encoding. The computation is in the variable dtype of the model.
+
+Usage:
+export_numpy(model_ori, "model.npz")
+
+# in a worker, without TensorFlow
+model = NumpyModel("model.npz")
+u = model.predict(np.hstack([parameter, x]))
+"""
+
+__all__ = ["export_numpy", "NumpyModel"]
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+_FORMAT_VERSION = 1
+
+# below this mean number of points per parameter value, the shape net is evaluated
+# with per-point weights instead of once per parameter value
+_MIN_GROUP_SIZE = 32
+
+
+def _sigmoid(x):
+    return 0.5 * (1.0 + np.tanh(0.5 * x))
+
+
+def _selu(x):
+    alpha = 1.6732632423543772
+    scale = 1.0507009873554805
+    return scale * np.where(x > 0, x, alpha * np.expm1(np.minimum(x, 0)))
+
+
+_ACTIVATIONS = {
+    "linear": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0),
+    "tanh": np.tanh,
+    "sigmoid": _sigmoid,
+    "swish": lambda x: x * _sigmoid(x),
+    "elu": lambda x: np.where(x > 0, x, np.expm1(np.minimum(x, 0))),
+    "selu": _selu,
+    "softplus": lambda x: np.logaddexp(0, x),
+    "softsign": lambda x: x / (1 + np.abs(x)),
+}
+
+
+def export_numpy(model_ori, filename):
+    """
+    Writes the weights and the layout of a trained model to a `.npz` file, to be
+    evaluated by `NumpyModel`.
+
+    Args:
+        model_ori (NIF, NIFMultiScale or NIFMultiScaleLastLayerParameterized): The
+            trained model. `NIFMultiScale` needs the connectivity 'full'.
+        filename (str): Path of the `.npz` file.
+    """
+    # the classes are matched by name, so this module does not import TensorFlow
+    model_name = type(model_ori).__name__
+    cfg_shape_net = model_ori.cfg_shape_net
+    arrays = {}
+    layout = {
+        "format_version": _FORMAT_VERSION,
+        "model": model_name,
+        "dtype": model_ori.variable_Dtype,
+        "pi_dim": model_ori.pi_dim,
+        "si_dim": model_ori.si_dim,
+        "so_dim": model_ori.so_dim,
+        "parameter_net": _export_layers(model_ori.pnet_list, "parameter_net", arrays),
+        "encoding": _export_encoding(model_ori.encoding, arrays),
+    }
+
+    if model_name == "NIFMultiScaleLastLayerParameterized":
+        layout["shape_net"] = {
+            "connectivity": "last_layer",
+            "latent_dim": model_ori.pi_hidden,
+            "layers": _export_layers(model_ori.snet_list, "shape_net", arrays),
+        }
+        arrays["shape_net/bias"] = model_ori.last_bias_layer.last_layer_bias.numpy()
+    elif model_name in ("NIF", "NIFMultiScale"):
+        multiscale = model_name == "NIFMultiScale"
+        if multiscale and cfg_shape_net["connectivity"] != "full":
+            raise NotImplementedError("NIFMultiScale needs the connectivity 'full'")
+        resblock = multiscale and cfg_shape_net["use_resblock"]
+        layout["shape_net"] = {
+            "connectivity": "full",
+            "multiscale": multiscale,
+            "resblock": resblock,
+            "activation": None if multiscale else cfg_shape_net["activation"],
+            "omega_0": float(cfg_shape_net["omega_0"]) if multiscale else None,
+            "input_dim": model_ori.se_dim,
+            "units": model_ori.n_sx,
+            "nlayers": model_ori.l_sx,
+            "rank": model_ori.s_rank,
+        }
+        if not multiscale:
+            _check_activation(cfg_shape_net["activation"])
+        if model_ori.snet_base_list is not None:
+            base_list = model_ori.snet_base_list
+            if resblock:
+                base_list = [base for pair in base_list for base in pair]
+            for k, base in enumerate(base_list):
+                arrays["shape_net/base/{}".format(k)] = base.kernel.numpy()
+    else:
+        raise NotImplementedError(
+            "{} is not supported, only NIF, NIFMultiScale and "
+            "NIFMultiScaleLastLayerParameterized".format(model_name)
+        )
+
+    np.savez(filename, layout=np.array(json.dumps(layout)), **arrays)
+
+
+class NumpyModel(object):
+    """
+    Evaluates a model exported by `export_numpy` with NumPy only.
+
+    Each thread runs its own matmuls, so the BLAS library is best limited to one
+    thread, e.g., with `OMP_NUM_THREADS=1`, when `num_threads` is above one.
+
+    Args:
+        filename (str): Path of the `.npz` file written by `export_numpy`.
+        num_threads (int, optional): Number of threads evaluating the batches.
+            Defaults to None, i.e., the number of CPUs.
+
+    Attributes:
+        layout (dict): The layout of the layers written by `export_numpy`.
+        weights (dict): The arrays of the layers by name.
+    """
+
+    def __init__(self, filename, num_threads=None):
+        with np.load(filename, allow_pickle=False) as bundle:
+            self.layout = json.loads(str(bundle["layout"]))
+            self.weights = {
+                name: bundle[name] for name in bundle.files if name != "layout"
+            }
+        if self.layout["format_version"] != _FORMAT_VERSION:
+            raise ValueError(
+                "unsupported format version {}".format(self.layout["format_version"])
+            )
+        self.dtype = np.dtype(self.layout["dtype"])
+        self.num_threads = num_threads or os.cpu_count() or 1
+        self._fold_omega_0()
+
+    def predict(self, inputs, batch_size=4096):
+        """
+        Evaluates the model.
+
+        Args:
+            inputs (numpy.ndarray): The parameters followed by the shape net input,
+                with shape (n_points, pi_dim + si_dim), as for `model_ori.model()`.
+            batch_size (int, optional): Maximal number of points per batch.
+                Defaults to 4096.
+
+        Returns:
+            numpy.ndarray: The output with shape (n_points, so_dim).
+        """
+        pi_dim = self.layout["pi_dim"]
+        inputs = np.asarray(inputs, self.dtype)
+        param, inverse = np.unique(inputs[:, :pi_dim], axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        pnet_output = self._call_layers(param, self.layout["parameter_net"])
+        x = inputs[:, pi_dim:]
+        output = np.empty((inputs.shape[0], self.layout["so_dim"]), self.dtype)
+
+        def chunks(index):
+            for start in range(0, index.shape[0], batch_size):
+                yield index[start : start + batch_size]
+
+        if self.layout["shape_net"]["connectivity"] == "last_layer":
+
+            def evaluate(index):
+                output[index] = self._last_layer_shape_net(
+                    x[index], pnet_output[inverse[index]]
+                )
+
+            tasks = list(chunks(np.arange(inputs.shape[0])))
+        elif inputs.shape[0] >= _MIN_GROUP_SIZE * param.shape[0]:
+
+            def evaluate(task):
+                index, j = task
+                weights = self._distribute(pnet_output[j : j + 1])
+                u = self._full_shape_net(self._encode(x[index])[np.newaxis], weights)
+                output[index] = u[0]
+
+            # the points sorted by parameter value, and split into batches
+            order = np.argsort(inverse, kind="stable")
+            bounds = np.cumsum(np.bincount(inverse, minlength=param.shape[0]))
+            tasks = [
+                (index, j)
+                for j, group in enumerate(np.split(order, bounds[:-1]))
+                for index in chunks(group)
+            ]
+        else:
+
+            def evaluate(index):
+                weights = self._distribute(pnet_output[inverse[index]])
+                u = self._full_shape_net(self._encode(x[index])[:, np.newaxis], weights)
+                output[index] = u[:, 0]
+
+            tasks = list(chunks(np.arange(inputs.shape[0])))
+
+        if self.num_threads == 1 or len(tasks) == 1:
+            for task in tasks:
+                evaluate(task)
+        else:
+            with ThreadPoolExecutor(self.num_threads) as pool:
+                list(pool.map(evaluate, tasks))
+        return output
+
+    def _fold_omega_0(self):
+        """
+        Multiplies the weights read by the sines by `omega_0`, once at load time,
+        so the sines are evaluated on `x @ w + b` instead of scaling the output of
+        every matmul. For the shape net of a full connectivity, the columns of the
+        last parameter net layer generating these weights are multiplied, since
+        the weights are linear in them.
+        """
+        specs = list(self.layout["parameter_net"])
+        if self.layout["shape_net"]["connectivity"] == "last_layer":
+            specs += self.layout["shape_net"]["layers"]
+        for spec in specs:
+            if spec["op"] in ("sine", "sine_resblock"):
+                for name in spec["weights"][::2]:
+                    self.weights[name] = spec["omega_0"] * self.weights[name]
+
+        cfg = self.layout["shape_net"]
+        if cfg["connectivity"] != "full" or not cfg["multiscale"]:
+            return
+        d, n, rank = cfg["input_dim"], cfg["units"], cfg["rank"]
+        n_matrix = cfg["nlayers"] * (2 if cfg["resblock"] else 1)
+        n_w = n * n if rank is None else 2 * n * rank
+        # the first layer weights, then the hidden ones, of which only the first
+        # factor `u` of a low-rank weight `u @ v`
+        scaled = np.zeros(d * n + n_matrix * n_w, bool)
+        scaled[: d * n] = True
+        for k in range(n_matrix):
+            start = d * n + k * n_w
+            scaled[start : start + (n * n if rank is None else n * rank)] = True
+        for name in self.layout["parameter_net"][-1]["weights"]:
+            w = self.weights[name].copy()
+            w[..., : scaled.shape[0]][..., scaled] *= cfg["omega_0"]
+            self.weights[name] = w
+        for k in range(n_matrix):
+            name = "shape_net/base/{}".format(k)
+            if name in self.weights:
+                self.weights[name] = cfg["omega_0"] * self.weights[name]
+
+    def _call_layers(self, x, specs):
+        """
+        Evaluates a sequence of layers exported by `_export_layers`.
+        """
+        for spec in specs:
+            w = [self.weights[name] for name in spec["weights"]]
+            if spec["op"] == "dense":
+                x = _ACTIVATIONS[spec["activation"]](x @ w[0] + w[1])
+            elif spec["op"] == "shortcut":
+                x = x + _ACTIVATIONS[spec["activation"]](x @ w[0] + w[1])
+            elif spec["op"] == "resnet":
+                act = _ACTIVATIONS[spec["activation"]]
+                x = act(x + act(x @ w[0] + w[1]) @ w[2] + w[3])
+            elif spec["op"] == "sine":
+                # omega_0 is folded into the weights, see `_fold_omega_0`
+                x = np.sin(x @ w[0] + w[1])
+            elif spec["op"] == "sine_resblock":
+                h = np.sin(x @ w[0] + w[1])
+                x = 0.5 * (x + np.sin(h @ w[2] + w[3]))
+            else:
+                raise ValueError("unknown layer {}".format(spec["op"]))
+        return x
+
+    def _encode(self, x):
+        """
+        Evaluates the hash-grid encoding of the shape net input, see
+        `nif.layers.HashGridEncoding`, or returns the input without an encoding.
+        """
+        cfg = self.layout["encoding"]
+        if cfg is None:
+            return x
+        resolution = self.weights["encoding/resolution"]
+        corners = self.weights["encoding/corners"]
+        primes = self.weights["encoding/primes"]
+        lower = self.weights["encoding/lower"]
+        upper = self.weights["encoding/upper"]
+        x_unit = np.clip((x - lower) / (upper - lower), 0.0, 1.0)
+
+        # cell and position in the cell on each level, (batch, level, dim)
+        scaled = x_unit[:, np.newaxis, :] * resolution[:, np.newaxis]
+        cell = np.minimum(np.floor(scaled), resolution[:, np.newaxis] - 1.0)
+        frac = scaled - cell
+
+        # vertices of the cell, (batch, level, corner, dim)
+        vertex = cell.astype(np.int64)[:, :, np.newaxis, :] + corners
+        strides = self.weights["encoding/strides"]
+        dense_index = np.sum(vertex * strides[:, np.newaxis, :], -1)
+        hashed_index = vertex[..., 0] * primes[0]
+        for i in range(1, cfg["input_dim"]):
+            hashed_index = np.bitwise_xor(hashed_index, vertex[..., i] * primes[i])
+        hashed_index = np.bitwise_and(hashed_index, 2 ** cfg["log2_table_size"] - 1)
+        index = (
+            np.where(
+                self.weights["encoding/is_dense"][:, np.newaxis],
+                dense_index,
+                hashed_index,
+            )
+            + self.weights["encoding/offsets"][:, np.newaxis]
+        )
+
+        # multilinear interpolation weights, (batch, level, corner)
+        weight = np.prod(
+            np.where(
+                corners == 1,
+                frac[:, :, np.newaxis, :],
+                1.0 - frac[:, :, np.newaxis, :],
+            ),
+            -1,
+        )
+        features = np.sum(
+            weight[..., np.newaxis] * self.weights["encoding/table"][index], axis=2
+        )
+        y = features.reshape(-1, cfg["n_levels"] * cfg["n_features"])
+        if cfg["include_input"]:
+            y = np.concatenate([x, y], -1)
+        return y
+
+    def _distribute(self, pnet_output):
+        """
+        Splits the parameter net output into the weights and biases of the shape
+        net, in the order of `NIF._distribute_pnet_output` and
+        `NIFMultiScale._distribute_pnet_output_mres`.
+
+        Returns:
+            tuple: The first layer weights, the list of hidden layer weights, the
+            last layer weights, the first layer bias, the list of hidden layer
+            biases and the last layer bias, each with the leading dimension of
+            `pnet_output`. A low-rank hidden weight is the pair of its factors.
+        """
+        cfg = self.layout["shape_net"]
+        d, n, o, rank = (
+            cfg["input_dim"],
+            cfg["units"],
+            self.layout["so_dim"],
+            cfg["rank"],
+        )
+        n_matrix = cfg["nlayers"] * (2 if cfg["resblock"] else 1)
+        n_w = n * n if rank is None else 2 * n * rank
+        sizes = [d * n] + [n_w] * n_matrix + [n * o, n] + [n] * n_matrix + [o]
+        parts = np.split(pnet_output, np.cumsum(sizes)[:-1], axis=1)
+        if rank is None:
+            w_hidden = [w.reshape(-1, n, n) for w in parts[1 : 1 + n_matrix]]
+        else:
+            w_hidden = [
+                (
+                    w[:, : n * rank].reshape(-1, n, rank),
+                    w[:, n * rank :].reshape(-1, rank, n),
+                )
+                for w in parts[1 : 1 + n_matrix]
+            ]
+        return (
+            parts[0].reshape(-1, d, n),
+            w_hidden,
+            parts[1 + n_matrix].reshape(-1, n, o),
+            parts[2 + n_matrix][:, np.newaxis],
+            [b[:, np.newaxis] for b in parts[3 + n_matrix : 3 + 2 * n_matrix]],
+            parts[-1][:, np.newaxis],
+        )
+
+    def _hidden_matmul(self, u, w, k):
+        """
+        Multiplies the input of the k-th hidden matrix of the shape net by its
+        weight and its optional shared base matrix.
+        """
+        z = u @ w[0] @ w[1] if isinstance(w, tuple) else u @ w
+        base = self.weights.get("shape_net/base/{}".format(k))
+        if base is not None:
+            z = z + u @ base
+        return z
+
+    def _full_shape_net(self, x, weights):
+        """
+        Evaluates the shape net of a full connectivity, see `NIF._call_shape_net`
+        and `NIFMultiScale._call_shape_net_mres`.
+
+        Args:
+            x (numpy.ndarray): The encoded input with shape (n_weights, n_points,
+                input_dim), the weights being shared by the points along the
+                second axis.
+            weights (tuple): The output of `_distribute`.
+
+        Returns:
+            numpy.ndarray: The output with shape (n_weights, n_points, so_dim).
+        """
+        cfg = self.layout["shape_net"]
+        w_1, w_hidden, w_l, b_1, b_hidden, b_l = weights
+        if not cfg["multiscale"]:
+            act = _ACTIVATIONS[cfg["activation"]]
+            u = act(x @ w_1 + b_1)
+            for k in range(cfg["nlayers"]):
+                u = act(self._hidden_matmul(u, w_hidden[k], k) + b_hidden[k]) + u
+            return u @ w_l + b_l
+
+        # omega_0 is folded into the generated weights, see `_fold_omega_0`
+        u = np.sin(x @ w_1 + b_1)
+        if cfg["resblock"]:
+            for i in range(cfg["nlayers"]):
+                h = np.sin(
+                    self._hidden_matmul(u, w_hidden[2 * i], 2 * i) + b_hidden[2 * i]
+                )
+                u = 0.5 * (
+                    u
+                    + np.sin(
+                        self._hidden_matmul(h, w_hidden[2 * i + 1], 2 * i + 1)
+                        + b_hidden[2 * i + 1]
+                    )
+                )
+        else:
+            for k in range(cfg["nlayers"]):
+                u = np.sin(self._hidden_matmul(u, w_hidden[k], k) + b_hidden[k])
+        return u @ w_l + b_l
+
+    def _last_layer_shape_net(self, x, latent):
+        """
+        Evaluates the shape net of NIFMultiScaleLastLayerParameterized, i.e., the
+        basis at the points combined with the latent of their parameter value.
+        """
+        cfg = self.layout["shape_net"]
+        phi = self._call_layers(self._encode(x), cfg["layers"])
+        phi = phi.reshape(-1, self.layout["so_dim"], cfg["latent_dim"])
+        return np.einsum("aoh,ah->ao", phi, latent) + self.weights["shape_net/bias"]
+
+
+def _check_activation(name):
+    if name not in _ACTIVATIONS:
+        raise NotImplementedError(
+            "activation {} is not supported, only {}".format(
+                name, ", ".join(sorted(_ACTIVATIONS))
+            )
+        )
+
+
+def _activation_name(fn):
+    name = getattr(fn, "__name__", None)
+    _check_activation(name)
+    return name
+
+
+def _export_layers(layers, prefix, arrays):
+    """
+    Describes a sequence of Keras layers as operations of `NumpyModel`, and adds
+    their weights to `arrays`.
+
+    Returns:
+        list: One dict per layer with its operation, its arguments and the names
+        of its weights.
+    """
+    specs = []
+    for i, layer_ in enumerate(layers):
+        kind = type(layer_).__name__
+        if kind == "Dense":
+            spec = {"op": "dense", "activation": _activation_name(layer_.activation)}
+            variables = [layer_.kernel, layer_.bias]
+        elif kind == "MLP_SimpleShortCut":
+            spec = {
+                "op": "shortcut",
+                "activation": _activation_name(layer_.L1.activation),
+            }
+            variables = [layer_.L1.kernel, layer_.L1.bias]
+        elif kind == "MLP_ResNet":
+            spec = {"op": "resnet", "activation": _activation_name(layer_.act)}
+            variables = [
+                layer_.L1.kernel,
+                layer_.L1.bias,
+                layer_.L2.kernel,
+                layer_.L2.bias,
+            ]
+        elif kind == "SIREN":
+            if layer_.layer_position in ("last", "bottleneck"):
+                spec = {"op": "dense", "activation": "linear"}
+            else:
+                spec = {"op": "sine", "omega_0": float(layer_.omega_0)}
+            variables = [layer_.w, layer_.b]
+        elif kind == "SIREN_ResNet":
+            spec = {"op": "sine_resblock", "omega_0": float(layer_.omega_0)}
+            variables = [layer_.w, layer_.b, layer_.w2, layer_.b2]
+        elif kind == "HyperLinearForSIREN":
+            spec = {"op": "dense", "activation": "linear"}
+            variables = [_hyper_kernel(layer_), layer_.b]
+        else:
+            raise NotImplementedError("{} is not supported".format(kind))
+        spec["weights"] = []
+        for j, variable in enumerate(variables):
+            name = "{}/{}/{}".format(prefix, i, j)
+            arrays[name] = np.asarray(variable)
+            spec["weights"].append(name)
+        specs.append(spec)
+    return specs
+
+
+def _hyper_kernel(layer_):
+    """
+    Returns the kernel of a HyperLinearForSIREN, with its low-rank factors
+    multiplied block by block.
+    """
+    if layer_.rank is None:
+        return layer_.w.numpy()
+    u_blocks = np.split(layer_.u.numpy(), len(layer_.block_sizes), axis=1)
+    v_blocks = np.split(layer_.v.numpy(), np.cumsum(layer_.block_sizes)[:-1], axis=1)
+    return np.concatenate([u @ v for u, v in zip(u_blocks, v_blocks)], 1)
+
+
+def _export_encoding(encoding, arrays):
+    """
+    Adds the table and the grid of a hash-grid encoding to `arrays`.
+
+    Returns:
+        dict or None: The configuration of the encoding, or None without one.
+    """
+    if encoding is None:
+        return None
+    lower = np.broadcast_to(encoding._lower.numpy(), [encoding.input_dim])
+    upper = np.broadcast_to(encoding._upper.numpy(), [encoding.input_dim])
+    arrays.update(
+        {
+            "encoding/table": encoding.table.numpy(),
+            "encoding/resolution": encoding._resolution.numpy(),
+            "encoding/is_dense": encoding._is_dense.numpy(),
+            "encoding/strides": encoding._strides.numpy(),
+            "encoding/offsets": encoding._offsets.numpy(),
+            "encoding/corners": encoding._corners.numpy(),
+            "encoding/primes": encoding._primes.numpy(),
+            "encoding/lower": np.array(lower),
+            "encoding/upper": np.array(upper),
+        }
+    )
+    return {
+        "input_dim": encoding.input_dim,
+        "n_levels": encoding.n_levels,
+        "n_features": encoding.n_features,
+        "log2_table_size": encoding.log2_table_size,
+        "include_input": encoding.include_input,
+    }
@@ -1,5 +1,8 @@
 from tensorflow.keras.layers import Dense
 
+from nif.layers.domain import GridPartition
+from nif.layers.domain import KDTreePartition
+from nif.layers.encoding import HashGridEncoding
 from nif.layers.gradient import HessianLayer
 from nif.layers.gradient import JacobianLayer
 from nif.layers.gradient import JacRegLatentLayer
@@ -7,6 +10,7 @@ from nif.layers.mlp import BiasAddLayer
 from nif.layers.mlp import EinsumLayer
 from nif.layers.mlp import MLP_ResNet
 from nif.layers.mlp import MLP_SimpleShortCut
+from nif.layers.mlp import MultiHeadDense
 from nif.layers.regularization import ParameterOutputL1ActReg
 from nif.layers.siren import HyperLinearForSIREN
 from nif.layers.siren import SIREN
@@ -25,4 +29,8 @@ __all__ = [
     "ParameterOutputL1ActReg",
     "EinsumLayer",
     "BiasAddLayer",
+    "HashGridEncoding",
+    "GridPartition",
+    "KDTreePartition",
+    "MultiHeadDense",
 ]
@@ -0,0 +1,265 @@
+import numpy as np
+import tensorflow as tf
+
+
+class _DomainPartition(tf.keras.layers.Layer):
+    """
+    Base class of the partitions of the spatial domain into axis-aligned boxes, or
+    subdomains. Calling the layer routes every point to its subdomain and maps it to
+    the local coordinates of the subdomain, i.e., centered at the box center and
+    divided by half the largest side of the box, so the box lies in [-1, 1]^d.
+
+    Args:
+        lower (array-like): Lower corners of the subdomains, (n_subdomains, input_dim).
+        upper (array-like): Upper corners of the subdomains, (n_subdomains, input_dim).
+        mixed_policy (tf.keras.mixed_precision.Policy): Policy for mixed precision
+            computation. The routing is always done in the variable dtype.
+        **kwargs: Additional layer arguments.
+
+    Attributes:
+        n_subdomains (int): Number of subdomains.
+        input_dim (int): Dimension of the spatial domain.
+    """
+
+    def __init__(
+        self,
+        lower,
+        upper,
+        mixed_policy=tf.keras.mixed_precision.Policy("float32"),
+        **kwargs
+    ):
+        kwargs.setdefault("dtype", mixed_policy)
+        # low precision coordinates would move the points between the subdomains
+        kwargs.setdefault("autocast", False)
+        super(_DomainPartition, self).__init__(**kwargs)
+        self.variable_Dtype = mixed_policy.variable_dtype
+        self.lower = np.asarray(lower, dtype=np.float64)
+        self.upper = np.asarray(upper, dtype=np.float64)
+        self.n_subdomains, self.input_dim = self.lower.shape
+        self._center = tf.constant(0.5 * (self.lower + self.upper), self.variable_Dtype)
+        self._inv_half_width = tf.constant(
+            2.0 / np.max(self.upper - self.lower, axis=1), self.variable_Dtype
+        )
+
+    def locate(self, x):
+        """
+        Finds the subdomain of each point.
+
+        Args:
+            x (tf.Tensor): Points with shape (batch_size, input_dim), in the variable
+                dtype.
+
+        Returns:
+            tf.Tensor: Index of the subdomain of each point, int32 with shape
+            (batch_size,).
+        """
+        raise NotImplementedError
+
+    def call(self, x, **kwargs):
+        """
+        Routes the points to their subdomains.
+
+        Args:
+            x (tf.Tensor): Points with shape (batch_size, input_dim).
+
+        Returns:
+            tuple: The index of the subdomain of each point with shape (batch_size,),
+            the local coordinates with shape (batch_size, input_dim) and the
+            derivative of the local coordinates with respect to the points, i.e.,
+            the inverse of half the largest side of the subdomain, with shape
+            (batch_size,).
+        """
+        x = tf.cast(x, self.variable_Dtype)
+        head = self.locate(x)
+        inv_half_width = tf.gather(self._inv_half_width, head)
+        x_local = (x - tf.gather(self._center, head)) * inv_half_width[:, tf.newaxis]
+        return head, x_local, inv_half_width
+
+    def group(self, points):
+        """
+        Splits a set of points by subdomain, e.g., to shard the training data.
+
+        Args:
+            points (array-like): Points with shape (n_points, input_dim).
+
+        Returns:
+            list: For each subdomain, the indices of the points inside it.
+        """
+        head = self.locate(tf.cast(points, self.variable_Dtype)).numpy()
+        return [np.flatnonzero(head == i) for i in range(self.n_subdomains)]
+
+
+class GridPartition(_DomainPartition):
+    """
+    Partition of the spatial domain by a rectilinear grid. The subdomains are the
+    grid cells, numbered in row-major order, i.e., the last dimension is the fastest.
+    Points are located by one binary search per dimension, points outside the grid
+    belong to the closest cell.
+
+    Usage:
+        partition = GridPartition([np.linspace(0, 1, 5), np.linspace(-1, 1, 3)])
+
+    Args:
+        edges (list): For each input dimension, the increasing cell edges, including
+            the outer bounds.
+        mixed_policy (tf.keras.mixed_precision.Policy): Policy for mixed precision
+            computation.
+        **kwargs: Additional layer arguments.
+    """
+
+    def __init__(
+        self, edges, mixed_policy=tf.keras.mixed_precision.Policy("float32"), **kwargs
+    ):
+        self.edges = [np.asarray(e, dtype=np.float64) for e in edges]
+        if any(
+            e.ndim != 1 or e.size < 2 or np.any(np.diff(e) <= 0) for e in self.edges
+        ):
+            raise ValueError(
+                "each entry of `edges` should be at least 2 increasing values"
+            )
+        cells = np.meshgrid(*[np.arange(e.size - 1) for e in self.edges], indexing="ij")
+        cells = np.stack([c.ravel() for c in cells], -1)
+        lower = np.stack([e[c] for e, c in zip(self.edges, cells.T)], -1)
+        upper = np.stack([e[c + 1] for e, c in zip(self.edges, cells.T)], -1)
+        super(GridPartition, self).__init__(lower, upper, mixed_policy, **kwargs)
+
+        n_cells = [e.size - 1 for e in self.edges]
+        self._strides = [int(np.prod(n_cells[i + 1 :])) for i in range(len(n_cells))]
+        self._inner_edges = [
+            tf.constant(e[np.newaxis, 1:-1], self.variable_Dtype) for e in self.edges
+        ]
+
+    def locate(self, x):
+        head = tf.zeros_like(x[:, 0], dtype=tf.int32)
+        for i, inner_edges in enumerate(self._inner_edges):
+            if inner_edges.shape[1] == 0:
+                continue
+            index = tf.searchsorted(inner_edges, x[tf.newaxis, :, i], side="right")
+            head += index[0] * self._strides[i]
+        return head
+
+    def get_config(self):
+        config = super().get_config()
+        config.update({"edges": [e.tolist() for e in self.edges]})
+        return config
+
+
+class KDTreePartition(_DomainPartition):
+    """
+    Partition of the spatial domain by a balanced k-d tree, usually built over the
+    training points with `KDTreePartition.from_points`, so each subdomain holds about
+    the same number of points. The tree is stored as arrays and all points descend
+    it together, with one gather per level.
+
+    Args:
+        split_dim (array-like): Split dimension of each internal node, in breadth-first
+            order, with shape (2**depth - 1,).
+        split_value (array-like): Split value of each internal node, points with
+            `x[split_dim] <= split_value` go to the left child.
+        lower (array-like): Lower corners of the leaves, (2**depth, input_dim).
+        upper (array-like): Upper corners of the leaves, (2**depth, input_dim).
+        mixed_policy (tf.keras.mixed_precision.Policy): Policy for mixed precision
+            computation.
+        **kwargs: Additional layer arguments.
+    """
+
+    def __init__(
+        self,
+        split_dim,
+        split_value,
+        lower,
+        upper,
+        mixed_policy=tf.keras.mixed_precision.Policy("float32"),
+        **kwargs
+    ):
+        super(KDTreePartition, self).__init__(lower, upper, mixed_policy, **kwargs)
+        self.split_dim = np.asarray(split_dim, dtype=np.int32)
+        self.split_value = np.asarray(split_value, dtype=np.float64)
+        self.depth = int(np.log2(self.n_subdomains))
+        if (
+            self.split_dim.size != 2**self.depth - 1
+            or self.n_subdomains != 2**self.depth
+        ):
+            raise ValueError(
+                "a k-d tree of depth d has 2**d - 1 splits and 2**d leaves"
+            )
+        self._split_dim = tf.constant(self.split_dim)
+        self._split_value = tf.constant(self.split_value, self.variable_Dtype)
+
+    @classmethod
+    def from_points(
+        cls,
+        points,
+        depth,
+        bounds=None,
+        mixed_policy=tf.keras.mixed_precision.Policy("float32"),
+        **kwargs
+    ):
+        """
+        Builds a k-d tree over a set of points. Each node is split at the median of
+        its points along the longest side of its box.
+
+        Args:
+            points (array-like): Points with shape (n_points, input_dim).
+            depth (int): Depth of the tree, which gives 2**depth subdomains.
+            bounds (tuple, optional): Lower and upper bound of the domain, scalars or
+                one per input dimension. Defaults to the bounding box of the points.
+            mixed_policy (tf.keras.mixed_precision.Policy): Policy for mixed precision
+                computation.
+            **kwargs: Additional layer arguments.
+
+        Returns:
+            KDTreePartition: The partition.
+        """
+        points = np.asarray(points, dtype=np.float64)
+        input_dim = points.shape[1]
+        if bounds is None:
+            bounds = (points.min(0), points.max(0))
+        root_lower = np.broadcast_to(np.asarray(bounds[0], np.float64), (input_dim,))
+        root_upper = np.broadcast_to(np.asarray(bounds[1], np.float64), (input_dim,))
+
+        split_dim = np.zeros(2**depth - 1, dtype=np.int32)
+        split_value = np.zeros(2**depth - 1)
+        # nodes of the current level: (points, lower, upper), breadth-first
+        level = [(points, root_lower, root_upper)]
+        for node_offset in 2 ** np.arange(depth) - 1:
+            next_level = []
+            for i, (node_points, lower, upper) in enumerate(level):
+                dim = int(np.argmax(upper - lower))
+                if node_points.shape[0] > 0:
+                    value = np.median(node_points[:, dim])
+                else:
+                    value = 0.5 * (lower[dim] + upper[dim])
+                split_dim[node_offset + i] = dim
+                split_value[node_offset + i] = value
+                is_left = node_points[:, dim] <= value
+                upper_left, lower_right = upper.copy(), lower.copy()
+                upper_left[dim] = lower_right[dim] = value
+                next_level.append((node_points[is_left], lower, upper_left))
+                next_level.append((node_points[~is_left], lower_right, upper))
+            level = next_level
+        lower = np.stack([node[1] for node in level])
+        upper = np.stack([node[2] for node in level])
+        return cls(split_dim, split_value, lower, upper, mixed_policy, **kwargs)
+
+    def locate(self, x):
+        node = tf.zeros_like(x[:, 0], dtype=tf.int32)
+        for _ in range(self.depth):
+            dim = tf.gather(self._split_dim, node)
+            is_right = tf.gather(x, dim, batch_dims=1) > tf.gather(
+                self._split_value, node
+            )
+            node = 2 * node + 1 + tf.cast(is_right, tf.int32)
+        return node - (2**self.depth - 1)
+
+    def get_config(self):
+        config = super().get_config()
+        config.update(
+            {
+                "split_dim": self.split_dim.tolist(),
+                "split_value": self.split_value.tolist(),
+                "lower": self.lower.tolist(),
+                "upper": self.upper.tolist(),
+            }
+        )
+        return config
@@ -0,0 +1,190 @@
+import numpy as np
+import tensorflow as tf
+
+# large primes for the spatial hash of Mueller et al., "Instant Neural Graphics
+# Primitives with a Multiresolution Hash Encoding", 2022
+_HASH_PRIMES = [1, 2654435761, 805459861, 3674653429, 2097192037, 1434869437]
+
+
+def encoded_input_dim(cfg_shape_net):
+    """
+    Computes the input dimension of the first shape network layer, i.e., the output
+    dimension of the input encoding given by `cfg_shape_net["encoding"]`, or the
+    input dimension of the shape network without an encoding.
+
+    Args:
+        cfg_shape_net (dict): Configuration dictionary for the shape network.
+
+    Returns:
+        int: The input dimension of the first shape network layer.
+    """
+    cfg_encoding = cfg_shape_net.get("encoding", None)
+    if cfg_encoding is None:
+        return cfg_shape_net["input_dim"]
+    dim = cfg_encoding.get("n_levels", 16) * cfg_encoding.get("n_features", 2)
+    if cfg_encoding.get("include_input", True):
+        dim += cfg_shape_net["input_dim"]
+    return dim
+
+
+class HashGridEncoding(tf.keras.layers.Layer):
+    """
+    A trainable multiresolution hash-grid encoding of the shape network input.
+
+    The input box is covered by `n_levels` grids with resolutions growing
+    geometrically from `base_resolution` to `max_resolution`. Each level stores
+    `n_features` trainable features per grid vertex in a table with at most
+    `2**log2_table_size` entries. Coarse levels that fit in the table are indexed
+    densely, i.e., a dense multi-level grid, finer levels are hashed. The features
+    of the `2**input_dim` corners of the cell containing a point are linearly
+    (bilinearly, trilinearly, ...) interpolated on each level and concatenated.
+    All levels and corners are looked up by a single vectorized gather.
+
+    Args:
+        input_dim (int): Dimension of the input.
+        n_levels (int): Number of grid levels. Defaults to 16.
+        n_features (int): Number of features per grid vertex. Defaults to 2.
+        log2_table_size (int): Log2 of the maximal number of vertices per level.
+            Defaults to 14.
+        base_resolution (int): Resolution of the coarsest level. Defaults to 16.
+        max_resolution (int): Resolution of the finest level. Defaults to 512.
+        bounds (tuple): Lower and upper bound of the input box, scalars or one per
+            input dimension. Inputs outside are clipped. Defaults to (-1.0, 1.0).
+        include_input (bool): Whether to prepend the input to the encoding.
+            Defaults to True.
+        mixed_policy (tf.keras.mixed_precision.Policy): Policy for mixed precision
+            computation. The positions and the interpolation are always evaluated
+            in the variable dtype, only the output is cast to the compute dtype.
+        **kwargs: Additional layer arguments.
+
+    Attributes:
+        table (tf.Variable): Features of all levels with shape (n_vertices, n_features).
+    """
+
+    def __init__(
+        self,
+        input_dim,
+        n_levels=16,
+        n_features=2,
+        log2_table_size=14,
+        base_resolution=16,
+        max_resolution=512,
+        bounds=(-1.0, 1.0),
+        include_input=True,
+        mixed_policy=tf.keras.mixed_precision.Policy("float32"),
+        **kwargs
+    ):
+        """
+        Initializes the `HashGridEncoding` class.
+        """
+        kwargs.setdefault("dtype", mixed_policy)
+        # low precision positions would move the points between the grid cells
+        kwargs.setdefault("autocast", False)
+        super(HashGridEncoding, self).__init__(**kwargs)
+        if input_dim > len(_HASH_PRIMES):
+            raise ValueError(
+                "HashGridEncoding supports up to {} input dimensions".format(
+                    len(_HASH_PRIMES)
+                )
+            )
+        self.input_dim = input_dim
+        self.n_levels = n_levels
+        self.n_features = n_features
+        self.log2_table_size = log2_table_size
+        self.base_resolution = base_resolution
+        self.max_resolution = max_resolution
+        self.bounds = bounds
+        self.include_input = include_input
+        self.compute_Dtype = mixed_policy.compute_dtype
+        self.variable_Dtype = mixed_policy.variable_dtype
+
+        if n_levels > 1:
+            growth = np.exp(
+                (np.log(max_resolution) - np.log(base_resolution)) / (n_levels - 1)
+            )
+        else:
+            growth = 1.0
+        resolution = np.floor(base_resolution * growth ** np.arange(n_levels)).astype(
+            np.int64
+        )
+        table_size = 2**log2_table_size
+        is_dense = (resolution + 1) ** input_dim <= table_size
+        level_size = np.where(is_dense, (resolution + 1) ** input_dim, table_size)
+        strides = (resolution[:, None] + 1) ** np.arange(input_dim)[None, :]
+
+        self._resolution = tf.constant(resolution, self.variable_Dtype)
+        self._is_dense = tf.constant(is_dense)
+        self._strides = tf.constant(strides * is_dense[:, None], tf.int64)
+        self._offsets = tf.constant(np.cumsum(level_size) - level_size, tf.int64)
+        corners = (np.arange(2**input_dim)[:, None] >> np.arange(input_dim)) & 1
+        self._corners = tf.constant(corners, tf.int64)
+        self._primes = tf.constant(_HASH_PRIMES[:input_dim], tf.int64)
+        self._lower = tf.constant(bounds[0], self.variable_Dtype)
+        self._upper = tf.constant(bounds[1], self.variable_Dtype)
+
+        self.table = tf.Variable(
+            tf.random.uniform(
+                (int(level_size.sum()), n_features), -1e-4, 1e-4, self.variable_Dtype
+            ),
+            name=kwargs.get("name", "hash_grid") + "_table",
+        )
+
+    def call(self, x, **kwargs):
+        x = tf.cast(x, self.variable_Dtype)
+        x_unit = tf.clip_by_value(
+            (x - self._lower) / (self._upper - self._lower), 0.0, 1.0
+        )
+
+        # cell and position in the cell on each level, (batch, level, dim)
+        scaled = x_unit[:, tf.newaxis, :] * self._resolution[:, tf.newaxis]
+        cell = tf.minimum(tf.floor(scaled), self._resolution[:, tf.newaxis] - 1.0)
+        frac = scaled - cell
+
+        # vertices of the cell, (batch, level, corner, dim)
+        vertex = tf.cast(cell, tf.int64)[:, :, tf.newaxis, :] + self._corners
+        dense_index = tf.reduce_sum(vertex * self._strides[:, tf.newaxis, :], -1)
+        hashed_index = vertex[..., 0] * self._primes[0]
+        for i in range(1, self.input_dim):
+            hashed_index = tf.bitwise.bitwise_xor(
+                hashed_index, vertex[..., i] * self._primes[i]
+            )
+        hashed_index = tf.bitwise.bitwise_and(
+            hashed_index, 2**self.log2_table_size - 1
+        )
+        index = (
+            tf.where(self._is_dense[:, tf.newaxis], dense_index, hashed_index)
+            + self._offsets[:, tf.newaxis]
+        )
+
+        # multilinear interpolation weights, (batch, level, corner)
+        weight = tf.reduce_prod(
+            tf.where(
+                self._corners == 1,
+                frac[:, :, tf.newaxis, :],
+                1.0 - frac[:, :, tf.newaxis, :],
+            ),
+            -1,
+        )
+        features = tf.reduce_sum(
+            weight[..., tf.newaxis] * tf.gather(self.table, index), axis=2
+        )
+        y = tf.reshape(features, [-1, self.n_levels * self.n_features])
+        if self.include_input:
+            y = tf.concat([x, y], -1)
+        return tf.cast(y, self.compute_Dtype)
+
+    def get_config(self):
+        config = super().get_config()
+        config.update(
+            {
+                "input_dim": self.input_dim,
+                "n_levels": self.n_levels,
+                "n_features": self.n_features,
+                "log2_table_size": self.log2_table_size,
+                "base_resolution": self.base_resolution,
+                "max_resolution": self.max_resolution,
+                "bounds": self.bounds,
+                "include_input": self.include_input,
+            }
+        )
+        return config
@@ -1,3 +1,4 @@
+import numpy as np
 import tensorflow as tf
 
 
@@ -11,12 +12,13 @@ class JacobianLayer(tf.keras.layers.Layer):
                                     with respect to.
         x_index (int or List[int]): The index or indices of the input variable(s) to compute the Jacobian
                                     with respect to.
+        mode (str): `forward`, `reverse` or `auto`, see `compute_output_and_grad`.
 
     Returns:
         Tuple[tf.Tensor, tf.Tensor]: A tuple containing the output of the model and the Jacobian matrix.
     """
 
-    def __init__(self, model, y_index, x_index, **kwargs):
+    def __init__(self, model, y_index, x_index, mode="auto", **kwargs):
         """
         Initializes a new instance of the JacobianLayer class.
 
@@ -26,12 +28,15 @@ class JacobianLayer(tf.keras.layers.Layer):
                                         Jacobian with respect to.
             x_index (int or List[int]): The index or indices of the input variable(s) to compute the
                                         Jacobian with respect to.
+            mode (str): `forward`, `reverse` or `auto`, see `compute_output_and_grad`.
+                        Defaults to `auto`.
             **kwargs: Additional keyword arguments to pass to the base class constructor.
         """
         super().__init__(**kwargs)
         self.model = model
         self.y_index = y_index
         self.x_index = x_index
+        self.mode = mode
 
     @tf.function
     def call(self, x, **kwargs):
@@ -45,7 +50,9 @@ class JacobianLayer(tf.keras.layers.Layer):
         Returns:
             Tuple[tf.Tensor, tf.Tensor]: A tuple containing the output of the model and the Jacobian matrix.
         """
-        y, dys_dxs = compute_output_and_grad(self.model, x, self.x_index, self.y_index)
+        y, dys_dxs = compute_output_and_grad(
+            self.model, x, self.x_index, self.y_index, self.mode
+        )
         return y, dys_dxs
 
 
@@ -62,6 +69,11 @@ class JacRegLatentLayer(JacobianLayer):
     where `l1` is a hyperparameter controlling the strength of the regularization,
     `f` is the TensorFlow model, `y` is its output, and `x` is its input.
 
+    If `n_projections` is given, `mean((df/dx)^2)` is replaced by an unbiased
+    Hutchinson estimate: `n_projections` Rademacher vectors `v` are drawn for each
+    of `n_rows` randomly chosen rows of the batch, and `mean((df/dx v)^2) / len(x_index)`
+    is used instead, which only needs forward-mode products on the subsample.
+
     Args:
         model (tf.keras.Model): The TensorFlow model for which to compute the Jacobian.
         y_index (int or List[int]): The index or indices of the output variable(s) to compute the
@@ -70,11 +82,24 @@ class JacRegLatentLayer(JacobianLayer):
                                     Jacobian with respect to.
         l1 (float): The weight of the Jacobian regularization term in the loss function.
         mixed_policy (str): The floating-point precision to use for computing the Jacobian.
+        n_projections (int, optional): The number of random projections of the
+                                       stochastic estimator. Defaults to None, i.e.,
+                                       the exact Jacobian is used.
+        n_rows (int, optional): The number of rows of the batch used by the
+                                stochastic estimator. Defaults to None, i.e., all rows.
         **kwargs: Additional keyword arguments to pass to the base class constructor.
     """
 
     def __init__(
-        self, model, y_index, x_index, l1=1e-2, mixed_policy="float32", **kwargs
+        self,
+        model,
+        y_index,
+        x_index,
+        l1=1e-2,
+        mixed_policy="float32",
+        n_projections=None,
+        n_rows=None,
+        **kwargs
     ):
         """
         Initializes a new instance of the JacRegLatentLayer class.
@@ -87,12 +112,17 @@ class JacRegLatentLayer(JacobianLayer):
                                         Jacobian with respect to.
             l1 (float): The weight of the Jacobian regularization term in the loss function.
             mixed_policy (str): The floating-point precision to use for computing the Jacobian.
+            n_projections (int, optional): The number of random projections of the
+                                           stochastic estimator. Defaults to None.
+            n_rows (int, optional): The number of rows of the batch used by the
+                                    stochastic estimator. Defaults to None.
             **kwargs: Additional keyword arguments to pass to the base class constructor.
         """
         super().__init__(model, y_index, x_index, dtype=mixed_policy, **kwargs)
-        self.l1 = tf.cast(l1, self.mixed_policy.compute_dtype).numpy()
+        self.l1 = tf.cast(l1, self.dtype_policy.compute_dtype).numpy()
+        self.n_projections = n_projections
+        self.n_rows = n_rows
 
-    @tf.function
     def call(self, x, **kwargs):
         """
         Computes the output of the model and the Jacobian regularization loss.
@@ -104,10 +134,25 @@ class JacRegLatentLayer(JacobianLayer):
         Returns:
             tf.Tensor: The output of the model.
         """
-        y, dls_dxs = compute_output_and_augment_grad(
-            self.model, x, self.x_index, self.y_index
-        )
-        jac_reg_loss = self.l1 * tf.reduce_mean(tf.square(dls_dxs))
+        if self.n_projections is None:
+            y, dls_dxs = compute_output_and_augment_grad(
+                self.model, x, self.x_index, self.y_index
+            )
+            jac_reg_loss = self.l1 * tf.reduce_mean(tf.square(dls_dxs))
+        else:
+            y, dls_dvs = compute_output_and_augment_random_jvp(
+                self.model,
+                x,
+                self.x_index,
+                self.y_index,
+                self.n_projections,
+                self.n_rows,
+            )
+            jac_reg_loss = (
+                self.l1
+                * tf.reduce_mean(tf.square(dls_dvs))
+                / len(_index_list(self.x_index))
+            )
         self.add_loss(jac_reg_loss)
         return y
 
@@ -122,6 +167,8 @@ class JacRegLatentLayer(JacobianLayer):
         config.update(
             {
                 "l1": self.l1,
+                "n_projections": self.n_projections,
+                "n_rows": self.n_rows,
             }
         )
         return config
@@ -136,15 +183,27 @@ class HessianLayer(tf.keras.layers.Layer):
     the input. The first derivative is given by the Jacobian matrix, and the second
     derivative is the Hessian matrix.
 
+    With `mode="diagonal"` or `mode="hvp"`, only the requested second derivatives are
+    computed, so the memory does not scale with the square of the input dimension:
+
+    - `diagonal`: the diagonal of the Hessian restricted to `x_index` with shape
+      (batch, len(y_index), len(x_index)), its sum over the last axis being the
+      Laplacian. It is computed forward-over-forward, one tangent per `x_index`.
+    - `hvp`: the Hessian-vector product restricted to `x_index` with shape
+      (batch, len(y_index), len(x_index)), given a `vector` with shape
+      (batch, len(x_index)) at call. It is computed forward-over-forward, one
+      tangent per `x_index` and one along `vector`.
+
     Args:
         model (tf.keras.Model): The TensorFlow model for which to compute the Hessian.
         y_index (int or List[int]): The index or indices of the output variable(s) to compute
                                     the Hessian with respect to.
         x_index (int or List[int]): The index or indices of the input variable(s) to compute
                                     the Hessian with respect to.
+        mode (str): `full`, `diagonal` or `hvp`. Defaults to `full`.
     """
 
-    def __init__(self, model, y_index, x_index):
+    def __init__(self, model, y_index, x_index, mode="full"):
         """
         Initializes a new instance of the HessianLayer class.
 
@@ -154,26 +213,46 @@ class HessianLayer(tf.keras.layers.Layer):
                                         compute the Hessian with respect to.
             x_index (int or List[int]): The index or indices of the input variable(s) to
                                         compute the Hessian with respect to.
+            mode (str): `full`, `diagonal` or `hvp`. Defaults to `full`.
         """
         super().__init__()
+        if mode not in ("full", "diagonal", "hvp"):
+            raise ValueError(
+                "mode should be `full`, `diagonal` or `hvp`, got {}".format(mode)
+            )
         self.model = model
         self.y_index = y_index
         self.x_index = x_index
+        self.mode = mode
 
     @tf.function
-    def call(self, x, **kwargs):
+    def call(self, x, vector=None, **kwargs):
         """
         Computes the output of the model, the Jacobian matrix, and the Hessian matrix.
 
         Args:
             x (tf.Tensor): The input tensor(s) to the model.
+            vector (tf.Tensor, optional): The vector multiplied by the Hessian with
+                                          shape (batch, len(x_index)), only used in
+                                          `hvp` mode. Defaults to None.
             **kwargs: Additional keyword arguments to pass to the underlying TensorFlow function.
 
         Returns:
             Tuple[tf.Tensor, tf.Tensor, tf.Tensor]: A tuple containing the output of the model,
                                                     the Jacobian matrix, and the
-                                                    Hessian matrix.
+                                                    Hessian matrix (or its diagonal, or the
+                                                    Hessian-vector product).
         """
+        if self.mode == "diagonal":
+            return compute_output_and_grad_and_hessian_diagonal(
+                self.model, x, self.x_index, self.y_index
+            )
+        elif self.mode == "hvp":
+            if vector is None:
+                raise ValueError("`vector` is required in `hvp` mode")
+            return compute_output_and_grad_and_hvp(
+                self.model, x, vector, self.x_index, self.y_index
+            )
         y, dys_dxs, dys2_dxs2 = compute_output_and_grad_and_hessian(
             self.model, x, self.x_index, self.y_index
         )
@@ -182,32 +261,112 @@ class HessianLayer(tf.keras.layers.Layer):
 
 def compute_output_and_augment_grad(model, x, x_index, y_index):
     """
-    Computes the output of a model and the Jacobian matrix.
+    Computes the output of a model and the Jacobian matrix of its second output.
+
+    The Jacobian is computed in forward mode, seeded only on the `x_index` columns
+    of the input, which is much cheaper than reverse mode when `len(x_index)` is
+    small compared to `len(y_index)`, e.g., d latent / d parameter in NIF. All
+    the tangents are pushed through the model in a single pass by tiling the
+    input.
 
     Args:
         model (tf.keras.Model): The TensorFlow model for which to compute the Jacobian.
+            It should return a tuple of the output and the augmented output.
         x (tf.Tensor): The input tensor(s) to the model.
         x_index (int or List[int]): The index or indices of the input variable(s)
                                     to compute the Jacobian with respect to.
-        y_index (int or List[int]): The index or indices of the output variable(s)
-                                    to compute the Jacobian with respect to.
+        y_index (int or List[int]): The index or indices of the augmented output
+                                    variable(s) to compute the Jacobian with respect to.
 
     Returns:
         Tuple[tf.Tensor, tf.Tensor]: A tuple containing the output of the model and the Jacobian matrix.
     """
-    with tf.GradientTape() as tape:
-        tape.watch(x)
-        y, layer_ = model(x)
+
+    def model_augment(x_):
+        y_, layer_ = model(x_)
+        return y_, tf.gather(layer_, y_index, axis=-1)
+
+    return _compute_output_and_forward_jacobian(model_augment, x, x_index)
+
+
+def compute_output_and_augment_random_jvp(
+    model, x, x_index, y_index, n_projections, n_rows=None
+):
+    """
+    Computes the output of a model and random projections of the Jacobian matrix of
+    its second output, for a Hutchinson estimate of the Jacobian's squared norm.
+
+    For each of `n_rows` randomly chosen rows, `n_projections` Rademacher vectors
+    `v` supported on the `x_index` columns are drawn, and `J v` is computed in
+    forward mode. Since `E[(J v)^2] = sum_j J_j^2`, the squared projections give an
+    unbiased estimate of the squared Jacobian, independently of `len(y_index)`.
+
+    Args:
+        model (tf.keras.Model): The TensorFlow model for which to compute the Jacobian.
+            It should return a tuple of the output and the augmented output.
+        x (tf.Tensor): The input tensor(s) to the model.
+        x_index (int or List[int]): The index or indices of the input variable(s)
+                                    to compute the Jacobian with respect to.
+        y_index (int or List[int]): The index or indices of the augmented output
+                                    variable(s) to compute the Jacobian with respect to.
+        n_projections (int): The number of random projections per row.
+        n_rows (int, optional): The number of rows of the batch to use. Defaults to
+                                None, i.e., all rows.
+
+    Returns:
+        Tuple[tf.Tensor, tf.Tensor]: A tuple containing the output of the model and the
+                                     projected Jacobian with shape
+                                     (n_rows * n_projections, len(y_index)).
+    """
+    x_index = _index_list(x_index)
+    y_index = _index_list(y_index)
+    batch_size = tf.shape(x)[0]
+    if n_rows is None:
+        order = None
+        n_sub = batch_size
+    else:
+        # the chosen rows come first, so the output of the whole batch is taken
+        # from the same pass as the projections
+        order = tf.random.shuffle(tf.range(batch_size))
+        x = tf.gather(x, order)
+        n_sub = tf.minimum(n_rows, batch_size)
+    x_all = tf.concat([x, tf.tile(x[:n_sub], [n_projections - 1, 1])], 0)
+    v = tf.random.uniform(
+        [n_sub * n_projections, len(x_index)], maxval=2, dtype=tf.int32
+    )
+    v = tf.cast(2 * v - 1, x.dtype)
+    tangents = tf.matmul(v, tf.one_hot(x_index, x.shape[-1], dtype=x.dtype))
+    # the rows of the batch that are not chosen carry no tangent
+    tangents = tf.concat(
+        [
+            tangents[:n_sub],
+            tf.zeros([batch_size - n_sub, x.shape[-1]], x.dtype),
+            tangents[n_sub:],
+        ],
+        0,
+    )
+    with tf.autodiff.ForwardAccumulator(x_all, tangents) as acc:
+        y, layer_ = model(x_all)
         ls = tf.gather(layer_, y_index, axis=-1)
-    dls_dx = tape.batch_jacobian(ls, x)
-    dls_dxs = tf.gather(dls_dx, x_index, axis=-1)
-    return y, dls_dxs
+    dls_dvs = acc.jvp(ls)
+    dls_dvs = tf.concat([dls_dvs[:n_sub], dls_dvs[batch_size:]], 0)
+    y = y[:batch_size]
+    if order is not None:
+        y = tf.gather(y, tf.math.invert_permutation(order))
+    return y, dls_dvs
 
 
-def compute_output_and_grad(model, x, x_index, y_index):
+def compute_output_and_grad(model, x, x_index, y_index, mode="auto"):
     """
     Computes the output of a model and the Jacobian matrix.
 
+    In `reverse` mode, a single `batch_jacobian` of the requested outputs is taken.
+    In `forward` mode, one-hot tangents on the requested inputs are pushed through
+    the model in a single pass over a tiled input. A forward tangent costs about
+    twice a reverse sweep, so `auto` picks `forward` when there are at least twice
+    as many requested outputs as inputs, and `reverse` otherwise, see
+    `benchmarks/jacobian_modes.py`.
+
     Args:
         model (tf.keras.Model): The TensorFlow model for which to compute the Jacobian.
         x (tf.Tensor): The input tensor(s) to the model.
@@ -215,20 +374,66 @@ def compute_output_and_grad(model, x, x_index, y_index):
                                     compute the Jacobian with respect to.
         y_index (int or List[int]): The index or indices of the output variable(s) to
                                     compute the Jacobian with respect to.
+        mode (str): `forward`, `reverse` or `auto`. Defaults to `auto`.
 
     Returns:
         Tuple[tf.Tensor, tf.Tensor]: A tuple containing the output of the model and the Jacobian matrix.
     """
-    ys_list = []
-    with tf.GradientTape(persistent=True) as tape:
-        tape.watch(x)
-        y = model(x)
-        for i in y_index:
-            ys_list.append(y[:, i])
-    dys_dx = tf.stack([tape.gradient(q, x) for q in ys_list], 1)
-    dys_dxs = tf.gather(dys_dx, x_index, axis=-1)
-    del tape
-    return y, dys_dxs
+    x_index = _index_list(x_index)
+    y_index = _index_list(y_index)
+    if mode == "auto":
+        mode = "forward" if 2 * len(x_index) <= len(y_index) else "reverse"
+
+    if mode == "forward":
+
+        def model_augment(x_):
+            y_ = model(x_)
+            return y_, tf.gather(y_, y_index, axis=-1)
+
+        return _compute_output_and_forward_jacobian(model_augment, x, x_index)
+    elif mode == "reverse":
+        with tf.GradientTape() as tape:
+            tape.watch(x)
+            y = model(x)
+            ys = tf.gather(y, y_index, axis=-1)
+        dys_dx = tape.batch_jacobian(ys, x)
+        dys_dxs = tf.gather(dys_dx, x_index, axis=-1)
+        return y, dys_dxs
+    else:
+        raise ValueError(
+            "mode should be `forward`, `reverse` or `auto`, got {}".format(mode)
+        )
+
+
+def _compute_output_and_forward_jacobian(model_augment, x, x_index):
+    """
+    Computes the output of a function and the Jacobian matrix of its second output
+    in forward mode, pushing all the one-hot tangents in a single pass over a tiled
+    input.
+
+    Args:
+        model_augment (Callable): A function returning a tuple of the output and the
+                                  tensor to differentiate.
+        x (tf.Tensor): The input tensor to the function.
+        x_index (List[int]): The indices of the input variables to compute the
+                             Jacobian with respect to.
+
+    Returns:
+        Tuple[tf.Tensor, tf.Tensor]: A tuple containing the output of the function and
+                                     the Jacobian matrix.
+    """
+    x_index = _index_list(x_index)
+    n_x = len(x_index)
+    batch_size = tf.shape(x)[0]
+    x_tiled = tf.tile(x, [n_x, 1])
+    tangents = tf.repeat(
+        tf.one_hot(x_index, x.shape[-1], dtype=x.dtype), batch_size, axis=0
+    )
+    with tf.autodiff.ForwardAccumulator(x_tiled, tangents) as acc:
+        y, ls = model_augment(x_tiled)
+    dls_dxs = tf.reshape(acc.jvp(ls), [n_x, batch_size, -1])
+    dls_dxs = tf.transpose(dls_dxs, [1, 2, 0])
+    return y[:batch_size], dls_dxs
 
 
 def compute_output_and_grad_and_hessian(model, x, x_index, y_index):
@@ -259,3 +464,123 @@ def compute_output_and_grad_and_hessian(model, x, x_index, y_index):
     dys_dx2 = g.batch_jacobian(dys_dxs, x)
     dys_dxs2 = tf.gather(dys_dx2, x_index, axis=-1)
     return y, dys_dxs, dys_dxs2
+
+
+def compute_output_and_grad_and_hessian_diagonal(model, x, x_index, y_index):
+    """
+    Computes the output of a model, the Jacobian matrix, and the diagonal of the
+    Hessian matrix restricted to `x_index`.
+
+    Both derivatives are obtained with two nested forward-mode accumulators sharing
+    the same one-hot tangent, one per `x_index`, pushed through the model in a single
+    pass over a tiled input. No reverse sweep and no full Hessian is needed.
+
+    Args:
+        model (tf.keras.Model): The TensorFlow model for which to compute the derivatives.
+        x (tf.Tensor): The input tensor(s) to the model.
+        x_index (int or List[int]): The index or indices of the input variable(s) to
+                                    compute the derivatives with respect to.
+        y_index (int or List[int]): The index or indices of the output variable(s) to
+                                    compute the derivatives of.
+
+    Returns:
+        Tuple[tf.Tensor, tf.Tensor, tf.Tensor]: A tuple containing the output of the model,
+                                                the Jacobian matrix, and the diagonal of
+                                                the Hessian matrix, both with shape
+                                                (batch, len(y_index), len(x_index)).
+    """
+    x_index = _index_list(x_index)
+    y_index = _index_list(y_index)
+    n_x = len(x_index)
+    batch_size = tf.shape(x)[0]
+    x_tiled = tf.tile(x, [n_x, 1])
+    tangents = tf.repeat(
+        tf.one_hot(x_index, x.shape[-1], dtype=x.dtype), batch_size, axis=0
+    )
+    with tf.autodiff.ForwardAccumulator(x_tiled, tangents) as acc_2:
+        with tf.autodiff.ForwardAccumulator(x_tiled, tangents) as acc_1:
+            y = model(x_tiled)
+            ys = tf.gather(y, y_index, axis=-1)
+        dys_dxs = acc_1.jvp(ys)
+    dys_dxs2 = acc_2.jvp(dys_dxs)
+    return (
+        y[:batch_size],
+        _to_batch_major(dys_dxs, n_x, batch_size),
+        _to_batch_major(dys_dxs2, n_x, batch_size),
+    )
+
+
+def compute_output_and_grad_and_hvp(model, x, vector, x_index, y_index):
+    """
+    Computes the output of a model, the Jacobian matrix, and the Hessian-vector
+    product, both restricted to `x_index`.
+
+    The Jacobian is computed in forward mode with one one-hot tangent per `x_index`,
+    and the Hessian-vector product is its forward-mode derivative along `vector`, so
+    both are obtained in a single pass over an input tiled `len(x_index)` times,
+    whose cost does not depend on the input dimension nor on `len(y_index)`.
+
+    Args:
+        model (tf.keras.Model): The TensorFlow model for which to compute the derivatives.
+        x (tf.Tensor): The input tensor(s) to the model.
+        vector (tf.Tensor): The vector with shape (batch, len(x_index)).
+        x_index (int or List[int]): The index or indices of the input variable(s) to
+                                    compute the derivatives with respect to.
+        y_index (int or List[int]): The index or indices of the output variable(s) to
+                                    compute the derivatives of.
+
+    Returns:
+        Tuple[tf.Tensor, tf.Tensor, tf.Tensor]: A tuple containing the output of the model,
+                                                the Jacobian matrix, and the
+                                                Hessian-vector product, both with shape
+                                                (batch, len(y_index), len(x_index)).
+    """
+    x_index = _index_list(x_index)
+    y_index = _index_list(y_index)
+    n_x = len(x_index)
+    batch_size = tf.shape(x)[0]
+    one_hot = tf.one_hot(x_index, x.shape[-1], dtype=x.dtype)
+    x_tiled = tf.tile(x, [n_x, 1])
+    tangents = tf.repeat(one_hot, batch_size, axis=0)
+    # the vector scattered into the full input dimension, for every tiled copy
+    vector_tangents = tf.tile(tf.matmul(tf.cast(vector, x.dtype), one_hot), [n_x, 1])
+    with tf.autodiff.ForwardAccumulator(x_tiled, vector_tangents) as acc_v:
+        with tf.autodiff.ForwardAccumulator(x_tiled, tangents) as acc:
+            y = model(x_tiled)
+            ys = tf.gather(y, y_index, axis=-1)
+        dys_dxs = acc.jvp(ys)
+    hvp = acc_v.jvp(dys_dxs)
+    return (
+        y[:batch_size],
+        _to_batch_major(dys_dxs, n_x, batch_size),
+        _to_batch_major(hvp, n_x, batch_size),
+    )
+
+
+def _index_list(index):
+    """
+    Returns an index or a sequence of indices as a list of indices.
+
+    Args:
+        index (int or List[int]): The index or indices.
+
+    Returns:
+        List[int]: The indices.
+    """
+    return np.atleast_1d(index).tolist()
+
+
+def _to_batch_major(d, n_x, batch_size):
+    """
+    Reshapes derivatives computed on an input tiled once per `x_index` to the
+    batch-major layout.
+
+    Args:
+        d (tf.Tensor): Derivatives with shape (n_x * batch, n_y).
+        n_x (int): Number of tiled copies of the input.
+        batch_size (tf.Tensor): Number of rows of the input.
+
+    Returns:
+        tf.Tensor: The derivatives with shape (batch, n_y, n_x).
+    """
+    return tf.transpose(tf.reshape(d, [n_x, batch_size, -1]), [1, 2, 0])
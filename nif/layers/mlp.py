@@ -35,6 +35,7 @@ class MLP_ResNet(tf.keras.layers.Layer, tfmot.sparsity.keras.PrunableLayer):
         mixed_policy,
         **kwargs
     ):
+        kwargs.setdefault("dtype", mixed_policy)
         super(MLP_ResNet, self).__init__(**kwargs)
         self.compute_Dtype = mixed_policy.compute_dtype
         self.variable_Dtype = mixed_policy.variable_dtype
@@ -71,12 +72,8 @@ class MLP_ResNet(tf.keras.layers.Layer, tfmot.sparsity.keras.PrunableLayer):
         """
         h1 = self.L1(x)
         h2 = self.L2(h1)
-        y = self.act(x + tf.cast(h2, self.compute_Dtype))
-        return tf.cast(
-            y,
-            self.variable_Dtype,
-            name=kwargs.get("name", "MLP_ResNet") + "_output_cast",
-        )
+        # stay in the compute dtype, the next layer would cast it back anyway
+        return self.act(x + tf.cast(h2, self.compute_Dtype))
 
     def get_config(self):
         """
@@ -126,6 +123,7 @@ class MLP_SimpleShortCut(tf.keras.layers.Layer, tfmot.sparsity.keras.PrunableLay
         mixed_policy,
         **kwargs
     ):
+        kwargs.setdefault("dtype", mixed_policy)
         super(MLP_SimpleShortCut, self).__init__(**kwargs)
         self.width = width
         self.activation = activation
@@ -203,6 +201,9 @@ class EinsumLayer(tf.keras.layers.Layer):
     """
 
     def __init__(self, equation: str, **kwargs):
+        # the inputs are used in their own dtype, e.g., the reduced-precision
+        # weights generated by the parameter net are not cast back to float32
+        kwargs.setdefault("autocast", False)
         super().__init__(**kwargs)
         self.equation = equation
 
@@ -239,6 +240,7 @@ class BiasAddLayer(tf.keras.layers.Layer):
     """
 
     def __init__(self, output_dim, mixed_policy, **kwargs):
+        kwargs.setdefault("dtype", mixed_policy)
         super().__init__(**kwargs)
         self.output_dim = output_dim
         self.mixed_policy = mixed_policy
@@ -259,7 +261,7 @@ class BiasAddLayer(tf.keras.layers.Layer):
         Returns:
             tf.Tensor: The input tensor with the bias vector added to it.
         """
-        return inputs + self.last_layer_bias
+        return inputs + tf.cast(self.last_layer_bias, inputs.dtype)
 
     def get_config(self):
         """
@@ -276,3 +278,119 @@ class BiasAddLayer(tf.keras.layers.Layer):
             }
         )
         return config
+
+
+class MultiHeadDense(tf.keras.layers.Layer, tfmot.sparsity.keras.PrunableLayer):
+    """
+    A linear layer with one kernel and bias per head, where each sample selects its
+    own head, e.g., the subdomain of a point in a domain decomposition.
+
+    Usage:
+        y = MultiHeadDense(units, num_heads, mixed_policy=policy)((x, head))
+
+    Args:
+        units (int): The dimensionality of the output space.
+        num_heads (int): The number of heads.
+        kernel_initializer (str): The initializer of the kernels, applied to the
+            tensor of all kernels with shape (num_heads, input_dim, units).
+        bias_initializer (str): The initializer of the biases.
+        kernel_regularizer (str): The regularizer of the kernels.
+        bias_regularizer (str): The regularizer of the biases.
+        mixed_policy (tf.keras.mixed_precision.Policy): The policy to use for
+            mixed-precision training.
+        **kwargs: Additional keyword arguments to pass to the base class constructor.
+    """
+
+    def __init__(
+        self,
+        units,
+        num_heads,
+        kernel_initializer="glorot_uniform",
+        bias_initializer="zeros",
+        kernel_regularizer=None,
+        bias_regularizer=None,
+        mixed_policy=tf.keras.mixed_precision.Policy("float32"),
+        **kwargs
+    ):
+        kwargs.setdefault("dtype", mixed_policy)
+        super(MultiHeadDense, self).__init__(**kwargs)
+        self.units = units
+        self.num_heads = num_heads
+        self.kernel_initializer = tf.keras.initializers.get(kernel_initializer)
+        self.bias_initializer = tf.keras.initializers.get(bias_initializer)
+        self.kernel_regularizer = tf.keras.regularizers.get(kernel_regularizer)
+        self.bias_regularizer = tf.keras.regularizers.get(bias_regularizer)
+
+    def build(self, input_shape):
+        """
+        Creates the kernels and biases of all heads.
+
+        Args:
+            input_shape (tuple): The shapes of the input tensor and of the heads.
+        """
+        self.kernel = self.add_weight(
+            "kernel",
+            shape=(self.num_heads, int(input_shape[0][-1]), self.units),
+            initializer=self.kernel_initializer,
+            regularizer=self.kernel_regularizer,
+        )
+        self.bias = self.add_weight(
+            "bias",
+            shape=(self.num_heads, self.units),
+            initializer=self.bias_initializer,
+            regularizer=self.bias_regularizer,
+        )
+        super(MultiHeadDense, self).build(input_shape)
+
+    def call(self, inputs, **kwargs):
+        """
+        Applies the head of each sample to it.
+
+        Args:
+            inputs (tuple): The input tensor with shape (batch_size, input_dim) and
+                the integer head of each sample with shape (batch_size,).
+
+        Returns:
+            tf.Tensor: The output tensor with shape (batch_size, units).
+        """
+        x, head = inputs
+        kernel = tf.cast(tf.gather(self.kernel, head), x.dtype)
+        bias = tf.cast(tf.gather(self.bias, head), x.dtype)
+        return tf.einsum("ai,aij->aj", x, kernel) + bias
+
+    def get_prunable_weights(self):
+        """
+        Returns the weights of the layer that can be pruned.
+
+        Returns:
+            list: The kernels of all heads.
+        """
+        return [self.kernel]
+
+    def get_config(self):
+        """
+        Returns the configuration of the layer.
+
+        Returns:
+            dict: A dictionary containing the configuration of the layer.
+        """
+        config = super().get_config()
+        config.update(
+            {
+                "units": self.units,
+                "num_heads": self.num_heads,
+                "kernel_initializer": tf.keras.initializers.serialize(
+                    self.kernel_initializer
+                ),
+                "bias_initializer": tf.keras.initializers.serialize(
+                    self.bias_initializer
+                ),
+                "kernel_regularizer": tf.keras.regularizers.serialize(
+                    self.kernel_regularizer
+                ),
+                "bias_regularizer": tf.keras.regularizers.serialize(
+                    self.bias_regularizer
+                ),
+            }
+        )
+        return config
@@ -2,6 +2,8 @@ import numpy as np
 import tensorflow as tf
 import tensorflow_model_optimization as tfmot
 
+from nif.layers.encoding import encoded_input_dim
+
 
 def gen_hypernetwork_weights_bias_for_siren_shapenet(
     num_inputs,
@@ -14,6 +16,7 @@ def gen_hypernetwork_weights_bias_for_siren_shapenet(
     width,
     omega_0,
     variable_dtype,
+    rank=None,
 ):
     """
     Generates initial weights and biases for a hypernetwork for a SIREN shape network.
@@ -29,6 +32,8 @@ def gen_hypernetwork_weights_bias_for_siren_shapenet(
         width (int): Width of the hidden layers.
         omega_0 (float): Frequency scale factor.
         variable_dtype: Data type for the variables.
+        rank (int): Rank of the hidden weights of the shape network, which are then
+            generated as the factors `u` and `v` of `u @ v`. Defaults to None.
 
     Returns:
         Tuple containing the initial weights and biases.
@@ -39,11 +44,15 @@ def gen_hypernetwork_weights_bias_for_siren_shapenet(
         np.sqrt(6.0 / num_inputs) * weight_factor,
     )
 
+    hidden_scale = np.sqrt(6.0 / width) / omega_0
+    if rank is not None:
+        # var(u @ v) = rank * var(u) * var(v) matches a full hidden weight
+        hidden_scale = np.sqrt(hidden_scale * np.sqrt(3.0 / rank))
     scale_matrix = np.ones((num_outputs), dtype=variable_dtype)
     scale_matrix[:num_weight_first] /= input_dim  # 1st layer weights
-    scale_matrix[num_weight_first : num_weight_first + num_weight_hidden] *= (
-        np.sqrt(6.0 / width) / omega_0
-    )  # hidden layer weights
+    scale_matrix[
+        num_weight_first : num_weight_first + num_weight_hidden
+    ] *= hidden_scale  # hidden layer weights
     scale_matrix[
         num_weight_first
         + num_weight_hidden : num_weight_first
@@ -63,6 +72,37 @@ def gen_hypernetwork_weights_bias_for_siren_shapenet(
     return w_init, b_init
 
 
+def gen_factorized_hypernetwork_weights(
+    num_inputs, num_outputs, weight_factor, rank, num_blocks=1
+):
+    """
+    Generates the initial factors `u` and `v` of a low-rank hypernetwork kernel, such
+    that the entries of `u @ v` have the same variance as the dense kernel from
+    `gen_hypernetwork_weights_bias_for_siren_shapenet`.
+
+    Args:
+        num_inputs (int): Number of inputs to the network.
+        num_outputs (int): Number of outputs of the hypernetwork.
+        weight_factor (float): Scaling factor for the weight initialization.
+        rank (int): Rank of the factorization of each block.
+        num_blocks (int): Number of diagonal blocks of `v`. Defaults to 1.
+
+    Returns:
+        Tuple containing `u` of shape (num_inputs, num_blocks * rank) and `v` of shape
+        (rank, num_outputs).
+    """
+    # var(u) = 1 / rank, so that var(u @ v) = rank * var(u) * var(v) = var(v)
+    u_init = tf.random.uniform(
+        (num_inputs, num_blocks * rank), -np.sqrt(3.0 / rank), np.sqrt(3.0 / rank)
+    )
+    v_init = tf.random.uniform(
+        (rank, num_outputs),
+        -np.sqrt(6.0 / num_inputs) * weight_factor,
+        np.sqrt(6.0 / num_inputs) * weight_factor,
+    )
+    return u_init, v_init
+
+
 def compute_number_of_weightbias_by_its_position_for_shapenet(cfg_shape_net):
     """
     Computes the number of weights and biases for each position in the shape network.
@@ -75,17 +115,20 @@ def compute_number_of_weightbias_by_its_position_for_shapenet(cfg_shape_net):
                weights for the hidden layers,
         and the number of weights for the output layer.
     """
-    si_dim = cfg_shape_net["input_dim"]
+    si_dim = encoded_input_dim(cfg_shape_net)
     so_dim = cfg_shape_net["output_dim"]
     n_sx = cfg_shape_net["units"]
     l_sx = cfg_shape_net["nlayers"]
+    rank = cfg_shape_net.get("rank", None)
+    # a low-rank hidden weight is generated as its two factors
+    num_weight_matrix = n_sx**2 if rank is None else 2 * n_sx * rank
 
     if cfg_shape_net["connectivity"] == "full":
         num_weight_first = si_dim * n_sx
         if cfg_shape_net["use_resblock"]:
-            num_weight_hidden = (2 * l_sx) * n_sx**2
+            num_weight_hidden = (2 * l_sx) * num_weight_matrix
         else:
-            num_weight_hidden = l_sx * n_sx**2
+            num_weight_hidden = l_sx * num_weight_matrix
     elif cfg_shape_net["connectivity"] == "last":
         num_weight_first = 0
         num_weight_hidden = 0
@@ -116,6 +159,8 @@ class SIREN(tf.keras.layers.Layer, tfmot.sparsity.keras.PrunableLayer):
             bias vector.
         mixed_policy (tf.keras.mixed_precision.Policy): A mixed precision policy used for the
             weights and biases.
+        recompute (bool): Whether to recompute the activations during backpropagation
+            instead of storing them. Defaults to False.
         **kwargs: Additional arguments.
 
     Attributes:
@@ -141,6 +186,7 @@ class SIREN(tf.keras.layers.Layer, tfmot.sparsity.keras.PrunableLayer):
         kernel_regularizer=None,
         bias_regularizer=None,
         mixed_policy=tf.keras.mixed_precision.Policy("float32"),
+        recompute=False,
         **kwargs
     ):
         """
@@ -158,10 +204,15 @@ class SIREN(tf.keras.layers.Layer, tfmot.sparsity.keras.PrunableLayer):
             bias_regularizer (Optional[tf.keras.regularizers.Regularizer]): Regularizer function applied
                 to the bias weights.
             mixed_policy (tf.keras.mixed_precision.Policy): Policy for mixed precision training.
+            recompute (bool): Whether to wrap the forward pass in `tf.recompute_grad`, so
+                the activations are recomputed during backpropagation instead of being
+                stored. Defaults to False.
             **kwargs: Additional keyword arguments.
 
         """
+        kwargs.setdefault("dtype", mixed_policy)
         super(SIREN, self).__init__(**kwargs)
+        self.recompute = recompute
         # self.num_inputs = num_inputs
         # self.num_outputs = num_outputs
         self.layer_position = layer_position
@@ -233,10 +284,11 @@ class SIREN(tf.keras.layers.Layer, tfmot.sparsity.keras.PrunableLayer):
                 num_weight_first=num_weight_first,
                 num_weight_hidden=num_weight_hidden,
                 num_weight_last=num_weight_last,
-                input_dim=cfg_shape_net["input_dim"],
+                input_dim=encoded_input_dim(cfg_shape_net),
                 width=cfg_shape_net["units"],
                 omega_0=self.omega_0,
                 variable_dtype=variable_Dtype,
+                rank=cfg_shape_net.get("rank", None),
             )
 
         else:
@@ -253,6 +305,12 @@ class SIREN(tf.keras.layers.Layer, tfmot.sparsity.keras.PrunableLayer):
             b_init, dtype=variable_Dtype, name=kwargs.get("name", "siren") + "_b"
         )
 
+        # weight regularization is evaluated once per step, not at every call
+        if self.kernel_regularizer is not None:
+            self.add_loss(lambda: self.kernel_regularizer(self.w))
+        if self.bias_regularizer is not None:
+            self.add_loss(lambda: self.bias_regularizer(self.b))
+
     def call(self, x, **kwargs):
         """
         Compute the output of the layer given an input tensor x.
@@ -263,20 +321,33 @@ class SIREN(tf.keras.layers.Layer, tfmot.sparsity.keras.PrunableLayer):
         Returns:
             tf.Tensor: Output tensor of shape (batch_size, output_dim).
         """
-        if self.kernel_regularizer is not None:
-            self.add_loss(self.kernel_regularizer(self.w))
-        if self.bias_regularizer is not None:
-            self.add_loss(self.bias_regularizer(self.b))
+        if self.recompute:
+            return tf.recompute_grad(self._forward)(x)
+        return self._forward(x)
+
+    def _forward(self, x):
+        """
+        Computes the output of the layer.
 
+        Args:
+            x (tf.Tensor): Input tensor of shape (batch_size, input_dim).
+
+        Returns:
+            tf.Tensor: Output tensor of shape (batch_size, output_dim).
+        """
         if self.layer_position == "last" or self.layer_position == "bottleneck":
-            y = tf.matmul(x, tf.cast(self.w, self.compute_Dtype)) + tf.cast(
-                self.b, self.compute_Dtype
+            y = tf.nn.bias_add(
+                tf.matmul(x, tf.cast(self.w, self.compute_Dtype)),
+                tf.cast(self.b, self.compute_Dtype),
             )
         else:
+            # omega_0 scales the (num_inputs, num_outputs) kernel rather than the
+            # (batch, num_outputs) matmul output
             y = tf.math.sin(
-                tf.cast(self.omega_0, self.compute_Dtype)
-                * tf.matmul(x, tf.cast(self.w, self.compute_Dtype))
-                + tf.cast(self.b, self.compute_Dtype)
+                tf.nn.bias_add(
+                    tf.matmul(x, tf.cast(self.omega_0 * self.w, self.compute_Dtype)),
+                    tf.cast(self.b, self.compute_Dtype),
+                )
             )
         return y
 
@@ -291,6 +362,7 @@ class SIREN(tf.keras.layers.Layer, tfmot.sparsity.keras.PrunableLayer):
             {
                 "layer_position": self.layer_position,
                 "omega_0": self.omega_0,
+                "recompute": self.recompute,
             }
         )
         return config
@@ -318,6 +390,8 @@ class SIREN_ResNet(SIREN):
             applied to the layer's biases.
         mixed_policy (tf.keras.mixed_precision.Policy): Policy to use for mixed
             precision computation. Defaults to "float32".
+        recompute (bool): Whether to recompute the activations during backpropagation
+            instead of storing them. Defaults to False.
         **kwargs: Additional keyword arguments to pass to the parent class constructor.
 
     Attributes:
@@ -340,6 +414,7 @@ class SIREN_ResNet(SIREN):
         kernel_regularizer=None,
         bias_regularizer=None,
         mixed_policy=tf.keras.mixed_precision.Policy("float32"),
+        recompute=False,
         **kwargs
     ):
         """
@@ -355,6 +430,8 @@ class SIREN_ResNet(SIREN):
                 applied to the layer's biases.
             mixed_policy (tf.keras.mixed_precision.Policy): Policy to use for mixed
                 precision computation. Defaults to "float32".
+            recompute (bool): Whether to wrap the forward pass in `tf.recompute_grad`.
+                Defaults to False.
             **kwargs: Additional keyword arguments to pass to the parent class constructor.
         """
         super(SIREN_ResNet, self).__init__(
@@ -365,6 +442,7 @@ class SIREN_ResNet(SIREN):
             kernel_regularizer=kernel_regularizer,
             bias_regularizer=bias_regularizer,
             mixed_policy=mixed_policy,
+            recompute=recompute,
             **kwargs
         )
         self.w2 = tf.Variable(
@@ -378,6 +456,11 @@ class SIREN_ResNet(SIREN):
             name=kwargs.get("name", "siren_ResNet") + "_b2",
         )
 
+        if self.kernel_regularizer is not None:
+            self.add_loss(lambda: self.kernel_regularizer(self.w2))
+        if self.bias_regularizer is not None:
+            self.add_loss(lambda: self.bias_regularizer(self.b2))
+
     def call(self, x, training=None, mask=None):
         """
         Performs a forward pass through the layer.
@@ -390,22 +473,34 @@ class SIREN_ResNet(SIREN):
         Returns:
             The output tensor of the layer.
         """
-        if self.kernel_regularizer is not None:
-            self.add_loss(self.kernel_regularizer(self.w))
-            self.add_loss(self.kernel_regularizer(self.w2))
-        if self.bias_regularizer is not None:
-            self.add_loss(self.bias_regularizer(self.b))
-            self.add_loss(self.bias_regularizer(self.b2))
+        if self.recompute:
+            return tf.recompute_grad(self._forward)(x)
+        return self._forward(x)
+
+    def _forward(self, x):
+        """
+        Computes the output of the residual block.
+
+        Args:
+            x (tf.Tensor): Input tensor.
 
+        Returns:
+            The output tensor of the layer.
+        """
+        # omega_0 scales the kernels rather than the matmul outputs, see SIREN
         h = tf.math.sin(
-            self.omega_0 * tf.matmul(x, tf.cast(self.w, self.compute_Dtype))
-            + tf.cast(self.b, self.compute_Dtype)
+            tf.nn.bias_add(
+                tf.matmul(x, tf.cast(self.omega_0 * self.w, self.compute_Dtype)),
+                tf.cast(self.b, self.compute_Dtype),
+            )
         )
         return 0.5 * (
             x
             + tf.math.sin(
-                self.omega_0 * tf.matmul(h, tf.cast(self.w2, self.compute_Dtype))
-                + tf.cast(self.b2, self.compute_Dtype)
+                tf.nn.bias_add(
+                    tf.matmul(h, tf.cast(self.omega_0 * self.w2, self.compute_Dtype)),
+                    tf.cast(self.b2, self.compute_Dtype),
+                )
             )
         )
 
@@ -429,7 +524,16 @@ class HyperLinearForSIREN(tf.keras.layers.Layer, tfmot.sparsity.keras.PrunableLa
         num_outputs (int): Number of output units.
         cfg_shape_net (dict): Configuration dictionary of the shape network.
         mixed_policy (tf.keras.mixed_precision.Policy): Policy for mixed precision computation.
-        connectivity (str): Connectivity type of the SIREN layer. Should be set to `full` or `last_layer`.
+        connectivity (str): Connectivity type of the SIREN layer. Should be set to `full`, `last_layer`
+            or `film`. For `film`, the outputs are the scales followed by the shifts of the
+            shape net layers, initialized around one and zero.
+        rank (int): If given, the kernel is factorized as `u @ v` with `u` of shape
+            (num_inputs, rank) and `v` of shape (rank, num_outputs). Defaults to None,
+            i.e., a dense kernel.
+        block_diagonal (bool): Only used with `rank`. If True, each shape net layer
+            gets its own rank `rank` factorization, i.e., `v` is block diagonal with
+            one block per weight matrix of the shape net and one for all biases.
+            Defaults to False.
         kernel_regularizer (tf.keras.regularizers.Regularizer): Regularizer for the kernel.
         bias_regularizer (tf.keras.regularizers.Regularizer): Regularizer for the bias.
         activity_regularizer (tf.keras.regularizers.Regularizer): Regularizer for the layer activity.
@@ -439,7 +543,9 @@ class HyperLinearForSIREN(tf.keras.layers.Layer, tfmot.sparsity.keras.PrunableLa
         kernel_regularizer (tf.keras.regularizers.Regularizer): Regularizer for the kernel.
         bias_regularizer (tf.keras.regularizers.Regularizer): Regularizer for the bias.
         compute_Dtype (tf.dtypes.DType): Data type for computation.
-        w (tf.Variable): Variable for the weights.
+        w (tf.Variable): Variable for the weights, only for a dense kernel.
+        u (tf.Variable): Left factor of the kernel, only with `rank`.
+        v (tf.Variable): Right factor of the kernel, only with `rank`.
         b (tf.Variable): Variable for the biases.
 
     Methods:
@@ -459,11 +565,14 @@ class HyperLinearForSIREN(tf.keras.layers.Layer, tfmot.sparsity.keras.PrunableLa
         kernel_regularizer=None,
         bias_regularizer=None,
         activity_regularizer=None,
+        rank=None,
+        block_diagonal=False,
         **kwargs
     ):
         """
         Initializes the `HyperLinearForSIREN` class.
         """
+        kwargs.setdefault("dtype", mixed_policy)
         super(HyperLinearForSIREN, self).__init__(
             activity_regularizer=activity_regularizer, **kwargs
         )
@@ -484,8 +593,12 @@ class HyperLinearForSIREN(tf.keras.layers.Layer, tfmot.sparsity.keras.PrunableLa
             ) = compute_number_of_weightbias_by_its_position_for_shapenet(cfg_shape_net)
         elif connectivity == "last_layer":
             num_weight_first, num_weight_hidden, num_weight_last = 0, 0, num_outputs
+        elif connectivity == "film":
+            num_weight_first, num_weight_hidden, num_weight_last = 0, 0, 0
         else:
-            raise ValueError("connectivity should be set to `full` or `last_layer`")
+            raise ValueError(
+                "connectivity should be set to `full`, `last_layer` or `film`"
+            )
 
         w_init, b_init = gen_hypernetwork_weights_bias_for_siren_shapenet(
             num_inputs=num_inputs,
@@ -494,32 +607,82 @@ class HyperLinearForSIREN(tf.keras.layers.Layer, tfmot.sparsity.keras.PrunableLa
             num_weight_first=num_weight_first,
             num_weight_hidden=num_weight_hidden,
             num_weight_last=num_weight_last,
-            input_dim=cfg_shape_net["input_dim"],
+            input_dim=encoded_input_dim(cfg_shape_net),
             width=cfg_shape_net["units"],
             omega_0=cfg_shape_net["omega_0"],
             variable_dtype=mixed_policy.variable_dtype,
+            rank=cfg_shape_net.get("rank", None),
         )
+        if connectivity == "film":
+            # unit scales and zero shifts, i.e., the shared shape net is not modulated
+            b_init = tf.concat(
+                [
+                    tf.ones(num_outputs // 2, mixed_policy.variable_dtype),
+                    tf.zeros(
+                        num_outputs - num_outputs // 2, mixed_policy.variable_dtype
+                    ),
+                ],
+                0,
+            )
 
-        self.w = tf.Variable(
-            w_init,
-            mixed_policy.variable_dtype,
-            name=kwargs.get("name", "hyper_siren") + "_w",
-        )
-        self.b = tf.Variable(
-            b_init,
-            mixed_policy.variable_dtype,
-            name=kwargs.get("name", "hyper_siren") + "_b",
-        )
+        self.rank = rank
+        self.block_diagonal = block_diagonal
+        name = kwargs.get("name", "hyper_siren")
+        if rank is None:
+            self.w = tf.Variable(w_init, mixed_policy.variable_dtype, name=name + "_w")
+            kernels = [self.w]
+        else:
+            # one block per weight matrix of the shape net and one for all biases
+            if block_diagonal and connectivity == "full":
+                n_matrix = cfg_shape_net["nlayers"]
+                if cfg_shape_net["use_resblock"]:
+                    n_matrix *= 2
+                num_bias = (
+                    num_outputs - num_weight_first - num_weight_hidden - num_weight_last
+                )
+                self.block_sizes = (
+                    [num_weight_first]
+                    + [num_weight_hidden // n_matrix] * n_matrix
+                    + [num_weight_last, num_bias]
+                )
+            else:
+                self.block_sizes = [num_outputs]
+            u_init, v_init = gen_factorized_hypernetwork_weights(
+                num_inputs,
+                num_outputs,
+                cfg_shape_net["weight_init_factor"],
+                rank,
+                len(self.block_sizes),
+            )
+            self.u = tf.Variable(u_init, mixed_policy.variable_dtype, name=name + "_u")
+            self.v = tf.Variable(v_init, mixed_policy.variable_dtype, name=name + "_v")
+            kernels = [self.u, self.v]
+        self.b = tf.Variable(b_init, mixed_policy.variable_dtype, name=name + "_b")
 
-    def call(self, x, **kwargs):
+        # weight regularization is evaluated once per step, not at every call
         if self.kernel_regularizer is not None:
-            self.add_loss(self.kernel_regularizer(self.w))
+            for kernel in kernels:
+                self.add_loss(lambda kernel=kernel: self.kernel_regularizer(kernel))
         if self.bias_regularizer is not None:
-            self.add_loss(self.bias_regularizer(self.b))
-        y = tf.matmul(x, tf.cast(self.w, self.compute_Dtype)) + tf.cast(
-            self.b, self.compute_Dtype
-        )
-        return y
+            self.add_loss(lambda: self.bias_regularizer(self.b))
+
+    def call(self, x, **kwargs):
+        if self.rank is None:
+            y = tf.matmul(x, tf.cast(self.w, self.compute_Dtype))
+        elif len(self.block_sizes) == 1:
+            h = tf.matmul(x, tf.cast(self.u, self.compute_Dtype))
+            y = tf.matmul(h, tf.cast(self.v, self.compute_Dtype))
+        else:
+            h_list = tf.split(
+                tf.matmul(x, tf.cast(self.u, self.compute_Dtype)),
+                len(self.block_sizes),
+                axis=-1,
+            )
+            v_list = tf.split(
+                tf.cast(self.v, self.compute_Dtype), self.block_sizes, axis=-1
+            )
+            y = tf.concat([tf.matmul(h, v) for h, v in zip(h_list, v_list)], -1)
+        return tf.nn.bias_add(y, tf.cast(self.b, self.compute_Dtype))
 
     def get_config(self):
         config = super().get_config()
@@ -529,10 +692,14 @@ class HyperLinearForSIREN(tf.keras.layers.Layer, tfmot.sparsity.keras.PrunableLa
                 # "num_outputs": self.num_outputs,
                 # "mixed_policy": self.mixed_policy,
                 # "connectivity": self.connectivity
+                "rank": self.rank,
+                "block_diagonal": self.block_diagonal,
             }
         )
         return config
 
     def get_prunable_weights(self):
         # Prune bias also, though that usually harms model accuracy too much.
-        return [self.w]
+        if self.rank is None:
+            return [self.w]
+        return [self.u, self.v]
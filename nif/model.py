@@ -26,23 +26,136 @@ modules, including tf.keras, tf.keras.layers, tf.keras.regularizers, tf.initiali
 and tf.cast.
 """
 
-__all__ = ["NIFMultiScale", "NIF", "NIFMultiScaleLastLayerParameterized"]
-
+__all__ = [
+    "NIFMultiScale",
+    "NIF",
+    "NIFMultiScaleLastLayerParameterized",
+    "NIFMultiScaleFiLM",
+    "NIFMultiScaleDomainDecomposition",
+    "NIFModel",
+]
+
+import collections
 import json
 
+import numpy as np
 import tensorflow as tf
 from tensorflow.keras import Model, initializers
 from tensorflow.keras import regularizers
 
 from .layers import Dense
 from .layers import EinsumLayer
+from .layers import HashGridEncoding
 from .layers import HyperLinearForSIREN
 from .layers import JacRegLatentLayer
 from .layers import MLP_ResNet
 from .layers import MLP_SimpleShortCut
+from .layers import MultiHeadDense
 from .layers import SIREN
 from .layers import SIREN_ResNet
 from .layers import BiasAddLayer
+from .layers.encoding import encoded_input_dim
+
+# per-point low-rank weight `u @ v` with shapes (batch, n_in, rank) and
+# (batch, rank, n_out), see `NIF._reshape_hidden_weight`
+LowRankWeight = collections.namedtuple("LowRankWeight", ["u", "v"])
+
+# parameter network output given by the latent and the last parameter network layer,
+# applied inside the recomputed shape network blocks, see `NIF._recompute_block`
+LatentPnetOutput = collections.namedtuple("LatentPnetOutput", ["latent", "layer"])
+
+
+def _split_weight(w):
+    """
+    Returns the tensors of a per-point weight, e.g., to pass them to a block.
+    """
+    return tuple(w) if isinstance(w, LowRankWeight) else (w,)
+
+
+def _join_weight(tensors):
+    """
+    Rebuilds a per-point weight from the tensors given by `_split_weight`.
+    """
+    return LowRankWeight(*tensors) if len(tensors) == 2 else tensors[0]
+
+
+class _RecomputedBlock(tf.keras.layers.Layer):
+    """
+    A shape network block that generates its per-point weights from the latent with
+    the kernel and bias columns of the last parameter network layer, inside
+    `tf.recompute_grad`, see `NIF._recompute_block`.
+    """
+
+    def __init__(self, fn, select, last_layer, **kwargs):
+        super().__init__(**kwargs)
+        self.select = select
+        self.last_layer = last_layer
+
+        def generate_and_call(x, latent, *columns):
+            n = len(columns) // 2
+            weights = [
+                tf.tensordot(latent, kernel, 1) + bias
+                for kernel, bias in zip(columns[:n], columns[n:])
+            ]
+            return fn(x, *weights)
+
+        self.recompute_fn = tf.recompute_grad(generate_and_call)
+
+    def build(self, input_shape):
+        if not self.last_layer.built:
+            self.last_layer.build(input_shape[1])
+        super().build(input_shape)
+
+    def call(self, inputs):
+        x, latent = inputs
+        if isinstance(self.last_layer, HyperLinearForSIREN):
+            kernel, bias = self.last_layer.w, self.last_layer.b
+        else:
+            kernel, bias = self.last_layer.kernel, self.last_layer.bias
+        # the columns of the block, with the latent, or a broadcast, as batch axis
+        kernel = self.select(tf.cast(kernel, latent.dtype))
+        bias = self.select(tf.cast(bias, latent.dtype)[tf.newaxis])
+        return self.recompute_fn(x, latent, *kernel, *bias)
+
+
+class NIFModel(Model):
+    """
+    The functional Keras model returned by `NIF.build()` and `NIF.model()`.
+
+    It only differs from `tf.keras.Model` at compile time: if any layer computes in
+    float16, e.g., with `mixed_policy="mixed_float16"`, the optimizer is wrapped in
+    a `LossScaleOptimizer`, so the loss is scaled dynamically to avoid underflow in
+    the gradients. The training step is the default one of Keras.
+
+    Usage:
+    model = NIFMultiScale(
+        cfg_shape_net, cfg_parameter_net, mixed_policy="mixed_float16"
+    ).build()
+    model.compile(optimizer, loss="mse")
+    model.fit(...)
+    """
+
+    def compile(self, optimizer="rmsprop", *args, **kwargs):
+        """
+        Configures the model for training, see `tf.keras.Model.compile`.
+
+        Args:
+            optimizer (str or tf.keras.optimizers.Optimizer): The optimizer.
+                Defaults to "rmsprop".
+            *args: Additional arguments of `tf.keras.Model.compile`.
+            **kwargs: Additional keyword arguments of `tf.keras.Model.compile`.
+        """
+        optimizer = tf.keras.optimizers.get(optimizer)
+        uses_float16 = any(
+            layer_.dtype_policy.compute_dtype == "float16"
+            for layer_ in self.submodules
+            if isinstance(layer_, tf.keras.layers.Layer)
+        )
+        if uses_float16 and not isinstance(
+            optimizer, tf.keras.mixed_precision.LossScaleOptimizer
+        ):
+            optimizer = tf.keras.mixed_precision.LossScaleOptimizer(optimizer)
+        super().compile(optimizer, *args, **kwargs)
 
 
 class NIF(object):
@@ -59,6 +172,8 @@ class NIF(object):
         call(self, inputs, training=None, mask=None): Forward pass for the NIF model.
         build(self): Builds and returns the NIF model with a Jacobian regularization layer.
         model(self): Builds and returns the NIF model.
+        model_with_spatial_derivatives(self, order=1): Builds and returns the NIF model
+            that also outputs the spatial Jacobian and optionally the Laplacian.
         model_p_to_w(self): Builds and returns a model that maps input parameters to weights and
             biases of the shape net.
         model_p_to_lr(self): Builds and returns a model that maps input parameters to the hidden
@@ -67,9 +182,15 @@ class NIF(object):
             to shape net weights and biases.
         model_x_to_u_given_w(self): Builds and returns a model that maps input states to output,
             given shape net weights and biases.
+        sensitivity(self, params, points, chunk_size=65536): Streams the parametric
+            sensitivity field du/dp over a set of points.
         save_config(self, filename="config.json"): Saves the NIF configuration to a JSON file.
     """
 
+    # whether `cfg_shape_net["recompute"]` applies the last parameter network layer
+    # inside the recomputed shape network blocks, see `_pnet_output_from_latent`
+    _recompute_pnet = True
+
     def __init__(self, cfg_shape_net, cfg_parameter_net, mixed_policy="float32"):
         """
         Initializes the NIF object with the given configurations and mixed precision policy.
@@ -82,9 +203,11 @@ class NIF(object):
         super(NIF, self).__init__()
         self.cfg_shape_net = cfg_shape_net
         self.si_dim = cfg_shape_net["input_dim"]
+        self.se_dim = encoded_input_dim(cfg_shape_net)
         self.so_dim = cfg_shape_net["output_dim"]
         self.n_sx = cfg_shape_net["units"]
         self.l_sx = cfg_shape_net["nlayers"]
+        self.s_rank = cfg_shape_net.get("rank", None)
         self.pi_dim = cfg_parameter_net["input_dim"]
         self.pi_hidden = cfg_parameter_net["latent_dim"]
         self.n_st = cfg_parameter_net["units"]
@@ -93,6 +216,8 @@ class NIF(object):
         # additional regularization
         self.cfg_parameter_net = cfg_parameter_net
         self.p_jac_reg = cfg_parameter_net.get("jac_reg", None)
+        self.p_jac_reg_projections = cfg_parameter_net.get("jac_reg_projections", None)
+        self.p_jac_reg_rows = cfg_parameter_net.get("jac_reg_rows", None)
         self.p_l1_reg = cfg_parameter_net.get("l1_reg", None)
         self.p_l2_reg = cfg_parameter_net.get("l2_reg", None)
         self.p_act_l1_reg = cfg_parameter_net.get("act_l1_reg", None)
@@ -126,6 +251,8 @@ class NIF(object):
 
         # finally initialize the parameter net structure
         self.pnet_list = self._initialize_pnet(cfg_parameter_net, cfg_shape_net)
+        self.snet_base_list = self._initialize_snet_base(cfg_shape_net)
+        self.encoding = self._initialize_encoding(cfg_shape_net)
 
     def call(self, inputs, training=None, mask=None):
         """
@@ -141,16 +268,64 @@ class NIF(object):
         """
         input_p = inputs[:, 0 : self.pi_dim]
         input_s = inputs[:, self.pi_dim : self.pi_dim + self.si_dim]
-        self.pnet_output = self._call_parameter_net(input_p, self.pnet_list)[0]
+        latent = self._call_parameter_net(input_p, self.pnet_list)[1]
+        self.pnet_output = self._pnet_output_from_latent(latent)
+        return self._call_shape_net_given_pnet_output(input_s, self.pnet_output)
+
+    def _pnet_output_from_latent(self, latent):
+        """
+        Applies the last layer of the parameter network to the latent.
+
+        With `cfg_shape_net["recompute"]`, the layer is instead applied inside each
+        recomputed shape network block, to the columns of that block, so the
+        per-point weights are never kept for backpropagation, see
+        `_recompute_block`.
+
+        Args:
+            latent (tf.Tensor): The latent with shape (batch, pi_hidden).
+
+        Returns:
+            tf.Tensor or LatentPnetOutput: The parameter network output, or the
+            latent and the last layer with `cfg_shape_net["recompute"]`.
+        """
+        last_layer = self.pnet_list[-1]
+        if not (self.cfg_shape_net.get("recompute", False) and self._recompute_pnet):
+            return last_layer(latent)
+        if getattr(last_layer, "rank", None) is not None:
+            raise ValueError("`hyper_rank` does not support `recompute`")
+        if last_layer.activity_regularizer is not None:
+            raise ValueError(
+                "the activity regularization of the parameter network output "
+                "does not support `recompute`"
+            )
+        return LatentPnetOutput(latent, last_layer)
+
+    def _call_shape_net_given_pnet_output(self, input_s, pnet_output, order=0):
+        """
+        Calls the shape network of this model with the given parameter network output.
+
+        Args:
+            input_s (tf.Tensor): Input tensor for the shape network.
+            pnet_output (tf.Tensor): Output tensor of the parameter network.
+            order (int, optional): Order of the spatial derivatives propagated along
+                with the output, see `_call_shape_net`. Defaults to 0.
+
+        Returns:
+            tf.Tensor or tuple: The output tensor of the shape network, followed by
+            its spatial derivatives if `order > 0`.
+        """
         return self._call_shape_net(
-            tf.cast(input_s, self.compute_Dtype),
-            self.pnet_output,
-            si_dim=self.si_dim,
+            self._encode_input(input_s, order),
+            pnet_output,
+            si_dim=self.se_dim,
             so_dim=self.so_dim,
             n_sx=self.n_sx,
             l_sx=self.l_sx,
             activation=self.cfg_shape_net["activation"],
             variable_dtype=self.variable_Dtype,
+            order=order,
+            rank=self.s_rank,
+            base_list=self.snet_base_list,
         )
 
     def _initialize_pnet(self, cfg_parameter_net, cfg_shape_net):
@@ -167,8 +342,8 @@ class NIF(object):
         # just simple implementation of a shortcut connected parameter net with
         # a similar shapenet
         self.po_dim = (
-            (self.l_sx) * self.n_sx**2
-            + (self.si_dim + self.so_dim + 1 + self.l_sx) * self.n_sx
+            self.l_sx * self._num_hidden_weight(self.n_sx, self.s_rank)
+            + (self.se_dim + self.so_dim + 1 + self.l_sx) * self.n_sx
             + self.so_dim
         )
 
@@ -230,52 +405,259 @@ class NIF(object):
         pnet_layers_list.append(last_layer)
         return pnet_layers_list
 
+    def _initialize_snet_base(self, cfg_shape_net):
+        """
+        Initializes the shared base matrices that are added to the low-rank hidden
+        weights of the shape network if `cfg_shape_net["low_rank_base"]` is set.
+        They start at zero, so the initial shape network is the same as without.
+
+        Args:
+            cfg_shape_net (dict): Configuration dictionary for the shape network.
+
+        Returns:
+            list or None: One layer per hidden weight of the shape network, or None.
+        """
+        if not cfg_shape_net.get("low_rank_base", False):
+            return None
+        if self.s_rank is None:
+            raise ValueError("`low_rank_base` requires cfg_shape_net['rank']")
+        if cfg_shape_net.get("recompute", False):
+            raise ValueError("`low_rank_base` does not support `recompute`")
+        return [
+            self._base_layer("base_hidden_snet_{}".format(i)) for i in range(self.l_sx)
+        ]
+
+    def _initialize_encoding(self, cfg_shape_net):
+        """
+        Initializes the trainable encoding of the shape network input if
+        `cfg_shape_net["encoding"]` is given, see `nif.layers.HashGridEncoding` for
+        its keys.
+
+        Args:
+            cfg_shape_net (dict): Configuration dictionary for the shape network.
+
+        Returns:
+            HashGridEncoding or None: The encoding layer, or None.
+        """
+        cfg_encoding = cfg_shape_net.get("encoding", None)
+        if cfg_encoding is None:
+            return None
+        return HashGridEncoding(
+            self.si_dim,
+            mixed_policy=self.mixed_policy,
+            name="hash_grid_encoding_snet",
+            **cfg_encoding
+        )
+
+    def _encode_input(self, input_s, order=0):
+        """
+        Casts the shape network input to the compute dtype, or encodes it if an
+        input encoding is configured.
+
+        Args:
+            input_s (tf.Tensor): Input tensor for the shape network.
+            order (int, optional): Order of the spatial derivatives, which are not
+                available in closed form with an encoding. Defaults to 0.
+
+        Returns:
+            tf.Tensor: The input of the first shape network layer.
+        """
+        if self.encoding is None:
+            return tf.cast(input_s, self.compute_Dtype)
+        if order > 0:
+            raise NotImplementedError(
+                "closed-form spatial derivatives are not available with an input "
+                "`encoding`, use `nif.layers.JacobianLayer`"
+            )
+        return self.encoding(input_s)
+
+    def _base_layer(self, name):
+        """
+        Creates a shared base matrix of the shape network as a linear layer.
+
+        Args:
+            name (str): Name of the layer.
+
+        Returns:
+            tf.keras.layers.Layer: A linear layer of width `n_sx` without bias.
+        """
+        return Dense(
+            self.n_sx,
+            use_bias=False,
+            kernel_initializer=initializers.Zeros(),
+            dtype=self.mixed_policy,
+            name=name,
+        )
+
     @staticmethod
     def _call_shape_net(
-        input_s, pnet_output, si_dim, so_dim, n_sx, l_sx, activation, variable_dtype
+        input_s,
+        pnet_output,
+        si_dim,
+        so_dim,
+        n_sx,
+        l_sx,
+        activation,
+        variable_dtype,
+        order=0,
+        rank=None,
+        base_list=None,
     ):
         """
         Calls the shape network with the given input and parameter network output.
 
+        If `order > 0`, the spatial derivatives are propagated along with the
+        activations in the same forward pass, using the per-point weights and the
+        derivatives of the activation, without any gradient tape.
+
         Args:
             input_s (tf.Tensor): Input tensor for the shape network.
-            pnet_output (tf.Tensor): Output tensor of the parameter network.
+            pnet_output (tf.Tensor or LatentPnetOutput): Output tensor of the
+                parameter network, or the latent and the last parameter network
+                layer, to recompute each layer during backpropagation, see
+                `_recompute_block`.
             si_dim (int): Input dimension of the shape network.
             so_dim (int): Output dimension of the shape network.
             n_sx (int): Number of units in each hidden layer of the shape network.
             l_sx (int): Number of hidden layers in the shape network.
             activation (str): Activation function used in the shape network.
             variable_dtype (str): Data type for the variables in the shape network.
+            order (int, optional): 0 for the output only, 1 to also return the
+                Jacobian `du/dx` with shape (batch, so_dim, si_dim), 2 to further
+                return the Laplacian with shape (batch, so_dim). Defaults to 0.
+            rank (int, optional): Rank of the generated hidden weights, see
+                `_reshape_hidden_weight`. Defaults to None, i.e., full rank.
+            base_list (list, optional): Shared base matrices added to the hidden
+                weights, one layer per hidden layer. Defaults to None.
+
+        Returns:
+            tf.Tensor or tuple: The output tensor of the shape network, followed by
+            its spatial derivatives if `order > 0`.
+        """
+
+        def distribute(pnet_output_):
+            return NIF._distribute_pnet_output(
+                pnet_output_, si_dim, so_dim, n_sx, l_sx, rank
+            )
+
+        if base_list is None:
+            base_list = [None] * l_sx
+
+        act_fun = tf.keras.activations.get(activation)
+
+        if isinstance(pnet_output, LatentPnetOutput):
+
+            def block_weights(pnet_output_):
+                w_1, w_hidden_list, w_l, b_1, b_hidden_list, b_l = distribute(
+                    pnet_output_
+                )
+                return (
+                    [[w_1, b_1]]
+                    + [
+                        [b, *_split_weight(w)]
+                        for w, b in zip(w_hidden_list, b_hidden_list)
+                    ]
+                    + [[w_l, b_l]]
+                )
+
+            def first_layer(input_s_, w_1_, b_1_):
+                return act_fun(tf.einsum("ai,aij->aj", input_s_, w_1_) + b_1_)
+
+            def hidden_layer(u_, b_, *w_):
+                return act_fun(NIF._per_point_matmul(u_, _join_weight(w_)) + b_) + u_
+
+            def last_layer(u_, w_l_, b_l_):
+                return tf.einsum("ai,aij->aj", u_, w_l_) + b_l_
+
+            blocks = [(first_layer, "first_snet")]
+            blocks += [(hidden_layer, "hidden_snet_{}".format(i)) for i in range(l_sx)]
+            blocks += [(last_layer, "last_snet")]
+            u = input_s
+            for index, (fn, name) in enumerate(blocks):
+                u = NIF._recompute_block(
+                    fn, lambda p, index=index: block_weights(p)[index], name
+                )(u, pnet_output)
+            return tf.cast(u, variable_dtype, name="output_cast_snet")
+
+        w_1, w_hidden_list, w_l, b_1, b_hidden_list, b_l = distribute(pnet_output)
+
+        if order > 0:
+            u = NIF._input_linear_with_derivatives(input_s, w_1, b_1, order)
+            u = NIF._activation_with_derivatives(u, activation)
+            for i in range(l_sx):
+                h = NIF._linear_with_derivatives(
+                    u, w_hidden_list[i], b_hidden_list[i], base=base_list[i]
+                )
+                h = NIF._activation_with_derivatives(h, activation)
+                u = NIF._combine_with_derivatives(h, u)
+            u = NIF._linear_with_derivatives(u, w_l, b_l)
+            return NIF._cast_with_derivatives(u, variable_dtype)
+
+        # construct shape net
+        u = act_fun(
+            EinsumLayer("ai,aij->aj", name="first_einsum_snet")((input_s, w_1)) + b_1
+        )
+        # u = act_fun(tf.einsum('ai,aij->aj', input_s, w_1) + b_1)
+
+        for i in range(l_sx):
+            w_tmp = w_hidden_list[i]
+            b_tmp = b_hidden_list[i]
+            u = (
+                act_fun(
+                    NIF._per_point_matmul(
+                        u, w_tmp, base_list[i], name="hidden_einsum_snet_{}".format(i)
+                    )
+                    + b_tmp
+                )
+                + u
+            )
+            # u = act_fun(tf.einsum('ai,aij->aj', u, w_tmp) + b_tmp) + u
+        u = EinsumLayer("ai,aij->aj", name="last_einsum_snet")((u, w_l)) + b_l
+        # u = tf.einsum('ai,aij->aj', u, w_l) + b_l
+        return tf.cast(u, variable_dtype, name="output_cast_snet")
+
+    @staticmethod
+    def _distribute_pnet_output(pnet_output, si_dim, so_dim, n_sx, l_sx, rank=None):
+        """
+        Distributes the parameter network output into the weights and biases of a
+        shape network with one weight matrix per hidden layer.
+
+        Args:
+            pnet_output (tf.Tensor): Output tensor of the parameter network.
+            si_dim (int): Input dimension of the shape network.
+            so_dim (int): Output dimension of the shape network.
+            n_sx (int): Number of units in each hidden layer of the shape network.
+            l_sx (int): Number of hidden layers in the shape network.
+            rank (int, optional): Rank of the hidden weights, see
+                `_reshape_hidden_weight`. Defaults to None.
 
         Returns:
-            tf.Tensor: The output tensor of the shape network.
+            tuple: The first layer weights, the list of hidden layer weights, the last
+            layer weights, the first layer bias, the list of hidden layer biases and
+            the last layer bias.
         """
+        n_w = NIF._num_hidden_weight(n_sx, rank)
         w_1 = tf.reshape(
             pnet_output[:, : si_dim * n_sx], [-1, si_dim, n_sx], name="w_first_snet"
         )
         w_hidden_list = []
         for i in range(l_sx):
-            w_tmp = tf.reshape(
-                pnet_output[
-                    :,
-                    si_dim * n_sx + i * n_sx**2 : si_dim * n_sx + (i + 1) * n_sx**2,
-                ],
-                [-1, n_sx, n_sx],
+            w_tmp = NIF._reshape_hidden_weight(
+                pnet_output[:, si_dim * n_sx + i * n_w : si_dim * n_sx + (i + 1) * n_w],
+                n_sx,
+                rank,
                 name="w_hidden_snet_{}".format(i),
             )
             w_hidden_list.append(w_tmp)
         w_l = tf.reshape(
             pnet_output[
                 :,
-                si_dim * n_sx
-                + l_sx * n_sx**2 : si_dim * n_sx
-                + l_sx * n_sx**2
-                + so_dim * n_sx,
+                si_dim * n_sx + l_sx * n_w : si_dim * n_sx + l_sx * n_w + so_dim * n_sx,
             ],
             [-1, n_sx, so_dim],
             name="w_last_snet",
         )
-        n_weights = si_dim * n_sx + l_sx * n_sx**2 + so_dim * n_sx
+        n_weights = si_dim * n_sx + l_sx * n_w + so_dim * n_sx
 
         # distribute bias
         b_1 = tf.reshape(
@@ -298,30 +680,249 @@ class NIF(object):
             [-1, so_dim],
             name="b_last_snet",
         )
+        return w_1, w_hidden_list, w_l, b_1, b_hidden_list, b_l
 
-        # construct shape net
-        act_fun = tf.keras.activations.get(activation)
-        u = act_fun(
-            EinsumLayer("ai,aij->aj", name="first_einsum_snet")((input_s, w_1)) + b_1
+    @staticmethod
+    def _num_hidden_weight(n_sx, rank=None):
+        """
+        Returns the number of parameter network outputs for one hidden weight of the
+        shape network.
+
+        Args:
+            n_sx (int): Number of units in each hidden layer of the shape network.
+            rank (int, optional): Rank of the hidden weights. Defaults to None.
+
+        Returns:
+            int: `n_sx**2` for a full matrix, otherwise `2 * n_sx * rank`.
+        """
+        if rank is None:
+            return n_sx**2
+        return 2 * n_sx * rank
+
+    @staticmethod
+    def _reshape_hidden_weight(w_flat, n_sx, rank=None, name=None):
+        """
+        Reshapes a slice of the parameter network output into a per-point hidden
+        weight of the shape network. With `rank`, the first half of the slice is
+        `u` and the second half is `v` of the low-rank weight `u @ v`, so a hidden
+        layer costs O(n_sx * rank) instead of O(n_sx**2) per point.
+
+        Args:
+            w_flat (tf.Tensor): Slice of the parameter network output with shape
+                (batch, `_num_hidden_weight(n_sx, rank)`).
+            n_sx (int): Number of units in each hidden layer of the shape network.
+            rank (int, optional): Rank of the hidden weight. Defaults to None.
+            name (str, optional): Name of the reshaped weight. Defaults to None.
+
+        Returns:
+            tf.Tensor or LowRankWeight: The weight with shape (batch, n_sx, n_sx), or
+            its factors with shapes (batch, n_sx, rank) and (batch, rank, n_sx).
+        """
+        if rank is None:
+            return tf.reshape(w_flat, [-1, n_sx, n_sx], name=name)
+        return LowRankWeight(
+            tf.reshape(w_flat[:, : n_sx * rank], [-1, n_sx, rank], name=name + "_u"),
+            tf.reshape(w_flat[:, n_sx * rank :], [-1, rank, n_sx], name=name + "_v"),
         )
-        # u = act_fun(tf.einsum('ai,aij->aj', input_s, w_1) + b_1)
 
-        for i in range(l_sx):
-            w_tmp = w_hidden_list[i]
-            b_tmp = b_hidden_list[i]
-            u = (
-                act_fun(
-                    EinsumLayer("ai,aij->aj", name="hidden_einsum_snet_{}".format(i))(
-                        (u, w_tmp)
-                    )
-                    + b_tmp
-                )
-                + u
+    @staticmethod
+    def _per_point_matmul(u, w, base=None, name=None):
+        """
+        Multiplies the input of a hidden layer, or its Jacobian, by the per-point
+        hidden weight and the optional shared base matrix.
+
+        Args:
+            u (tf.Tensor): Input with shape (batch, n_in), or its Jacobian with shape
+                (batch, n_in, si_dim).
+            w (tf.Tensor or LowRankWeight): Per-point weight, see
+                `_reshape_hidden_weight`.
+            base (tf.keras.layers.Layer, optional): Shared base matrix. Defaults to
+                None.
+            name (str, optional): If given, the products are computed by named
+                `EinsumLayer`s. Defaults to None.
+
+        Returns:
+            tf.Tensor: The product with shape (batch, n_out), or (batch, n_out,
+            si_dim) for a Jacobian.
+        """
+
+        def einsum(equation, x, y, suffix=""):
+            if name is None:
+                return tf.einsum(equation, x, y)
+            return EinsumLayer(equation, name=name + suffix)((x, y))
+
+        k = "k" if len(u.shape) == 3 else ""
+        if isinstance(w, LowRankWeight):
+            h = einsum("ai{0},air->ar{0}".format(k), u, w.u, "_u")
+            z = einsum("ar{0},arj->aj{0}".format(k), h, w.v, "_v")
+        else:
+            z = einsum("ai{0},aij->aj{0}".format(k), u, w)
+        if base is not None:
+            if k:
+                z = z + tf.transpose(base(tf.transpose(u, [0, 2, 1])), [0, 2, 1])
+            else:
+                z = z + base(u)
+        return z
+
+    @staticmethod
+    def _recompute_block(fn, select, name):
+        """
+        Wraps a shape network block in `tf.recompute_grad`, together with the
+        generation of its per-point weights by the last parameter network layer.
+
+        Only the block input and the latent are kept for backpropagation: the
+        per-point weights of the block, i.e., its columns of the parameter network
+        output, are generated from the latent inside the block and regenerated
+        during backpropagation along with the activations. As these weights, with
+        shape (batch, po_dim) overall, dominate the memory of a training step, the
+        peak memory is set by the largest block instead, see
+        `benchmarks/recompute.py`.
+
+        Args:
+            fn (Callable): A function of the block input followed by the per-point
+                weights and biases of the block, as tensors, without any variable.
+            select (Callable): A function mapping a parameter network output, with
+                shape (batch, po_dim), to the list of the weights and biases of the
+                block, in the order of the arguments of `fn`.
+            name (str): Name of the layer.
+
+        Returns:
+            Callable: A function of the block input and the `LatentPnetOutput`.
+        """
+
+        def call(x, pnet_output):
+            layer_ = _RecomputedBlock(
+                fn, select, pnet_output.layer, name="recompute_" + name
             )
-            # u = act_fun(tf.einsum('ai,aij->aj', u, w_tmp) + b_tmp) + u
-        u = EinsumLayer("ai,aij->aj", name="last_einsum_snet")((u, w_l)) + b_l
-        # u = tf.einsum('ai,aij->aj', u, w_l) + b_l
-        return tf.cast(u, variable_dtype, name="output_cast_snet")
+            return layer_((x, pnet_output.latent))
+
+        return call
+
+    @staticmethod
+    def _input_linear_with_derivatives(input_s, w, b, order, scale=1.0):
+        """
+        Applies the first per-point linear layer and initializes the spatial
+        derivatives of its output.
+
+        Args:
+            input_s (tf.Tensor): Input tensor with shape (batch, si_dim).
+            w (tf.Tensor): Per-point weights with shape (batch, si_dim, n).
+            b (tf.Tensor): Per-point bias with shape (batch, n).
+            order (int): Order of the spatial derivatives, 1 or 2.
+            scale (float, optional): Scaling of the linear map. Defaults to 1.0.
+
+        Returns:
+            tuple: The output, its Jacobian with shape (batch, n, si_dim) and its
+            Laplacian (None if `order` is 1).
+        """
+        z = scale * tf.einsum("ai,aij->aj", input_s, w) + b
+        dz = scale * tf.transpose(w, [0, 2, 1])
+        lz = tf.zeros_like(z) if order > 1 else None
+        return z, dz, lz
+
+    @staticmethod
+    def _linear_with_derivatives(u, w, b, scale=1.0, base=None):
+        """
+        Applies a per-point linear layer to an output and its spatial derivatives.
+
+        Args:
+            u (tuple): The output, its Jacobian and its Laplacian (or None).
+            w (tf.Tensor or LowRankWeight): Per-point weights with shape
+                (batch, n_in, n_out), see `_per_point_matmul`.
+            b (tf.Tensor): Per-point bias with shape (batch, n_out).
+            scale (float, optional): Scaling of the linear map. Defaults to 1.0.
+            base (tf.keras.layers.Layer, optional): Shared base matrix added to `w`.
+                Defaults to None.
+
+        Returns:
+            tuple: The output, its Jacobian and its Laplacian (or None).
+        """
+        u, du, lu = u
+        z = scale * NIF._per_point_matmul(u, w, base) + b
+        dz = scale * NIF._per_point_matmul(du, w, base)
+        lz = None if lu is None else scale * NIF._per_point_matmul(lu, w, base)
+        return z, dz, lz
+
+    @staticmethod
+    def _activation_with_derivatives(z, activation):
+        """
+        Applies an element-wise activation to an output and its spatial derivatives
+        by the chain rule. The derivatives of `sine` and `tanh` are known in closed
+        form, other activations are differentiated element-wise in forward mode.
+
+        Args:
+            z (tuple): The pre-activation, its Jacobian and its Laplacian (or None).
+            activation (str): The activation function.
+
+        Returns:
+            tuple: The activation, its Jacobian and its Laplacian (or None).
+        """
+        z, dz, lz = z
+        if activation == "sine":
+            y = tf.math.sin(z)
+            d1 = tf.math.cos(z)
+            d2 = -y
+        elif activation == "tanh":
+            y = tf.math.tanh(z)
+            d1 = 1.0 - tf.square(y)
+            d2 = -2.0 * y * d1
+        else:
+            act_fun = tf.keras.activations.get(activation)
+
+            def act_and_derivatives(z_):
+                ones = tf.ones_like(z_)
+                with tf.autodiff.ForwardAccumulator(z_, ones) as acc_2:
+                    with tf.autodiff.ForwardAccumulator(z_, ones) as acc_1:
+                        y_ = act_fun(z_)
+                    d1_ = acc_1.jvp(y_)
+                return y_, d1_, acc_2.jvp(d1_)
+
+            # wrapped in a layer so that it can be traced in a functional model
+            y, d1, d2 = tf.keras.layers.Lambda(act_and_derivatives)(z)
+        dy = d1[..., tf.newaxis] * dz
+        ly = None
+        if lz is not None:
+            ly = d1 * lz + d2 * tf.reduce_sum(tf.square(dz), axis=-1)
+        return y, dy, ly
+
+    @staticmethod
+    def _combine_with_derivatives(u, v, alpha=1.0, beta=1.0):
+        """
+        Computes `alpha * u + beta * v` for two outputs and their spatial derivatives.
+
+        Args:
+            u (tuple): The first output, its Jacobian and its Laplacian (or None).
+            v (tuple): The second output, its Jacobian and its Laplacian (or None).
+            alpha (float, optional): Coefficient of `u`. Defaults to 1.0.
+            beta (float, optional): Coefficient of `v`. Defaults to 1.0.
+
+        Returns:
+            tuple: The combined output, its Jacobian and its Laplacian (or None).
+        """
+        return tuple(
+            None if u_ is None else alpha * u_ + beta * v_ for u_, v_ in zip(u, v)
+        )
+
+    @staticmethod
+    def _cast_with_derivatives(u, variable_dtype):
+        """
+        Casts an output and its spatial derivatives, dropping the Laplacian if it
+        was not computed.
+
+        Args:
+            u (tuple): The output, its Jacobian and its Laplacian (or None).
+            variable_dtype (str): Data type of the returned tensors.
+
+        Returns:
+            tuple: The output and its Jacobian, followed by its Laplacian if it
+            was computed.
+        """
+        names = ["output_cast_snet", "jacobian_cast_snet", "laplacian_cast_snet"]
+        return tuple(
+            tf.cast(u_, variable_dtype, name=name_)
+            for u_, name_ in zip(u, names)
+            if u_ is not None
+        )
 
     @staticmethod
     def _call_parameter_net(input_p, pnet_list):
@@ -348,31 +949,39 @@ class NIF(object):
         if specified in the configuration. Otherwise it is the same as `.model()`
 
         Returns:
-            tf.keras.Model: The NIF model with or without the Jacobian regularization layer.
+            NIFModel: The NIF model with or without the Jacobian regularization layer.
         """
         if isinstance(self.p_jac_reg, (float, int)):
             input_tot = tf.keras.layers.Input(
                 shape=(self.pi_dim + self.si_dim), name="input_tot"
             )
             input_p = input_tot[:, : self.pi_dim]
-            model_augment_latent = Model(
-                inputs=[input_tot],
-                outputs=[
-                    self.call(input_tot),
-                    self._call_parameter_net(input_p, self.pnet_list)[1],
-                ],
+            input_s = input_tot[:, self.pi_dim : self.pi_dim + self.si_dim]
+
+            # the jacobian is only taken through the parameter net up to the
+            # latent, the last layer and the shape net are evaluated once outside
+            input_p_lr = tf.keras.layers.Input(
+                shape=(self.pi_dim), name="input_p_augment_latent"
             )
+            latent = self._call_parameter_net(input_p_lr, self.pnet_list)[1]
+            model_augment_latent = Model(inputs=[input_p_lr], outputs=[latent, latent])
+
             # we take d latent / d parameter
             y_index = range(0, self.pi_hidden)
             x_index = range(0, self.pi_dim)
-            output = JacRegLatentLayer(
+            latent = JacRegLatentLayer(
                 model_augment_latent,
                 y_index,
                 x_index,
                 self.p_jac_reg,
+                mixed_policy=self.mixed_policy,
+                n_projections=self.p_jac_reg_projections,
+                n_rows=self.p_jac_reg_rows,
                 name="jac_reg_latent",
-            )(input_tot)
-            return Model(inputs=[input_tot], outputs=[output])
+            )(input_p)
+            self.pnet_output = self._pnet_output_from_latent(latent)
+            output = self._call_shape_net_given_pnet_output(input_s, self.pnet_output)
+            return NIFModel(inputs=[input_tot], outputs=[output])
         else:
             return self.model()
 
@@ -381,17 +990,43 @@ class NIF(object):
         Builds and returns the NIF model.
 
         Returns:
-            tf.keras.Model: The NIF model.
+            NIFModel: The NIF model.
         """
         input_tot = tf.keras.layers.Input(
             shape=(self.pi_dim + self.si_dim), name="input_tot"
         )
-        return Model(inputs=[input_tot], outputs=[self.call(input_tot)])
+        return NIFModel(inputs=[input_tot], outputs=[self.call(input_tot)])
 
-    def model_p_to_w(self):
+    def model_with_spatial_derivatives(self, order=1):
         """
-        Builds and returns a model that maps input parameters to weights and
-        biases of the shape network.
+        Builds and returns the NIF model that also outputs the spatial derivatives
+        of the output with respect to the shape net input, computed in a single
+        forward pass through the shape net.
+
+        Args:
+            order (int, optional): 1 for `[u, du/dx]`, 2 for `[u, du/dx, laplacian]`.
+                Defaults to 1.
+
+        Returns:
+            tf.keras.Model: The model mapping the inputs to the output, its Jacobian
+            with shape (batch, so_dim, si_dim) and optionally its Laplacian with
+            shape (batch, so_dim).
+        """
+        if order not in (1, 2):
+            raise ValueError("order should be 1 or 2, got {}".format(order))
+        input_tot = tf.keras.layers.Input(
+            shape=(self.pi_dim + self.si_dim), name="input_tot"
+        )
+        input_p = input_tot[:, 0 : self.pi_dim]
+        input_s = input_tot[:, self.pi_dim : self.pi_dim + self.si_dim]
+        pnet_output = self._call_parameter_net(input_p, self.pnet_list)[0]
+        outputs = self._call_shape_net_given_pnet_output(input_s, pnet_output, order)
+        return Model(inputs=[input_tot], outputs=list(outputs))
+
+    def model_p_to_w(self):
+        """
+        Builds and returns a model that maps input parameters to weights and
+        biases of the shape network.
 
         Returns:
             tf.keras.Model: The model mapping input parameters to shape network
@@ -432,11 +1067,15 @@ class NIF(object):
         # this model: hidden LR -> weights and biases of shapenet
         return Model(inputs=[input_lr], outputs=[self.pnet_list[-1](input_lr)])
 
-    def model_x_to_u_given_w(self):
+    def model_x_to_u_given_w(self, order=0):
         """
         Builds and returns a model that maps input states to output, given shape
         network weights and biases.
 
+        Args:
+            order (int, optional): Order of the spatial derivatives also returned
+                by the model, see `model_with_spatial_derivatives`. Defaults to 0.
+
         Returns:
             tf.keras.Model: The model mapping input states to output, given shape
             network weights and biases.
@@ -447,21 +1086,96 @@ class NIF(object):
         input_pnet = tf.keras.layers.Input(
             shape=(self.pnet_list[-1].output_shape[1]), name="input_w_and_b_from_pnet"
         )
-        return Model(
-            inputs=[input_s, input_pnet],
-            outputs=[
-                self._call_shape_net(
-                    tf.cast(input_s, self.compute_Dtype),
-                    tf.cast(input_pnet, self.compute_Dtype),
-                    si_dim=self.si_dim,
-                    so_dim=self.so_dim,
-                    n_sx=self.n_sx,
-                    l_sx=self.l_sx,
-                    activation=self.cfg_shape_net["activation"],
-                    variable_dtype=self.variable_Dtype,
-                )
-            ],
+        outputs = self._call_shape_net_given_pnet_output(
+            input_s, tf.cast(input_pnet, self.compute_Dtype), order
         )
+        if order == 0:
+            outputs = [outputs]
+        return Model(inputs=[input_s, input_pnet], outputs=list(outputs))
+
+    def sensitivity(self, params, points, chunk_size=65536):
+        """
+        Streams the parametric sensitivity field `du/dp` over a set of points, for
+        each of the given parameter values.
+
+        For each parameter value, the parameter net is evaluated once and its
+        Jacobian `dw/dp` is obtained in forward mode. The corresponding tangents
+        are then pushed through the shape net, together with the output, for all
+        the points chunk by chunk, so no tape over the concatenated input is
+        needed. The shape net is vectorized over the points with the weights and
+        their tangents shared, so they are never tiled per point and the memory
+        only depends on `chunk_size` times the width of the shape net, not on
+        `po_dim`.
+
+        Usage:
+        for i, start, u, du_dp in model_ori.sensitivity(params, points):
+            field[i, start : start + u.shape[0]] = du_dp
+
+        Args:
+            params (array-like): Parameter values with shape (n_params, pi_dim).
+            points (array-like): Shape net inputs with shape (n_points, si_dim).
+            chunk_size (int, optional): Number of points evaluated at once.
+                Defaults to 65536.
+
+        Yields:
+            tuple: The index of the parameter value, the index of the first point of
+            the chunk, the output with shape (chunk, so_dim) and the sensitivity
+            with shape (chunk, so_dim, pi_dim), as numpy arrays.
+        """
+        params = tf.reshape(
+            tf.cast(params, self.variable_Dtype), [-1, self.pi_dim], name="params"
+        )
+        points = tf.reshape(
+            tf.cast(points, self.variable_Dtype), [-1, self.si_dim], name="points"
+        )
+        n_points = points.shape[0]
+        eye_p = tf.eye(self.pi_dim, dtype=self.variable_Dtype)
+
+        @tf.function
+        def p_to_w_and_dw_dp(param):
+            param_tiled = tf.tile(param[tf.newaxis], [self.pi_dim, 1])
+            with tf.autodiff.ForwardAccumulator(param_tiled, eye_p) as acc:
+                w = self._call_parameter_net(param_tiled, self.pnet_list)[0]
+            # the same weights with one tangent per parameter, both (pi_dim, po_dim)
+            return w, acc.jvp(w)
+
+        x_to_u_and_du_dp = tf.function(
+            self._shape_net_sensitivity, reduce_retracing=True
+        )
+        for i in range(params.shape[0]):
+            w, dw_dp = p_to_w_and_dw_dp(params[i])
+            for start in range(0, n_points, chunk_size):
+                u, du_dp = x_to_u_and_du_dp(
+                    points[start : start + chunk_size], w, dw_dp
+                )
+                yield i, start, u.numpy(), du_dp.numpy()
+
+    def _shape_net_sensitivity(self, x, w, dw_dp):
+        """
+        Computes the output of the shape net and its derivative with respect to the
+        parameters, given weights shared by all the points and their tangents.
+
+        Args:
+            x (tf.Tensor): Shape net inputs with shape (n_points, si_dim).
+            w (tf.Tensor): The shape net weights, tiled once per parameter, with
+                shape (pi_dim, po_dim).
+            dw_dp (tf.Tensor): The derivative of `w` with respect to each parameter,
+                with shape (pi_dim, po_dim).
+
+        Returns:
+            tuple: The output with shape (n_points, so_dim) and the sensitivity with
+            shape (n_points, so_dim, pi_dim).
+        """
+
+        def point_to_u_and_du_dp(x_point):
+            # w and dw_dp are loop invariant, so each einsum of the shape net
+            # becomes a matmul of all the points with the shared weights
+            x_tiled = tf.tile(x_point[tf.newaxis], [self.pi_dim, 1])
+            with tf.autodiff.ForwardAccumulator(w, dw_dp) as acc:
+                u = self._call_shape_net_given_pnet_output(x_tiled, w)
+            return u[0], tf.transpose(acc.jvp(u))
+
+        return tf.vectorized_map(point_to_u_and_du_dp, x)
 
     def save_config(self, filename="config.json"):
         """
@@ -507,37 +1221,55 @@ class NIFMultiScale(NIF):
             cfg_shape_net, cfg_parameter_net, mixed_policy
         )
 
-    def call(self, inputs, training=None, mask=None):
+    def _call_shape_net_given_pnet_output(self, input_s, pnet_output, order=0):
         """
-        Implements the forward pass of the NIFMultiScale model, which takes the
-        input tensors and computes the output using the multiscale architecture.
+        Calls the multiscale shape network with the given parameter network output.
 
         Args:
-            inputs (tensor): Input tensor with concatenated parameter and
-                shape information.
-            training (bool, optional): Whether the model is in training mode. Defaults
-                to None, which will use the model's training mode.
-            mask (tensor, optional): Mask tensor for masked input. Defaults to None.
+            input_s (tf.Tensor): Input tensor for the shape network.
+            pnet_output (tf.Tensor): Output tensor of the parameter network.
+            order (int, optional): Order of the spatial derivatives propagated along
+                with the output, see `NIF._call_shape_net`. Defaults to 0.
 
         Returns:
-            tensor: Output tensor computed by the multiscale shape network.
+            tf.Tensor or tuple: Output tensor computed by the multiscale shape network,
+            followed by its spatial derivatives if `order > 0`.
         """
-        input_p = inputs[:, 0 : self.pi_dim]
-        input_s = inputs[:, self.pi_dim : self.pi_dim + self.si_dim]
-        # get parameter from parameter_net
-        self.pnet_output = self._call_parameter_net(input_p, self.pnet_list)[0]
         return self._call_shape_net_mres(
-            tf.cast(input_s, self.compute_Dtype),
-            self.pnet_output,
+            self._encode_input(input_s, order),
+            pnet_output,
             flag_resblock=self.cfg_shape_net["use_resblock"],
             omega_0=tf.cast(self.cfg_shape_net["omega_0"], self.compute_Dtype),
-            si_dim=self.si_dim,
+            si_dim=self.se_dim,
             so_dim=self.so_dim,
             n_sx=self.n_sx,
             l_sx=self.l_sx,
             variable_dtype=self.variable_Dtype,
+            order=order,
+            rank=self.s_rank,
+            base_list=self.snet_base_list,
         )
 
+    def _initialize_snet_base(self, cfg_shape_net):
+        """
+        Initializes the shared base matrices of the low-rank hidden weights, see
+        `NIF._initialize_snet_base`, with a pair of them per resblock.
+
+        Args:
+            cfg_shape_net (dict): Configuration dictionary for the shape network.
+
+        Returns:
+            list or None: One layer, or a pair of layers for a resblock, per hidden
+            layer of the shape network, or None.
+        """
+        base_list = super(NIFMultiScale, self)._initialize_snet_base(cfg_shape_net)
+        if base_list is None or not cfg_shape_net["use_resblock"]:
+            return base_list
+        return [
+            [base, self._base_layer("base2_hidden_snet_{}".format(i))]
+            for i, base in enumerate(base_list)
+        ]
+
     def _initialize_pnet(self, cfg_parameter_net, cfg_shape_net):
         """
         Generate the layers for the parameter net, given the configuration of the
@@ -568,21 +1300,25 @@ class NIFMultiScale(NIF):
         pnet_layers_list = []
         if cfg_shape_net["connectivity"] == "full":
             # very first, determine the output dimension of parameter_net
+            n_w = self._num_hidden_weight(self.n_sx, self.s_rank)
             if cfg_shape_net["use_resblock"]:
                 self.po_dim = (
-                    (2 * self.l_sx) * self.n_sx**2
-                    + (self.si_dim + self.so_dim + 1 + 2 * self.l_sx) * self.n_sx
+                    (2 * self.l_sx) * n_w
+                    + (self.se_dim + self.so_dim + 1 + 2 * self.l_sx) * self.n_sx
                     + self.so_dim
                 )
             else:
                 self.po_dim = (
-                    (self.l_sx) * self.n_sx**2
-                    + (self.si_dim + self.so_dim + 1 + self.l_sx) * self.n_sx
+                    (self.l_sx) * n_w
+                    + (self.se_dim + self.so_dim + 1 + self.l_sx) * self.n_sx
                     + self.so_dim
                 )
         elif cfg_shape_net["connectivity"] == "last_layer":
             # only parameterize the last layer
             self.po_dim = self.pi_hidden
+        elif cfg_shape_net["connectivity"] == "film":
+            # only the scale and shift of the first and hidden layers
+            self.po_dim = 2 * (self.l_sx + 1) * self.n_sx
         else:
             raise ValueError("cfg_shape_net missing correct `connectivity`")
 
@@ -657,6 +1393,8 @@ class NIFMultiScale(NIF):
                 kernel_regularizer=self.pnet_kernel_regularizer,
                 bias_regularizer=self.pnet_bias_regularizer,
                 activity_regularizer=self.pnet_act_regularizer,
+                rank=cfg_parameter_net.get("hyper_rank", None),
+                block_diagonal=cfg_parameter_net.get("hyper_block_diagonal", False),
                 name="HyperLinearForSIREN",
             )
 
@@ -729,6 +1467,8 @@ class NIFMultiScale(NIF):
                 kernel_regularizer=self.pnet_kernel_regularizer,
                 bias_regularizer=self.pnet_bias_regularizer,
                 activity_regularizer=self.pnet_act_regularizer,
+                rank=cfg_parameter_net.get("hyper_rank", None),
+                block_diagonal=cfg_parameter_net.get("hyper_block_diagonal", False),
                 name="HyperLinearForSIREN",
             )
             pnet_layers_list.append(last_layer)
@@ -746,13 +1486,22 @@ class NIFMultiScale(NIF):
         n_sx,
         l_sx,
         variable_dtype,
+        order=0,
+        rank=None,
+        base_list=None,
     ):
         """
         Distribute `pnet_output` into weight and bias to construct the shape network.
 
+        If `order > 0`, the spatial derivatives are propagated along with the
+        activations in the same forward pass, see `NIF._call_shape_net`.
+
         Args:
             input_s (tf.Tensor): Input tensor for the shape network.
-            pnet_output (tf.Tensor): Output tensor from the parameter network.
+            pnet_output (tf.Tensor or LatentPnetOutput): Output tensor from the
+                parameter network, or the latent and the last parameter network
+                layer, to recompute each layer or resblock during backpropagation,
+                see `NIF._recompute_block`.
             flag_resblock (bool): Indicates whether to use a ResNet block structure.
             omega_0 (float): Scaling factor for the sine activation function.
             si_dim (int): Dimension of the input space for the shape network.
@@ -760,90 +1509,105 @@ class NIFMultiScale(NIF):
             n_sx (int): Number of neurons in the shape network's hidden layers.
             l_sx (int): Number of hidden layers in the shape network.
             variable_dtype (tf.DType): Data type for the resulting tensor.
+            order (int, optional): 0 for the output only, 1 to also return the
+                Jacobian `du/dx`, 2 to further return the Laplacian. Defaults to 0.
+            rank (int, optional): Rank of the generated hidden weights, see
+                `NIF._reshape_hidden_weight`. Defaults to None, i.e., full rank.
+            base_list (list, optional): Shared base matrices added to the hidden
+                weights, see `_initialize_snet_base`. Defaults to None.
 
         Returns:
-            tf.Tensor: The output tensor of the shape network with the given data type.
+            tf.Tensor or tuple: The output tensor of the shape network with the given
+            data type, followed by its spatial derivatives if `order > 0`.
         """
-        if flag_resblock:
-            # distribute weights
-            w_1 = tf.reshape(
-                pnet_output[:, : si_dim * n_sx], [-1, si_dim, n_sx], name="w_first_snet"
+
+        def distribute(pnet_output_):
+            return NIFMultiScale._distribute_pnet_output_mres(
+                pnet_output_, flag_resblock, si_dim, so_dim, n_sx, l_sx, rank
             )
-            w_hidden_list = []
-            for i in range(l_sx):
-                w1_tmp = tf.reshape(
-                    pnet_output[
-                        :,
-                        si_dim * n_sx
-                        + 2 * i * n_sx**2 : si_dim * n_sx
-                        + (2 * i + 1) * n_sx**2,
-                    ],
-                    [-1, n_sx, n_sx],
-                    name="w1_hidden_snet_{}".format(i),
+
+        if base_list is None:
+            base_list = [[None, None] if flag_resblock else None] * l_sx
+
+        if isinstance(pnet_output, LatentPnetOutput):
+
+            def block_weights(pnet_output_):
+                w_1, w_hidden_list, w_l, b_1, b_hidden_list, b_l = distribute(
+                    pnet_output_
                 )
-                w2_tmp = tf.reshape(
-                    pnet_output[
-                        :,
-                        si_dim * n_sx
-                        + (2 * i + 1) * n_sx**2 : si_dim * n_sx
-                        + (2 * i + 2) * n_sx**2,
-                    ],
-                    [-1, n_sx, n_sx],
-                    name="w2_hidden_snet_{}".format(i),
+                hidden = []
+                for w, b in zip(w_hidden_list, b_hidden_list):
+                    if flag_resblock:
+                        hidden.append([*b, *_split_weight(w[0]), *_split_weight(w[1])])
+                    else:
+                        hidden.append([b, *_split_weight(w)])
+                return [[w_1, b_1]] + hidden + [[w_l, b_l]]
+
+            def first_layer(input_s_, w_1_, b_1_):
+                return tf.math.sin(
+                    omega_0 * tf.einsum("ai,aij->aj", input_s_, w_1_) + b_1_
                 )
-                w_hidden_list.append([w1_tmp, w2_tmp])
-            w_l = tf.reshape(
-                pnet_output[
-                    :,
-                    si_dim * n_sx
-                    + (2 * l_sx) * n_sx**2 : si_dim * n_sx
-                    + (2 * l_sx) * n_sx**2
-                    + so_dim * n_sx,
-                ],
-                [-1, n_sx, so_dim],
-                name="w_last_snet",
-            )
 
-            n_weights = si_dim * n_sx + (2 * l_sx) * n_sx**2 + so_dim * n_sx
+            def hidden_layer(u_, b_, *w_):
+                return tf.math.sin(
+                    omega_0 * NIF._per_point_matmul(u_, _join_weight(w_)) + b_
+                )
 
-            # distribute bias
-            b_1 = tf.reshape(
-                pnet_output[:, n_weights : n_weights + n_sx],
-                [-1, n_sx],
-                name="b_first_snet",
-            )
-            b_hidden_list = []
-            for i in range(l_sx):
-                b1_tmp = tf.reshape(
-                    pnet_output[
-                        :,
-                        n_weights
-                        + n_sx
-                        + 2 * i * n_sx : n_weights
-                        + n_sx
-                        + (2 * i + 1) * n_sx,
-                    ],
-                    [-1, n_sx],
-                    name="b1_hidden_snet_{}".format(i),
+            def hidden_resblock(u_, b_a, b_b, *w_):
+                # the weights of both layers have the same number of tensors
+                n_a = len(w_) // 2
+                h = tf.math.sin(
+                    omega_0 * NIF._per_point_matmul(u_, _join_weight(w_[:n_a])) + b_a
                 )
-                b2_tmp = tf.reshape(
-                    pnet_output[
-                        :,
-                        n_weights
-                        + n_sx
-                        + (2 * i + 1) * n_sx : n_weights
-                        + n_sx
-                        + (2 * i + 2) * n_sx,
-                    ],
-                    [-1, n_sx],
-                    name="b1_hidden_snet_{}".format(i),
+                return 0.5 * (
+                    u_
+                    + tf.math.sin(
+                        omega_0 * NIF._per_point_matmul(h, _join_weight(w_[n_a:])) + b_b
+                    )
                 )
-                b_hidden_list.append([b1_tmp, b2_tmp])
-            b_l = tf.reshape(
-                pnet_output[:, n_weights + (2 * l_sx + 1) * n_sx :],
-                [-1, so_dim],
-                name="b_last_snet",
-            )
+
+            def last_layer(u_, w_l_, b_l_):
+                return tf.einsum("ai,aij->aj", u_, w_l_) + b_l_
+
+            hidden_fn = hidden_resblock if flag_resblock else hidden_layer
+            blocks = [(first_layer, "first_snet")]
+            blocks += [(hidden_fn, "hidden_snet_{}".format(i)) for i in range(l_sx)]
+            blocks += [(last_layer, "last_snet")]
+            u = input_s
+            for index, (fn, name) in enumerate(blocks):
+                u = NIF._recompute_block(
+                    fn, lambda p, index=index: block_weights(p)[index], name
+                )(u, pnet_output)
+            return tf.cast(u, variable_dtype, name="output_cast_snet")
+
+        w_1, w_hidden_list, w_l, b_1, b_hidden_list, b_l = distribute(pnet_output)
+
+        if flag_resblock:
+            if order > 0:
+                u = NIF._input_linear_with_derivatives(
+                    input_s, w_1, b_1, order, omega_0
+                )
+                u = NIF._activation_with_derivatives(u, "sine")
+                for i in range(l_sx):
+                    h = NIF._linear_with_derivatives(
+                        u,
+                        w_hidden_list[i][0],
+                        b_hidden_list[i][0],
+                        omega_0,
+                        base_list[i][0],
+                    )
+                    h = NIF._activation_with_derivatives(h, "sine")
+                    h = NIF._linear_with_derivatives(
+                        h,
+                        w_hidden_list[i][1],
+                        b_hidden_list[i][1],
+                        omega_0,
+                        base_list[i][1],
+                    )
+                    h = NIF._activation_with_derivatives(h, "sine")
+                    u = NIF._combine_with_derivatives(u, h, 0.5, 0.5)
+                u = NIF._linear_with_derivatives(u, w_l, b_l)
+                return NIF._cast_with_derivatives(u, variable_dtype)
 
             # construct shape net
             u = tf.math.sin(
@@ -855,9 +1619,12 @@ class NIFMultiScale(NIF):
             for i in range(l_sx):
                 h = tf.math.sin(
                     omega_0
-                    * EinsumLayer(
-                        "ai,aij->aj", name="hidden_1_einsum_snet_{}".format(i)
-                    )((u, w_hidden_list[i][0]))
+                    * NIF._per_point_matmul(
+                        u,
+                        w_hidden_list[i][0],
+                        base_list[i][0],
+                        name="hidden_1_einsum_snet_{}".format(i),
+                    )
                     + b_hidden_list[i][0]
                 )
                 # h = tf.math.sin(omega_0 * tf.einsum('ai,aij->aj', u, w_hidden_list[i][0])
@@ -866,9 +1633,12 @@ class NIFMultiScale(NIF):
                     u
                     + tf.math.sin(
                         omega_0
-                        * EinsumLayer(
-                            "ai,aij->aj", name="hidden_2_einsum_snet_{}".format(i)
-                        )((h, w_hidden_list[i][1]))
+                        * NIF._per_point_matmul(
+                            h,
+                            w_hidden_list[i][1],
+                            base_list[i][1],
+                            name="hidden_2_einsum_snet_{}".format(i),
+                        )
                         + b_hidden_list[i][1]
                     )
                 )
@@ -879,58 +1649,18 @@ class NIFMultiScale(NIF):
 
         else:
             # disable resblock for parameter net
-            # distribute weights
-            w_1 = tf.reshape(
-                pnet_output[:, : si_dim * n_sx], [-1, si_dim, n_sx], name="w_first_snet"
-            )
-            w_hidden_list = []
-            for i in range(l_sx):
-                w_tmp = tf.reshape(
-                    pnet_output[
-                        :,
-                        si_dim * n_sx
-                        + i * n_sx**2 : si_dim * n_sx
-                        + (i + 1) * n_sx**2,
-                    ],
-                    [-1, n_sx, n_sx],
-                    name="w_hidden_snet_{}".format(i),
+            if order > 0:
+                u = NIF._input_linear_with_derivatives(
+                    input_s, w_1, b_1, order, omega_0
                 )
-                w_hidden_list.append(w_tmp)
-            w_l = tf.reshape(
-                pnet_output[
-                    :,
-                    si_dim * n_sx
-                    + l_sx * n_sx**2 : si_dim * n_sx
-                    + l_sx * n_sx**2
-                    + so_dim * n_sx,
-                ],
-                [-1, n_sx, so_dim],
-                name="w_last_snet",
-            )
-            n_weights = si_dim * n_sx + l_sx * n_sx**2 + so_dim * n_sx
-
-            # distribute bias
-            b_1 = tf.reshape(
-                pnet_output[:, n_weights : n_weights + n_sx],
-                [-1, n_sx],
-                name="b_first_snet",
-            )
-            b_hidden_list = []
-            for i in range(l_sx):
-                b_tmp = tf.reshape(
-                    pnet_output[
-                        :,
-                        n_weights + n_sx + i * n_sx : n_weights + n_sx + (i + 1) * n_sx,
-                    ],
-                    [-1, n_sx],
-                    name="b_hidden_snet_{}".format(i),
-                )
-                b_hidden_list.append(b_tmp)
-            b_l = tf.reshape(
-                pnet_output[:, n_weights + (l_sx + 1) * n_sx :],
-                [-1, so_dim],
-                name="b_last_snet",
-            )
+                u = NIF._activation_with_derivatives(u, "sine")
+                for i in range(l_sx):
+                    u = NIF._linear_with_derivatives(
+                        u, w_hidden_list[i], b_hidden_list[i], omega_0, base_list[i]
+                    )
+                    u = NIF._activation_with_derivatives(u, "sine")
+                u = NIF._linear_with_derivatives(u, w_l, b_l)
+                return NIF._cast_with_derivatives(u, variable_dtype)
 
             # construct shape net
             u = tf.math.sin(
@@ -942,8 +1672,11 @@ class NIFMultiScale(NIF):
             for i in range(l_sx):
                 u = tf.math.sin(
                     omega_0
-                    * EinsumLayer("ai,aij->aj", name="hidden_einsum_snet_{}".format(i))(
-                        (u, w_hidden_list[i])
+                    * NIF._per_point_matmul(
+                        u,
+                        w_hidden_list[i],
+                        base_list[i],
+                        name="hidden_einsum_snet_{}".format(i),
                     )
                     + b_hidden_list[i]
                 )
@@ -953,37 +1686,116 @@ class NIFMultiScale(NIF):
 
         return tf.cast(u, variable_dtype, name="output_cast_snet")
 
-    def model_x_to_u_given_w(self):
+    @staticmethod
+    def _distribute_pnet_output_mres(
+        pnet_output, flag_resblock, si_dim, so_dim, n_sx, l_sx, rank=None
+    ):
         """
-        Constructs a Keras model for mapping input tensor `x` to output tensor `u`
-        given the weights and biases from the parameter network.
+        Distributes the parameter network output into the weights and biases of the
+        multiscale shape network.
+
+        Args:
+            pnet_output (tf.Tensor): Output tensor from the parameter network.
+            flag_resblock (bool): Indicates whether to use a ResNet block structure.
+            si_dim (int): Dimension of the input space for the shape network.
+            so_dim (int): Dimension of the output space for the shape network.
+            n_sx (int): Number of neurons in the shape network's hidden layers.
+            l_sx (int): Number of hidden layers in the shape network.
+            rank (int, optional): Rank of the hidden weights, see
+                `NIF._reshape_hidden_weight`. Defaults to None.
 
         Returns:
-            tf.keras.Model: A Keras model that takes two inputs, `input_s` and
-                            `input_pnet`, and returns the output tensor `u`.
+            tuple: The first layer weights, the list of hidden layer weights, the last
+            layer weights, the first layer bias, the list of hidden layer biases and
+            the last layer bias. With `flag_resblock`, each entry of the hidden lists
+            is a pair for the two layers of the resblock.
         """
-        input_s = tf.keras.layers.Input(
-            shape=(self.si_dim), name="input_x_to_u_given_w"
-        )
-        input_pnet = tf.keras.layers.Input(
-            shape=(self.pnet_list[-1].output_shape[1]), name="input_w_and_b_from_pnet"
+        if not flag_resblock:
+            return NIF._distribute_pnet_output(
+                pnet_output, si_dim, so_dim, n_sx, l_sx, rank
+            )
+
+        # distribute weights
+        n_w = NIF._num_hidden_weight(n_sx, rank)
+        w_1 = tf.reshape(
+            pnet_output[:, : si_dim * n_sx], [-1, si_dim, n_sx], name="w_first_snet"
         )
-        return Model(
-            inputs=[input_s, input_pnet],
-            outputs=[
-                self._call_shape_net_mres(
-                    tf.cast(input_s, self.compute_Dtype),
-                    tf.cast(input_pnet, self.compute_Dtype),
-                    flag_resblock=self.cfg_shape_net["use_resblock"],
-                    omega_0=tf.cast(self.cfg_shape_net["omega_0"], self.compute_Dtype),
-                    si_dim=self.si_dim,
-                    so_dim=self.so_dim,
-                    n_sx=self.n_sx,
-                    l_sx=self.l_sx,
-                    variable_dtype=self.variable_Dtype,
-                )
+        w_hidden_list = []
+        for i in range(l_sx):
+            w1_tmp = NIF._reshape_hidden_weight(
+                pnet_output[
+                    :,
+                    si_dim * n_sx + 2 * i * n_w : si_dim * n_sx + (2 * i + 1) * n_w,
+                ],
+                n_sx,
+                rank,
+                name="w1_hidden_snet_{}".format(i),
+            )
+            w2_tmp = NIF._reshape_hidden_weight(
+                pnet_output[
+                    :,
+                    si_dim * n_sx
+                    + (2 * i + 1) * n_w : si_dim * n_sx
+                    + (2 * i + 2) * n_w,
+                ],
+                n_sx,
+                rank,
+                name="w2_hidden_snet_{}".format(i),
+            )
+            w_hidden_list.append([w1_tmp, w2_tmp])
+        w_l = tf.reshape(
+            pnet_output[
+                :,
+                si_dim * n_sx
+                + (2 * l_sx) * n_w : si_dim * n_sx
+                + (2 * l_sx) * n_w
+                + so_dim * n_sx,
             ],
+            [-1, n_sx, so_dim],
+            name="w_last_snet",
+        )
+
+        n_weights = si_dim * n_sx + (2 * l_sx) * n_w + so_dim * n_sx
+
+        # distribute bias
+        b_1 = tf.reshape(
+            pnet_output[:, n_weights : n_weights + n_sx],
+            [-1, n_sx],
+            name="b_first_snet",
+        )
+        b_hidden_list = []
+        for i in range(l_sx):
+            b1_tmp = tf.reshape(
+                pnet_output[
+                    :,
+                    n_weights
+                    + n_sx
+                    + 2 * i * n_sx : n_weights
+                    + n_sx
+                    + (2 * i + 1) * n_sx,
+                ],
+                [-1, n_sx],
+                name="b1_hidden_snet_{}".format(i),
+            )
+            b2_tmp = tf.reshape(
+                pnet_output[
+                    :,
+                    n_weights
+                    + n_sx
+                    + (2 * i + 1) * n_sx : n_weights
+                    + n_sx
+                    + (2 * i + 2) * n_sx,
+                ],
+                [-1, n_sx],
+                name="b1_hidden_snet_{}".format(i),
+            )
+            b_hidden_list.append([b1_tmp, b2_tmp])
+        b_l = tf.reshape(
+            pnet_output[:, n_weights + (2 * l_sx + 1) * n_sx :],
+            [-1, so_dim],
+            name="b_last_snet",
         )
+        return w_1, w_hidden_list, w_l, b_1, b_hidden_list, b_l
 
 
 class NIFMultiScaleLastLayerParameterized(NIFMultiScale):
@@ -1009,6 +1821,9 @@ class NIFMultiScaleLastLayerParameterized(NIFMultiScale):
             output 'u' given 'w'.
     """
 
+    # `cfg_shape_net["recompute"]` recomputes the SIREN layers of the shape network
+    _recompute_pnet = False
+
     def __init__(self, cfg_shape_net, cfg_parameter_net, mixed_policy="float32"):
         """
         Initialize the NIFMultiScaleLastLayerParameterized class.
@@ -1041,27 +1856,28 @@ class NIFMultiScaleLastLayerParameterized(NIFMultiScale):
         self.snet_list = self._initialize_snet(cfg_shape_net)
         self.last_bias_layer = BiasAddLayer(self.so_dim, mixed_policy=self.mixed_policy)
 
-    def call(self, inputs, training=None, mask=None):
+    def _call_shape_net_given_pnet_output(self, input_s, pnet_output, order=0):
         """
-        Forward pass of the NIFMultiScaleLastLayerParameterized model.
+        Calls the shape network with the given parameter network output, which is
+        the coefficient of the last layer.
 
         Args:
-            inputs (tf.Tensor): Input tensor of shape (batch_size, input_dim).
-            training (bool, optional): Whether the model is in training mode. Defaults to None.
-            mask (tf.Tensor, optional): Mask tensor for masked inputs. Defaults to None.
+            input_s (tf.Tensor): Input tensor for the shape network.
+            pnet_output (tf.Tensor): Output tensor of the parameter network.
+            order (int, optional): Only 0 is supported. Defaults to 0.
 
         Returns:
             tf.Tensor: Output tensor of shape (batch_size, output_dim).
         """
-        input_p = inputs[:, 0 : self.pi_dim]
-        input_s = inputs[:, self.pi_dim : self.pi_dim + self.si_dim]
-        # get parameter from parameter_net
-        self.pnet_output = self._call_parameter_net(input_p, self.pnet_list)[0]
+        if order > 0:
+            raise NotImplementedError(
+                "closed-form spatial derivatives are not available for "
+                "NIFMultiScaleLastLayerParameterized, use `nif.layers.JacobianLayer`"
+            )
         return self._call_shape_net_mres_only_para_last_layer(
-            tf.cast(input_s, self.compute_Dtype),
+            self._encode_input(input_s),
             self.snet_list,
-            # tf.cast(self.last_layer_bias, self.compute_Dtype),
-            self.pnet_output,
+            pnet_output,
             self.so_dim,
             self.pi_hidden,
             self.variable_Dtype,
@@ -1096,7 +1912,10 @@ class NIFMultiScaleLastLayerParameterized(NIFMultiScale):
             outputs=[
                 tf.cast(
                     self._call_shape_net_get_phi_x(
-                        input_s, self.snet_list, self.so_dim, self.pi_hidden
+                        self._encode_input(input_s),
+                        self.snet_list,
+                        self.so_dim,
+                        self.pi_hidden,
                     ),
                     self.variable_Dtype,
                 )
@@ -1114,36 +1933,6 @@ class NIFMultiScaleLastLayerParameterized(NIFMultiScale):
             "In this class: NIFMultiScaleLastLayerParameterization, `w` is the same as `lr`"
         )
 
-    def model_x_to_u_given_w(self):
-        """
-        Creates a Keras model that maps input_s and input_pnet to the output of the
-        shape network with the given parameters.
-
-        Returns:
-            Model: A Keras model with input_s and input_pnet as inputs, and the output
-                   of the shape network as the output.
-        """
-        input_s = tf.keras.layers.Input(
-            shape=(self.si_dim), name="input_x_to_u_given_w"
-        )
-        input_pnet = tf.keras.layers.Input(
-            shape=(self.pnet_list[-1].output_shape[1]), name="input_w_and_b_from_pnet"
-        )
-        return Model(
-            inputs=[input_s, input_pnet],
-            outputs=[
-                self._call_shape_net_mres_only_para_last_layer(
-                    tf.cast(input_s, self.compute_Dtype),
-                    self.snet_list,
-                    tf.cast(self.last_layer_bias, self.compute_Dtype),
-                    tf.cast(input_pnet, self.compute_Dtype),
-                    self.so_dim,
-                    self.pi_hidden,
-                    self.variable_Dtype,
-                )
-            ],
-        )
-
     def _initialize_snet(self, cfg_shape_net):
         """
         Initializes the shape network layers based on the configuration.
@@ -1160,7 +1949,7 @@ class NIFMultiScaleLastLayerParameterized(NIFMultiScale):
         snet_layers_list = []
         # 1. first layer
         layer_1 = SIREN(
-            self.si_dim,
+            self.se_dim,
             self.n_sx,
             "first",
             cfg_shape_net["omega_0"],
@@ -1168,6 +1957,7 @@ class NIFMultiScaleLastLayerParameterized(NIFMultiScale):
             self.snet_kernel_regularizer,
             self.snet_bias_regularizer,
             self.mixed_policy,
+            recompute=cfg_shape_net.get("recompute", False),
             name="siren_first_snet",
         )
         snet_layers_list.append(layer_1)
@@ -1182,6 +1972,7 @@ class NIFMultiScaleLastLayerParameterized(NIFMultiScale):
                     self.snet_kernel_regularizer,
                     self.snet_bias_regularizer,
                     self.mixed_policy,
+                    recompute=cfg_shape_net.get("recompute", False),
                     name="siren_hidden_resblock_snet_{}".format(i),
                 )
                 snet_layers_list.append(tmp_layer)
@@ -1196,6 +1987,7 @@ class NIFMultiScaleLastLayerParameterized(NIFMultiScale):
                     self.snet_kernel_regularizer,
                     self.snet_bias_regularizer,
                     self.mixed_policy,
+                    recompute=cfg_shape_net.get("recompute", False),
                     name="siren_hidden_snet_{}".format(i),
                 )
                 snet_layers_list.append(tmp_layer)
@@ -1210,6 +2002,7 @@ class NIFMultiScaleLastLayerParameterized(NIFMultiScale):
             self.snet_kernel_regularizer,
             self.snet_bias_regularizer,
             self.mixed_policy,
+            recompute=cfg_shape_net.get("recompute", False),
             name="siren_bottleneck_snet",
         )
         snet_layers_list.append(bottle_last_layer)
@@ -1264,6 +2057,471 @@ class NIFMultiScaleLastLayerParameterized(NIFMultiScale):
         phi_x_matrix = self._call_shape_net_get_phi_x(
             input_s, snet_layers_list, so_dim, pi_hidden
         )
-        u = tf.keras.layers.Dot(axes=(2, 1))([phi_x_matrix, pnet_output])
+        u = tf.keras.layers.Dot(axes=(2, 1), dtype=self.mixed_policy)(
+            [phi_x_matrix, pnet_output]
+        )
         u = self.last_bias_layer(u)
         return tf.cast(u, variable_dtype, name="output_cast")
+
+
+class NIFMultiScaleFiLM(NIFMultiScale):
+    """
+    NIFMultiScaleFiLM is a subclass of NIFMultiScale whose shape network has its own
+    shared SIREN weights, while the parameter network only generates a scale and a
+    shift (FiLM) for the output of the first and each hidden layer of the shape
+    network. So `po_dim` is `2 * (nlayers + 1) * units` and the shape network uses
+    ordinary matmuls instead of per-point weights.
+
+    Attributes:
+        cfg_shape_net (dict): Configuration for the shape network, with
+            `cfg_shape_net["connectivity"] == "film"`.
+        cfg_parameter_net (dict): Configuration for the parameter network.
+        mixed_policy (str): Policy to be used for mixed precision calculations.
+    """
+
+    # `cfg_shape_net["recompute"]` recomputes the SIREN layers of the shape network
+    _recompute_pnet = False
+
+    def __init__(self, cfg_shape_net, cfg_parameter_net, mixed_policy="float32"):
+        """
+        Initialize the NIFMultiScaleFiLM class.
+
+        Args:
+            cfg_shape_net (dict): Configuration dictionary for the shape network.
+            cfg_parameter_net (dict): Configuration dictionary for the parameter network.
+            mixed_policy (str, optional): Policy for mixed precision training. Defaults to "float32".
+        """
+        super(NIFMultiScaleFiLM, self).__init__(
+            cfg_shape_net, cfg_parameter_net, mixed_policy
+        )
+        assert (
+            cfg_shape_net["connectivity"] == "film"
+        ), "you should assign cfg_shape_net['connectivity'] == 'film'"
+
+        self.s_l1_reg = cfg_shape_net.get("l1_reg", None)
+        self.s_l2_reg = cfg_shape_net.get("l2_reg", None)
+
+        if isinstance(self.s_l2_reg, (float, int)):
+            self.snet_kernel_regularizer = regularizers.L2(self.s_l2_reg)
+            self.snet_bias_regularizer = regularizers.L2(self.s_l2_reg)
+        elif isinstance(self.s_l1_reg, (float, int)):
+            self.snet_kernel_regularizer = regularizers.L1(self.s_l1_reg)
+            self.snet_bias_regularizer = regularizers.L1(self.s_l1_reg)
+        else:
+            self.snet_kernel_regularizer = None
+            self.snet_bias_regularizer = None
+
+        self.snet_list = self._initialize_snet(cfg_shape_net)
+
+    def _call_shape_net_given_pnet_output(self, input_s, pnet_output, order=0):
+        """
+        Calls the shape network modulated by the given parameter network output.
+
+        Args:
+            input_s (tf.Tensor): Input tensor for the shape network.
+            pnet_output (tf.Tensor): Output tensor of the parameter network, i.e., the
+                scales followed by the shifts.
+            order (int, optional): Only 0 is supported. Defaults to 0.
+
+        Returns:
+            tf.Tensor: Output tensor of shape (batch_size, output_dim).
+        """
+        if order > 0:
+            raise NotImplementedError(
+                "closed-form spatial derivatives are not available for "
+                "NIFMultiScaleFiLM, use `nif.layers.JacobianLayer`"
+            )
+        return self._call_shape_net_film(
+            self._encode_input(input_s),
+            self.snet_list,
+            pnet_output,
+            self.n_sx,
+            self.variable_Dtype,
+        )
+
+    def _initialize_snet(self, cfg_shape_net):
+        """
+        Initializes the shared shape network layers based on the configuration.
+
+        Args:
+            cfg_shape_net (dict): Configuration dictionary for the shape network.
+
+        Returns:
+            List[Layer]: The first layer, the hidden layers and the linear last layer.
+        """
+        snet_layers_list = []
+        # 1. first layer
+        layer_1 = SIREN(
+            self.se_dim,
+            self.n_sx,
+            "first",
+            cfg_shape_net["omega_0"],
+            cfg_shape_net,
+            self.snet_kernel_regularizer,
+            self.snet_bias_regularizer,
+            self.mixed_policy,
+            recompute=cfg_shape_net.get("recompute", False),
+            name="siren_first_snet",
+        )
+        snet_layers_list.append(layer_1)
+
+        # 2. hidden layers
+        for i in range(self.l_sx):
+            if cfg_shape_net["use_resblock"]:
+                tmp_layer = SIREN_ResNet(
+                    self.n_sx,
+                    self.n_sx,
+                    cfg_shape_net["omega_0"],
+                    self.snet_kernel_regularizer,
+                    self.snet_bias_regularizer,
+                    self.mixed_policy,
+                    recompute=cfg_shape_net.get("recompute", False),
+                    name="siren_hidden_resblock_snet_{}".format(i),
+                )
+            else:
+                tmp_layer = SIREN(
+                    self.n_sx,
+                    self.n_sx,
+                    "hidden",
+                    cfg_shape_net["omega_0"],
+                    cfg_shape_net,
+                    self.snet_kernel_regularizer,
+                    self.snet_bias_regularizer,
+                    self.mixed_policy,
+                    recompute=cfg_shape_net.get("recompute", False),
+                    name="siren_hidden_snet_{}".format(i),
+                )
+            snet_layers_list.append(tmp_layer)
+
+        # 3. linear last layer, GlorotUniform as for the generated last layer
+        last_layer = Dense(
+            self.so_dim,
+            kernel_regularizer=self.snet_kernel_regularizer,
+            bias_regularizer=self.snet_bias_regularizer,
+            dtype=self.mixed_policy,
+            name="last_snet",
+        )
+        snet_layers_list.append(last_layer)
+        return snet_layers_list
+
+    @staticmethod
+    def _call_shape_net_film(
+        input_s, snet_layers_list, pnet_output, n_sx, variable_dtype
+    ):
+        """
+        Computes the shape network, where the output of the first and each hidden
+        layer is scaled and shifted by the parameter network output.
+
+        Args:
+            input_s (tf.Tensor): Input tensor for the shape network.
+            snet_layers_list (List[Layer]): List of Keras layers for the shape network.
+            pnet_output (tf.Tensor): Output tensor from the parameter network, the
+                scales of all layers followed by their shifts.
+            n_sx (int): Number of units in each hidden layer of the shape network.
+            variable_dtype (tf.DType): Data type for the output tensor.
+
+        Returns:
+            tf.Tensor: The computed output tensor u.
+        """
+        n_film = len(snet_layers_list) - 1
+        u = input_s
+        for i, layer_ in enumerate(snet_layers_list[:-1]):
+            scale = pnet_output[:, i * n_sx : (i + 1) * n_sx]
+            shift = pnet_output[:, (n_film + i) * n_sx : (n_film + i + 1) * n_sx]
+            u = scale * layer_(u) + shift
+        u = snet_layers_list[-1](u)
+        return tf.cast(u, variable_dtype, name="output_cast_snet")
+
+
+class NIFMultiScaleDomainDecomposition(NIFMultiScale):
+    """
+    NIFMultiScaleDomainDecomposition is a subclass of NIFMultiScale that partitions
+    the spatial domain into subdomains, e.g., by a `nif.layers.GridPartition` or a
+    `nif.layers.KDTreePartition` over the training points, each with its own small
+    shape network. The parameter network is shared up to the bottleneck, which is
+    replaced by one latent head per subdomain (`nif.layers.MultiHeadDense`), and the
+    shared last layer maps the latent of a subdomain to the weights of its shape
+    network. Every point is routed to its subdomain by the partition and evaluated in
+    the local coordinates of the subdomain, which lie in [-1, 1], so the cost per
+    point does not grow with the number of subdomains, and all the subdomains of a
+    batch are trained together.
+
+    Note that the output is not continuous across the interfaces of the subdomains.
+
+    Attributes:
+        cfg_shape_net (dict): Configuration for the shape network, which is the
+            same for all subdomains.
+        cfg_parameter_net (dict): Configuration for the parameter network.
+        partition (nif.layers.GridPartition or nif.layers.KDTreePartition): The
+            partition of the spatial domain.
+        mixed_policy (str): Policy to be used for mixed precision calculations.
+    """
+
+    # the heads of the subdomains are only selected in `call`, so
+    # `cfg_shape_net["recompute"]` is not supported
+    _recompute_pnet = False
+
+    def __init__(
+        self, cfg_shape_net, cfg_parameter_net, partition, mixed_policy="float32"
+    ):
+        """
+        Initialize the NIFMultiScaleDomainDecomposition class.
+
+        Args:
+            cfg_shape_net (dict): Configuration dictionary for the shape network.
+            cfg_parameter_net (dict): Configuration dictionary for the parameter network.
+            partition (nif.layers.GridPartition or nif.layers.KDTreePartition): The
+                partition of the spatial domain into subdomains.
+            mixed_policy (str, optional): Policy for mixed precision training. Defaults to "float32".
+        """
+        if partition.input_dim != cfg_shape_net["input_dim"]:
+            raise ValueError(
+                "the partition has {} dimensions but the shape net input has {}".format(
+                    partition.input_dim, cfg_shape_net["input_dim"]
+                )
+            )
+        self.partition = partition
+        super(NIFMultiScaleDomainDecomposition, self).__init__(
+            cfg_shape_net, cfg_parameter_net, mixed_policy
+        )
+        if isinstance(self.p_jac_reg, (float, int)):
+            raise NotImplementedError(
+                "`jac_reg` is not supported by NIFMultiScaleDomainDecomposition"
+            )
+
+    def call(self, inputs, training=None, mask=None):
+        """
+        Performs the forward pass, where each point uses the shape network of its
+        subdomain.
+
+        Args:
+            inputs (tf.Tensor): A tensor containing input parameters and states.
+            training (bool, optional): Whether the model is in training mode. Defaults to None.
+            mask (tf.Tensor, optional): A tensor representing masked elements. Defaults to None.
+
+        Returns:
+            tf.Tensor: The output tensor after passing through the shape network.
+        """
+        input_p = inputs[:, 0 : self.pi_dim]
+        input_s = inputs[:, self.pi_dim : self.pi_dim + self.si_dim]
+        self.pnet_output = self._call_parameter_net_in_subdomain(input_p, input_s)[0]
+        return self._call_shape_net_given_pnet_output(input_s, self.pnet_output)
+
+    def _call_shape_net_given_pnet_output(self, input_s, pnet_output, order=0):
+        """
+        Calls the multiscale shape network in the local coordinates of the subdomain
+        of each point, with the given parameter network output.
+
+        Args:
+            input_s (tf.Tensor): Input tensor for the shape network, in global
+                coordinates.
+            pnet_output (tf.Tensor): Output tensor of the parameter network.
+            order (int, optional): Order of the spatial derivatives propagated along
+                with the output, see `NIF._call_shape_net`. Defaults to 0.
+
+        Returns:
+            tf.Tensor or tuple: The output tensor of the shape network, followed by
+            its spatial derivatives with respect to the global coordinates if
+            `order > 0`.
+        """
+        _, x_local, inv_half_width = self.partition(input_s)
+        outputs = super(
+            NIFMultiScaleDomainDecomposition, self
+        )._call_shape_net_given_pnet_output(x_local, pnet_output, order)
+        if order == 0:
+            return outputs
+
+        # chain rule of the local coordinates, which are isotropically scaled
+        scale = tf.cast(inv_half_width, self.variable_Dtype)[:, tf.newaxis]
+        u, du_dx = outputs[:2]
+        outputs_global = (u, du_dx * scale[:, tf.newaxis])
+        if order > 1:
+            outputs_global += (outputs[2] * tf.square(scale),)
+        return outputs_global
+
+    def _initialize_pnet(self, cfg_parameter_net, cfg_shape_net):
+        """
+        Generates the layers of the parameter network as `NIFMultiScale`, but with
+        one bottleneck head per subdomain.
+
+        Args:
+            cfg_parameter_net (dict): Configuration dictionary for the parameter net.
+            cfg_shape_net (dict): Configuration dictionary for the shape net.
+
+        Returns:
+            pnet_layers_list (list): List of layers for the parameter net.
+        """
+        pnet_layers_list = super(
+            NIFMultiScaleDomainDecomposition, self
+        )._initialize_pnet(cfg_parameter_net, cfg_shape_net)
+
+        # same initialization as the single bottleneck, for each head
+        if cfg_parameter_net["activation"] == "sine":
+            w_bound = (6.0 / self.n_st) ** 0.5 / cfg_parameter_net["omega_0"]
+            b_bound = 1.0 / self.n_st**0.5
+            kernel_initializer = initializers.RandomUniform(-w_bound, w_bound)
+            bias_initializer = initializers.RandomUniform(-b_bound, b_bound)
+        else:
+            kernel_initializer = initializers.TruncatedNormal(stddev=0.1)
+            bias_initializer = initializers.TruncatedNormal(stddev=0.1)
+        pnet_layers_list[-2] = MultiHeadDense(
+            self.pi_hidden,
+            self.partition.n_subdomains,
+            kernel_initializer=kernel_initializer,
+            bias_initializer=bias_initializer,
+            kernel_regularizer=self.pnet_kernel_regularizer,
+            bias_regularizer=self.pnet_bias_regularizer,
+            mixed_policy=self.mixed_policy,
+            name="multi_head_bottleneck_pnet",
+        )
+        return pnet_layers_list
+
+    def _call_parameter_net_in_subdomain(self, input_p, input_s):
+        """
+        Calls the parameter network with the latent head of the subdomain of each
+        point.
+
+        Args:
+            input_p (tf.Tensor): Input tensor for the parameter network.
+            input_s (tf.Tensor): Input tensor for the shape network, which selects
+                the subdomain.
+
+        Returns:
+            tuple: A tuple containing the output tensor of the parameter network
+                   and the hidden layer representation (latent).
+        """
+        head = self.partition(input_s)[0]
+        latent = input_p
+        for layer_ in self.pnet_list[:-2]:
+            latent = layer_(latent)
+        latent = self.pnet_list[-2]((latent, head))
+        output_final = self.pnet_list[-1](latent)
+        return output_final, latent
+
+    def model_with_spatial_derivatives(self, order=1):
+        """
+        Builds and returns the NIF model that also outputs the spatial derivatives
+        of the output, see `NIF.model_with_spatial_derivatives`.
+
+        Args:
+            order (int, optional): 1 for `[u, du/dx]`, 2 for `[u, du/dx, laplacian]`.
+                Defaults to 1.
+
+        Returns:
+            tf.keras.Model: The model mapping the inputs to the output and its
+            spatial derivatives.
+        """
+        if order not in (1, 2):
+            raise ValueError("order should be 1 or 2, got {}".format(order))
+        input_tot = tf.keras.layers.Input(
+            shape=(self.pi_dim + self.si_dim), name="input_tot"
+        )
+        input_p = input_tot[:, 0 : self.pi_dim]
+        input_s = input_tot[:, self.pi_dim : self.pi_dim + self.si_dim]
+        pnet_output = self._call_parameter_net_in_subdomain(input_p, input_s)[0]
+        outputs = self._call_shape_net_given_pnet_output(input_s, pnet_output, order)
+        return Model(inputs=[input_tot], outputs=list(outputs))
+
+    def model_p_to_w(self):
+        """
+        Builds and returns a model that maps input parameters and states to the
+        weights and biases of the shape network of the subdomain of each state.
+
+        Returns:
+            tf.keras.Model: The model mapping `[input_p, input_s]` to shape network
+            weights and biases.
+        """
+        input_p = tf.keras.layers.Input(shape=(self.pi_dim), name="input_p_to_w")
+        input_s = tf.keras.layers.Input(shape=(self.si_dim), name="input_s_to_w")
+        return Model(
+            inputs=[input_p, input_s],
+            outputs=[self._call_parameter_net_in_subdomain(input_p, input_s)[0]],
+        )
+
+    def model_p_to_lr(self):
+        """
+        Builds and returns a model that maps input parameters and states to the
+        latent of the subdomain of each state.
+
+        Returns:
+            tf.keras.Model: The model mapping `[input_p, input_s]` to the hidden
+            layer representation.
+        """
+        input_p = tf.keras.layers.Input(shape=(self.pi_dim), name="input_p_to_lr")
+        input_s = tf.keras.layers.Input(shape=(self.si_dim), name="input_s_to_lr")
+        return Model(
+            inputs=[input_p, input_s],
+            outputs=[self._call_parameter_net_in_subdomain(input_p, input_s)[1]],
+        )
+
+    def sensitivity(self, params, points, chunk_size=65536):
+        """
+        Streams the parametric sensitivity field `du/dp` over a set of points, see
+        `NIF.sensitivity`.
+
+        The shape net weights only depend on the points through their subdomain, so
+        the weights of every subdomain and their Jacobian `dw/dp` are obtained in
+        forward mode once per parameter value, and the points of a chunk are
+        evaluated subdomain by subdomain with the weights shared, as in
+        `NIF.sensitivity`. The memory thus only depends on `chunk_size` times the
+        width of the shape net and on the number of subdomains times `po_dim`.
+
+        Args:
+            params (array-like): Parameter values with shape (n_params, pi_dim).
+            points (array-like): Shape net inputs with shape (n_points, si_dim).
+            chunk_size (int, optional): Number of points evaluated at once.
+                Defaults to 65536.
+
+        Yields:
+            tuple: The index of the parameter value, the index of the first point of
+            the chunk, the output with shape (chunk, so_dim) and the sensitivity
+            with shape (chunk, so_dim, pi_dim), as numpy arrays.
+        """
+        params = tf.reshape(
+            tf.cast(params, self.variable_Dtype), [-1, self.pi_dim], name="params"
+        )
+        points = tf.reshape(
+            tf.cast(points, self.variable_Dtype), [-1, self.si_dim], name="points"
+        )
+        n_points = points.shape[0]
+        n_subdomains = self.partition.n_subdomains
+        head = self.partition.locate(points).numpy()
+        # one tangent per parameter, for every subdomain
+        eye_p = tf.tile(
+            tf.eye(self.pi_dim, dtype=self.variable_Dtype), [n_subdomains, 1]
+        )
+        head_tiled = tf.repeat(tf.range(n_subdomains), self.pi_dim)
+
+        @tf.function
+        def p_to_w_and_dw_dp(param):
+            param_tiled = tf.tile(param[tf.newaxis], [n_subdomains * self.pi_dim, 1])
+            with tf.autodiff.ForwardAccumulator(param_tiled, eye_p) as acc:
+                latent = param_tiled
+                for layer_ in self.pnet_list[:-2]:
+                    latent = layer_(latent)
+                latent = self.pnet_list[-2]((latent, head_tiled))
+                w = self.pnet_list[-1](latent)
+            # the weights of each subdomain with one tangent per parameter, both
+            # (n_subdomains, pi_dim, po_dim)
+            shape = [n_subdomains, self.pi_dim, -1]
+            return tf.reshape(w, shape), tf.reshape(acc.jvp(w), shape)
+
+        x_to_u_and_du_dp = tf.function(
+            self._shape_net_sensitivity, reduce_retracing=True
+        )
+        for i in range(params.shape[0]):
+            w, dw_dp = p_to_w_and_dw_dp(params[i])
+            for start in range(0, n_points, chunk_size):
+                head_chunk = head[start : start + chunk_size]
+                u = np.empty((head_chunk.size, self.so_dim), self.variable_Dtype)
+                du_dp = np.empty(
+                    (head_chunk.size, self.so_dim, self.pi_dim), self.variable_Dtype
+                )
+                for k in np.unique(head_chunk):
+                    index = start + np.flatnonzero(head_chunk == k)
+                    u_k, du_dp_k = x_to_u_and_du_dp(
+                        tf.gather(points, index), w[k], dw_dp[k]
+                    )
+                    u[index - start] = u_k.numpy()
+                    du_dp[index - start] = du_dp_k.numpy()
+                yield i, start, u, du_dp
@@ -0,0 +1,448 @@
+"""Structured width pruning of NIF and NIFMultiScale models.
+
+Magnitude pruning with `tfmot` only zeroes weights, so the kernels and `po_dim`
+keep their size. Here whole neurons of the parameter net are removed instead, and
+a model of the same class with a smaller `cfg_parameter_net["units"]` is built:
+
+1. Every neuron is scored on calibration data by the RMS of its contribution to
+   the pre-activations of the layers reading it, i.e., its activation times its
+   outgoing weights. Residual connections tie neurons across layers, so a
+   residual stream is pruned as a whole.
+2. The weights of the kept neurons are sliced from the trained model.
+3. The outgoing weights of the kept neurons are refitted by linear least squares,
+   so the pre-activations of every layer match the original ones over the
+   calibration data. The generated shape net weights are affine in the latent,
+   so the last parameter net layer is refitted so that every shape net layer
+   keeps its pre-activations.
+
+On TravelingWave, 30 -> 20 parameter net units keep the error of a NIFMultiScale
+without fine-tuning, which is better than the same configuration trained from
+scratch. This barely reduces the inference cost though: the last parameter net
+layer, with `(latent_dim + 1) * po_dim` weights, and `po_dim` itself, i.e., the
+size of the generated per-point weights, are set by the shape net, e.g., 52481 ->
+51421 weights with an unchanged `po_dim` of 16833 for a 64 units shape net. The
+shape net is not pruned, since the neurons of a trained SIREN have flat scores:
+removing 8 of 64 of them multiplies the error by orders of magnitude, and even
+after fine-tuning the pruned model is much worse than the same configuration
+trained from scratch. A smaller shape net is better trained from scratch or
+distilled with `nif.distillation.distill`.
+
+Usage:
+model_small = prune_width(model_ori, train_features, parameter_net_units=20)
+model_small.build().fit(...)  # a short fine-tuning further recovers the accuracy
+"""
+
+__all__ = ["neuron_importance", "prune_width"]
+
+import numpy as np
+import tensorflow as tf
+
+from nif.layers import Dense
+from nif.layers import HyperLinearForSIREN
+from nif.layers import MLP_ResNet
+from nif.layers import MLP_SimpleShortCut
+from nif.layers import SIREN
+from nif.layers import SIREN_ResNet
+from nif.model import NIF
+from nif.model import NIFMultiScale
+
+
+def neuron_importance(model_ori, data, batch_size=4096):
+    """
+    Scores the neurons of the parameter net.
+
+    The neurons are grouped by the index spaces that are pruned together, e.g., the
+    output of each hidden layer, or the whole residual stream of a network with
+    residual connections.
+
+    Args:
+        model_ori (NIF or NIFMultiScale): The trained model.
+        data (numpy.ndarray): Calibration inputs with shape
+            (n_samples, pi_dim + si_dim), e.g., a subset of the training features.
+        batch_size (int, optional): Number of samples evaluated at once.
+            Defaults to 4096.
+
+    Returns:
+        numpy.ndarray: The scores with shape (n_groups, units).
+    """
+    _check_supported(model_ori)
+    data = np.asarray(data, dtype=model_ori.variable_Dtype)
+    return _parameter_net_importance(model_ori, data, batch_size)
+
+
+def prune_width(model_ori, data, parameter_net_units, batch_size=4096):
+    """
+    Removes the least important neurons of the parameter net, refits the remaining
+    weights and returns a model with a narrower parameter net.
+
+    Args:
+        model_ori (NIF or NIFMultiScale): The trained model, with full-rank shape net
+            weights and a dense last parameter net layer.
+        data (numpy.ndarray): Calibration inputs with shape
+            (n_samples, pi_dim + si_dim), e.g., a subset of the training features.
+            They should cover the parameters and the domain, and outnumber the
+            refitted weights of a layer, about `(units + 1) * (latent_dim + 1)`.
+        parameter_net_units (int): The new `cfg_parameter_net["units"]`.
+        batch_size (int, optional): Number of samples evaluated at once.
+            Defaults to 4096.
+
+    Returns:
+        NIF or NIFMultiScale: A new model of the same class with the pruned
+        configuration and weights, whose layers are already built.
+    """
+    _check_supported(model_ori)
+    data = np.asarray(data, dtype=model_ori.variable_Dtype)
+    n_st = parameter_net_units
+    if n_st > model_ori.n_st:
+        raise ValueError("pruning can only reduce the width")
+
+    # kept neurons of each group, all the parameter net outputs are kept
+    pnet_scores = _parameter_net_importance(model_ori, data, batch_size)
+    keep = {g: _keep_largest(s, n_st) for g, s in enumerate(pnet_scores)}
+    keep["po"] = np.arange(model_ori.po_dim)
+
+    cfg_parameter_net = dict(model_ori.cfg_parameter_net, units=n_st)
+    model_new = type(model_ori)(
+        model_ori.cfg_shape_net, cfg_parameter_net, model_ori.mixed_policy.name
+    )
+    # create the variables of the lazily built layers
+    model_new.model()
+
+    specs = _parameter_net_specs(model_ori.pnet_list)
+    for layer_ori, layer_new, spec in zip(
+        model_ori.pnet_list, model_new.pnet_list, specs
+    ):
+        vars_ori = _layer_variables(layer_ori)
+        vars_new = _layer_variables(layer_new)
+        for var_ori, var_new, axes in zip(vars_ori, vars_new, spec):
+            index = [
+                np.arange(n) if g is None else keep[g]
+                for g, n in zip(axes, var_ori.shape)
+            ]
+            var_new.assign(var_ori.numpy()[np.ix_(*index)])
+    if model_ori.encoding is not None:
+        model_new.encoding.table.assign(model_ori.encoding.table)
+
+    if n_st < model_ori.n_st:
+        _refit_parameter_net(model_ori, model_new, keep, data, batch_size)
+        # absorbs the change of the latent
+        _refit_shape_net(model_ori, model_new, data, batch_size)
+    return model_new
+
+
+def _check_supported(model_ori):
+    """
+    Raises if the model is not a full-rank `NIF` or `NIFMultiScale`.
+    """
+    if type(model_ori) not in (NIF, NIFMultiScale):
+        raise NotImplementedError(
+            "structured pruning supports NIF and NIFMultiScale, got {}".format(
+                type(model_ori).__name__
+            )
+        )
+    if model_ori.cfg_shape_net.get("connectivity", "full") != "full":
+        raise NotImplementedError("structured pruning needs `connectivity` 'full'")
+    if model_ori.s_rank is not None:
+        raise NotImplementedError(
+            "structured pruning needs full-rank shape net weights"
+        )
+    if model_ori.cfg_parameter_net.get("hyper_rank", None) is not None:
+        raise NotImplementedError(
+            "structured pruning needs a dense `HyperLinearForSIREN`"
+        )
+
+
+def _keep_largest(scores, k):
+    """
+    Returns the sorted indices of the `k` largest scores.
+    """
+    return np.sort(np.argsort(-scores, kind="stable")[:k])
+
+
+def _solve_least_squares(normal_matrix, rhs, prior, ridge=1e-2):
+    """
+    Solves the normal equations with a ridge towards the sliced weights, relative to
+    the mean feature energy. Nearly collinear features, e.g., the sines of a SIREN,
+    would otherwise give huge compensating weights that make any later fine-tuning
+    diverge, while the sliced weights stay a solution when they are exact.
+    """
+    ridge = ridge * np.trace(normal_matrix) / normal_matrix.shape[0] + 1e-12
+    return np.linalg.solve(
+        normal_matrix + ridge * np.eye(normal_matrix.shape[0]), rhs + ridge * prior
+    )
+
+
+def _shape_net_blocks(model_ori, n_sx):
+    """
+    Describes the parameter net output as the list of the shape net weight
+    matrices followed by their biases, in the order of `_distribute_pnet_output`
+    and `_distribute_pnet_output_mres`, each given by its dimensions
+    `(group, size)`, where the group is the index of a shape net neuron group or
+    None for the input and output dimensions.
+    """
+    l_sx = model_ori.l_sx
+    if type(model_ori) is NIF:
+        # the hidden layers are residual, a single stream
+        hidden = [(0, 0)] * l_sx
+        first, last = 0, 0
+    elif model_ori.cfg_shape_net["use_resblock"]:
+        # residual stream 0 and the inner neurons 1 + i of each resblock
+        hidden = [pair for i in range(l_sx) for pair in [(0, 1 + i), (1 + i, 0)]]
+        first, last = 0, 0
+    else:
+        hidden = [(i, i + 1) for i in range(l_sx)]
+        first, last = 0, l_sx
+    weights = (
+        [((None, model_ori.se_dim), (first, n_sx))]
+        + [((g_in, n_sx), (g_out, n_sx)) for g_in, g_out in hidden]
+        + [((last, n_sx), (None, model_ori.so_dim))]
+    )
+    biases = (
+        [((first, n_sx),)]
+        + [((g_out, n_sx),) for _, g_out in hidden]
+        + [((None, model_ori.so_dim),)]
+    )
+    return weights + biases
+
+
+def _shape_net_layers(model_ori, data, batch_size):
+    """
+    Evaluates the shape net on the calibration data batch by batch, in float64.
+
+    Yields:
+        tuple: The parameter net input of the batch and, for each shape net layer
+        in the order of `_shape_net_blocks`, a tuple with the index of its weight
+        matrix block, its input activations, its generated weights and biases and
+        the factor of its matmul.
+    """
+    n_sx, l_sx = model_ori.n_sx, model_ori.l_sx
+    is_mres = type(model_ori) is NIFMultiScale
+    resblock = is_mres and model_ori.cfg_shape_net["use_resblock"]
+    if is_mres:
+        act_fun = tf.math.sin
+        omega_0 = float(model_ori.cfg_shape_net["omega_0"])
+    else:
+        act_fun = tf.keras.activations.get(model_ori.cfg_shape_net["activation"])
+        omega_0 = 1.0
+    model_p_to_w = model_ori.model_p_to_w()
+
+    def linear(a, w, b, scale):
+        return scale * tf.einsum("ai,aij->aj", a, w) + b
+
+    for start in range(0, data.shape[0], batch_size):
+        input_p = data[start : start + batch_size, : model_ori.pi_dim]
+        input_s = data[start : start + batch_size, model_ori.pi_dim :]
+        pnet_output = tf.cast(model_p_to_w(input_p), tf.float64)
+        input_s = tf.cast(model_ori._encode_input(input_s), tf.float64)
+        if is_mres:
+            distributed = NIFMultiScale._distribute_pnet_output_mres(
+                pnet_output, resblock, model_ori.se_dim, model_ori.so_dim, n_sx, l_sx
+            )
+        else:
+            distributed = NIF._distribute_pnet_output(
+                pnet_output, model_ori.se_dim, model_ori.so_dim, n_sx, l_sx
+            )
+        w_1, w_hidden_list, w_l, b_1, b_hidden_list, b_l = distributed
+
+        layers = [(0, input_s, w_1, b_1, omega_0)]
+        u = act_fun(linear(input_s, w_1, b_1, omega_0))
+        for i in range(l_sx):
+            if resblock:
+                (w_a, w_b), (b_a, b_b) = w_hidden_list[i], b_hidden_list[i]
+                h = act_fun(linear(u, w_a, b_a, omega_0))
+                layers.append((1 + 2 * i, u, w_a, b_a, omega_0))
+                layers.append((2 + 2 * i, h, w_b, b_b, omega_0))
+                u = 0.5 * (u + act_fun(linear(h, w_b, b_b, omega_0)))
+            else:
+                w, b = w_hidden_list[i], b_hidden_list[i]
+                layers.append((1 + i, u, w, b, omega_0))
+                u = act_fun(linear(u, w, b, omega_0)) + (0.0 if is_mres else u)
+        layers.append((len(layers), u, w_l, b_l, 1.0))
+        yield input_p, layers
+
+
+def _refit_shape_net(model_ori, model_new, data, batch_size):
+    """
+    Refits the generated weights and biases of every shape net layer, i.e., the
+    corresponding columns of the last parameter net layer of the pruned model, so
+    its pre-activations match the original ones over the calibration data. The
+    layers are refitted in order, each from the activations of the pruned model
+    with the already refitted layers, so the errors do not pile up.
+    """
+    blocks_new = _shape_net_blocks(model_new, model_new.n_sx)
+    n_matrix = len(blocks_new) // 2
+    sizes_new = [int(np.prod([size for _, size in dims])) for dims in blocks_new]
+    offsets_new = np.cumsum([0] + sizes_new[:-1])
+    model_p_to_lr = model_new.model_p_to_lr()
+    kernel, bias = _layer_variables(model_new.pnet_list[-1])
+    n_latent = kernel.shape[0] + 1
+
+    for block in range(n_matrix):
+        normal_matrix, rhs = 0.0, 0.0
+        for (input_p, layers_ori), (_, layers_new) in zip(
+            _shape_net_layers(model_ori, data, batch_size),
+            _shape_net_layers(model_new, data, batch_size),
+        ):
+            _, a, w, b, scale = layers_ori[block]
+            target = scale * tf.einsum("ai,aij->aj", a, w) + b
+            latent = tf.cast(model_p_to_lr(input_p), tf.float64)
+            latent = tf.concat([latent, tf.ones_like(latent[:, :1])], 1)
+            # each generated weight and bias is affine in the latent
+            features = scale * layers_new[block][1]
+            features = features[:, :, tf.newaxis] * latent[:, tf.newaxis, :]
+            features = tf.concat([tf.reshape(features, [a.shape[0], -1]), latent], 1)
+            normal_matrix += tf.matmul(features, features, transpose_a=True).numpy()
+            rhs += tf.matmul(features, target, transpose_a=True).numpy()
+
+        n_rows, n_cols = blocks_new[block][0][1], blocks_new[block][1][1]
+        kernel_value, bias_value = kernel.numpy(), bias.numpy()
+        w_index = offsets_new[block] + np.arange(n_rows * n_cols)
+        b_index = offsets_new[block + n_matrix] + np.arange(n_cols)
+        # (latent, row * n_cols + col) <-> (row, latent, col)
+        w_prior = np.concatenate([kernel_value[:, w_index], bias_value[None, w_index]])
+        w_prior = np.transpose(w_prior.reshape(n_latent, n_rows, n_cols), [1, 0, 2])
+        b_prior = np.concatenate([kernel_value[:, b_index], bias_value[None, b_index]])
+        prior = np.concatenate([w_prior.reshape(-1, n_cols), b_prior])
+
+        coef = _solve_least_squares(normal_matrix, rhs, prior)
+        w_coef = coef[: n_rows * n_latent].reshape(n_rows, n_latent, n_cols)
+        w_coef = np.transpose(w_coef, [1, 0, 2]).reshape(n_latent, -1)
+        b_coef = coef[n_rows * n_latent :]
+        kernel_value[:, w_index], bias_value[w_index] = w_coef[:-1], w_coef[-1]
+        kernel_value[:, b_index], bias_value[b_index] = b_coef[:-1], b_coef[-1]
+        kernel.assign(kernel_value)
+        bias.assign(bias_value)
+
+
+def _parameter_net_specs(pnet_list):
+    """
+    Describes the variables of each parameter net layer, in the order of
+    `_layer_variables`, by the group of each axis: the index of a parameter net
+    neuron group, `"po"` for the parameter net output or None if it is not pruned.
+    """
+    specs = []
+    group, n_groups = 0, 1
+    specs.append([(None, group), (group,)])
+    for layer_ in pnet_list[1:-2]:
+        if isinstance(layer_, (SIREN_ResNet, MLP_ResNet)):
+            mid, n_groups = n_groups, n_groups + 1
+            specs.append([(group, mid), (mid,), (mid, group), (group,)])
+        elif isinstance(layer_, MLP_SimpleShortCut):
+            specs.append([(group, group), (group,)])
+        else:
+            out, n_groups = n_groups, n_groups + 1
+            specs.append([(group, out), (out,)])
+            group = out
+    specs.append([(group, None), (None,)])
+    specs.append([(None, "po"), ("po",)])
+    return specs
+
+
+def _layer_variables(layer_):
+    """
+    Returns the variables of a parameter net layer, each kernel followed by its
+    bias.
+    """
+    if isinstance(layer_, SIREN_ResNet):
+        return [layer_.w, layer_.b, layer_.w2, layer_.b2]
+    if isinstance(layer_, (SIREN, HyperLinearForSIREN)):
+        return [layer_.w, layer_.b]
+    if isinstance(layer_, MLP_ResNet):
+        return [layer_.L1.kernel, layer_.L1.bias, layer_.L2.kernel, layer_.L2.bias]
+    if isinstance(layer_, MLP_SimpleShortCut):
+        return [layer_.L1.kernel, layer_.L1.bias]
+    if isinstance(layer_, Dense):
+        return [layer_.kernel, layer_.bias]
+    raise NotImplementedError(
+        "structured pruning does not support {}".format(type(layer_).__name__)
+    )
+
+
+def _parameter_net_layers(model_ori, data, batch_size):
+    """
+    Evaluates the parameter net on the calibration data batch by batch, in float64.
+
+    Yields:
+        list: For each kernel reading parameter net neurons, a tuple with the index
+        of its layer, the index of the kernel in `_layer_variables`, its input
+        activations and the factor of its matmul.
+    """
+    pnet_list = model_ori.pnet_list
+    specs = _parameter_net_specs(pnet_list)
+    for start in range(0, data.shape[0], batch_size):
+        x = data[start : start + batch_size, : model_ori.pi_dim]
+        kernels = []
+        for i, (layer_, spec) in enumerate(zip(pnet_list[:-1], specs)):
+            scale = 1.0
+            if isinstance(layer_, SIREN_ResNet) or (
+                isinstance(layer_, SIREN) and layer_.layer_position != "bottleneck"
+            ):
+                scale = float(layer_.omega_0)
+            x_64 = tf.cast(x, tf.float64)
+            if spec[0][0] is not None:
+                kernels.append((i, 0, x_64, scale))
+            if isinstance(layer_, SIREN_ResNet):
+                mid = tf.math.sin(
+                    scale * tf.matmul(x_64, tf.cast(layer_.w, tf.float64))
+                    + tf.cast(layer_.b, tf.float64)
+                )
+                kernels.append((i, 2, mid, scale))
+            elif isinstance(layer_, MLP_ResNet):
+                kernels.append((i, 2, tf.cast(layer_.L1(x), tf.float64), scale))
+            x = layer_(x)
+        yield kernels
+
+
+def _parameter_net_importance(model_ori, data, batch_size):
+    """
+    Scores the parameter net neurons by the RMS over the calibration parameters of
+    their contributions to the pre-activations of the layers reading them.
+    """
+    specs = _parameter_net_specs(model_ori.pnet_list)
+    n_groups = 1 + max(
+        g for spec in specs for axes in spec for g in axes if isinstance(g, int)
+    )
+    score_sq = np.zeros((n_groups, model_ori.n_st))
+    for kernels in _parameter_net_layers(model_ori, data, batch_size):
+        for i, j, a, scale in kernels:
+            kernel = _layer_variables(model_ori.pnet_list[i])[j].numpy()
+            score_sq[specs[i][j][0]] += (
+                scale**2
+                * tf.reduce_sum(tf.square(a), 0).numpy()
+                * np.sum(np.square(kernel), 1)
+            )
+    return np.sqrt(score_sq / data.shape[0])
+
+
+def _refit_parameter_net(model_ori, model_new, keep, data, batch_size):
+    """
+    Refits the kernels and biases of every parameter net layer reading pruned
+    neurons, so its pre-activations match the original ones over the calibration
+    parameters, given the original activations of the kept neurons.
+    """
+    specs = _parameter_net_specs(model_ori.pnet_list)
+    normal = {}
+    for kernels in _parameter_net_layers(model_ori, data, batch_size):
+        for i, j, a, scale in kernels:
+            kernel, bias = _layer_variables(model_ori.pnet_list[i])[j : j + 2]
+            group_in, group_out = specs[i][j]
+            target = scale * tf.matmul(a, tf.cast(kernel, tf.float64))
+            target = target + tf.cast(bias, tf.float64)
+            if group_out is not None:
+                target = tf.gather(target, keep[group_out], axis=1)
+            features = scale * tf.gather(a, keep[group_in], axis=1)
+            features = tf.concat([features, tf.ones_like(a[:, :1])], 1)
+            normal_matrix = tf.matmul(features, features, transpose_a=True).numpy()
+            rhs = tf.matmul(features, target, transpose_a=True).numpy()
+            if (i, j) in normal:
+                normal[(i, j)][0] += normal_matrix
+                normal[(i, j)][1] += rhs
+            else:
+                normal[(i, j)] = [normal_matrix, rhs]
+
+    for (i, j), (normal_matrix, rhs) in normal.items():
+        kernel, bias = _layer_variables(model_new.pnet_list[i])[j : j + 2]
+        prior = np.concatenate([kernel.numpy(), bias.numpy()[np.newaxis]])
+        coef = _solve_least_squares(normal_matrix, rhs, prior)
+        kernel.assign(coef[:-1])
+        bias.assign(coef[-1])
@@ -0,0 +1,535 @@
+"""Post-training int8 quantization of NIF inference graphs with TensorFlow Lite.
+
+Any of the inference models, e.g., `model_p_to_w`, `model_x_to_u_given_w`,
+`model_x_to_phi`, or a shape net specialized to one parameter value with
+`specialize_shape_net`, is frozen and converted to a TensorFlow Lite model with
+int8 weights, and optionally int8 or int16 activations calibrated on a
+representative set of inputs. The inputs and outputs stay float32, so the
+quantized model is a drop-in replacement.
+
+The TensorFlow Lite converter only gives per-tensor scales to fully connected
+layers, so every matmul with constant weights is first rewritten as a 1x1
+convolution, whose weights are quantized with one scale per output channel.
+Operations without an int8 kernel, e.g., `sin`, run in float32 in between.
+
+By default, i.e., `activations=None`, only the weights are int8 and the
+activations stay float. Integer activations are an explicit opt-in: the int8
+rounding of the sine arguments of a SIREN with a large `omega_0` is amplified by
+the sine, e.g., a relative L2 error of 0.1 to 1.2 on TravelingWave with
+`omega_0=30`, and `"int16"` still gives a few percent. `quantization_report`
+flags the fields whose error is above a threshold, check it before deploying.
+
+On a CPU, the int8 graphs are smaller but not faster than the float32 TensorFlow
+Lite graph, `activations="float32"`: the speedup over Keras comes from the
+runtime. E.g., on TravelingWave with `omega_0=30`, a shape net specialized to a
+parameter value runs 63x faster than Keras in float32 TensorFlow Lite with a
+relative error of 2e-6, while its int8 weights give a relative error of 2e-2 and
+no further speedup, see `benchmarks/quantization.py`. Quantize for the size, or
+when the error is small enough, and fall back to the float32 graph otherwise.
+
+Usage:
+p_to_w = quantize(model_ori.model_p_to_w(), train_features[:, :1])
+with open("p_to_w.tflite", "wb") as f:
+    f.write(p_to_w)
+print(quantization_report(model_ori.model_p_to_w(), p_to_w, test_features[:, :1]))
+w = TFLiteModel(p_to_w).predict(test_features[:, :1])
+"""
+
+__all__ = [
+    "quantize",
+    "specialize_shape_net",
+    "TFLiteModel",
+    "quantization_report",
+    "relative_errors",
+]
+
+import time
+import warnings
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.python.framework import tensor_util
+from tensorflow.python.framework.convert_to_constants import (
+    convert_variables_to_constants_v2,
+)
+
+from nif.model import LowRankWeight
+from nif.model import NIF
+from nif.model import NIFMultiScale
+from nif.model import NIFMultiScaleLastLayerParameterized
+
+
+def quantize(
+    model, representative_data, activations=None, batch_size=256, per_channel=True
+):
+    """
+    Converts an inference model to a TensorFlow Lite model with int8 weights and,
+    optionally, integer activations.
+
+    Args:
+        model (tf.keras.Model): The float model, e.g., `model_ori.model_p_to_w()`,
+            `model_ori.model_x_to_u_given_w()`, `model_ori.model_x_to_phi()` or
+            `specialize_shape_net(model_ori, param)`.
+        representative_data (numpy.ndarray or list): Calibration inputs, one array
+            with shape (n_samples, input_dim) per model input, e.g., a subset of the
+            training points. Their shapes give the input signature, and the ranges
+            of integer activations are calibrated on them. The default weight-only
+            mode needs no calibration: the matmuls quantize their input on the
+            fly, at run time.
+        activations (str, optional): The type of the activations, None to keep them
+            float and only quantize the weights, each matmul then quantizing its
+            input on the fly, `"int16"` for 16-bit activations, or `"int8"` for an
+            integer-only graph. `"float32"` gives the unquantized graph, as a
+            baseline. Warning: integer activations can destroy the accuracy of a
+            SIREN, e.g., a relative error above 50% with int8 and `omega_0=30`,
+            check the output of `quantization_report`. Defaults to None.
+        batch_size (int, optional): Number of samples per calibration step.
+            Defaults to 256.
+        per_channel (bool, optional): Whether the constant weights of the matmuls
+            get one scale per output channel. Defaults to True.
+
+    Returns:
+        bytes: The TensorFlow Lite flatbuffer, with float32 inputs and outputs.
+    """
+    representative_data = _as_list(representative_data)
+    function, graph, n_constant_weights = _frozen_function(
+        model, representative_data, per_channel
+    )
+    if n_constant_weights == 0 and activations != "float32":
+        warnings.warn(
+            "the model has no constant weights, e.g., `model_x_to_u_given_w` whose "
+            "weights are inputs, so no weight is quantized"
+            + (" and the graph stays float" if activations is None else "")
+        )
+    converter = tf.lite.TFLiteConverter.from_concrete_functions([function], graph)
+    if activations == "float32":
+        return converter.convert()
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if activations is None:
+        return converter.convert()
+    if activations == "int16":
+        converter.target_spec.supported_ops = [
+            tf.lite.OpsSet.EXPERIMENTAL_TFLITE_BUILTINS_ACTIVATIONS_INT16_WEIGHTS_INT8,
+            tf.lite.OpsSet.TFLITE_BUILTINS,
+        ]
+    elif activations != "int8":
+        raise ValueError("`activations` should be 'int8', 'int16', None or 'float32'")
+
+    def representative_dataset():
+        for start in range(0, representative_data[0].shape[0], batch_size):
+            yield [x[start : start + batch_size] for x in representative_data]
+
+    converter.representative_dataset = representative_dataset
+    return converter.convert()
+
+
+def specialize_shape_net(model_ori, param):
+    """
+    Builds the shape net of a model for one parameter value, with the generated
+    weights and biases as constants, so it is a plain network that can be quantized
+    per channel, e.g., to evaluate a snapshot on many points.
+
+    Args:
+        model_ori (NIF, NIFMultiScale or NIFMultiScaleLastLayerParameterized): The
+            trained model, with `connectivity` 'full' or 'last_layer'.
+        param (array-like): The parameter value with shape (pi_dim,).
+
+    Returns:
+        tf.keras.Model: The model mapping the shape net input with shape
+        (batch_size, si_dim) to the output with shape (batch_size, so_dim).
+    """
+    param = np.reshape(np.asarray(param, dtype=model_ori.variable_Dtype), [1, -1])
+    pnet_output = model_ori.model_p_to_w()(param)
+    input_s = tf.keras.layers.Input(shape=(model_ori.si_dim), name="input_s")
+    u = model_ori._encode_input(input_s)
+
+    if type(model_ori) is NIFMultiScaleLastLayerParameterized:
+        phi_x = model_ori._call_shape_net_get_phi_x(
+            u, model_ori.snet_list, model_ori.so_dim, model_ori.pi_hidden
+        )
+        # the dot with the coefficients as a block-diagonal matrix
+        kernel = np.kron(
+            np.eye(model_ori.so_dim), np.reshape(pnet_output.numpy(), [-1, 1])
+        )
+        u = tf.reshape(phi_x, [-1, model_ori.so_dim * model_ori.pi_hidden])
+        u = model_ori.last_bias_layer(tf.matmul(u, _constant(kernel, u.dtype)))
+        return tf.keras.Model(inputs=[input_s], outputs=[u])
+
+    if type(model_ori) not in (NIF, NIFMultiScale):
+        raise NotImplementedError(
+            "shape net specialization supports NIF, NIFMultiScale and "
+            "NIFMultiScaleLastLayerParameterized, got {}".format(
+                type(model_ori).__name__
+            )
+        )
+    if model_ori.cfg_shape_net.get("connectivity", "full") != "full":
+        raise NotImplementedError(
+            "shape net specialization needs `connectivity` 'full'"
+        )
+
+    is_mres = type(model_ori) is NIFMultiScale
+    resblock = is_mres and model_ori.cfg_shape_net["use_resblock"]
+    args = (model_ori.se_dim, model_ori.so_dim, model_ori.n_sx, model_ori.l_sx)
+    if is_mres:
+        distributed = NIFMultiScale._distribute_pnet_output_mres(
+            pnet_output, resblock, *args, rank=model_ori.s_rank
+        )
+        act_fun = tf.math.sin
+        omega_0 = model_ori.cfg_shape_net["omega_0"]
+    else:
+        distributed = NIF._distribute_pnet_output(
+            pnet_output, *args, rank=model_ori.s_rank
+        )
+        act_fun = tf.keras.activations.get(model_ori.cfg_shape_net["activation"])
+        omega_0 = 1.0
+    w_1, w_hidden_list, w_l, b_1, b_hidden_list, b_l = distributed
+    base_list = model_ori.snet_base_list
+    if base_list is None:
+        base_list = [[None, None] if resblock else None] * model_ori.l_sx
+
+    def linear(u_, w, b, base=None, scale=1.0):
+        kernel = _specialized_weight(w, base) * scale
+        return tf.matmul(u_, _constant(kernel, u_.dtype)) + _constant(b[0], u_.dtype)
+
+    u = act_fun(linear(u, w_1, b_1, scale=omega_0))
+    for i in range(model_ori.l_sx):
+        if resblock:
+            (w_a, w_b), (b_a, b_b) = w_hidden_list[i], b_hidden_list[i]
+            h = act_fun(linear(u, w_a, b_a, base_list[i][0], omega_0))
+            u = 0.5 * (u + act_fun(linear(h, w_b, b_b, base_list[i][1], omega_0)))
+        else:
+            h = act_fun(
+                linear(u, w_hidden_list[i], b_hidden_list[i], base_list[i], omega_0)
+            )
+            u = h if is_mres else h + u
+    u = linear(u, w_l, b_l)
+    return tf.keras.Model(
+        inputs=[input_s], outputs=[tf.cast(u, model_ori.variable_Dtype)]
+    )
+
+
+class TFLiteModel(object):
+    """
+    Runs a TensorFlow Lite model on inputs of any length, chunk by chunk.
+
+    Args:
+        model_content (bytes): The TensorFlow Lite flatbuffer, e.g., from `quantize`.
+        num_threads (int, optional): Number of threads of the interpreter. Defaults
+            to None, i.e., the TensorFlow Lite default.
+    """
+
+    def __init__(self, model_content, num_threads=None):
+        self.interpreter = tf.lite.Interpreter(
+            model_content=model_content, num_threads=num_threads
+        )
+        self._input_details = sorted(
+            self.interpreter.get_input_details(), key=lambda d: d["name"]
+        )
+        self._output_details = self.interpreter.get_output_details()
+        self._chunk_size = None
+
+    def predict(self, inputs, batch_size=65536):
+        """
+        Evaluates the model.
+
+        Args:
+            inputs (numpy.ndarray or list): One array with shape (n_samples, dim)
+                per model input.
+            batch_size (int, optional): Number of samples evaluated at once.
+                Defaults to 65536.
+
+        Returns:
+            numpy.ndarray or list: The output, or the list of outputs.
+        """
+        inputs = [np.asarray(x, dtype=np.float32) for x in _as_list(inputs)]
+        outputs = [[] for _ in self._output_details]
+        for start in range(0, inputs[0].shape[0], batch_size):
+            chunk = [x[start : start + batch_size] for x in inputs]
+            if chunk[0].shape[0] != self._chunk_size:
+                for detail, x in zip(self._input_details, chunk):
+                    self.interpreter.resize_tensor_input(detail["index"], x.shape)
+                self.interpreter.allocate_tensors()
+                self._chunk_size = chunk[0].shape[0]
+            for detail, x in zip(self._input_details, chunk):
+                self.interpreter.set_tensor(detail["index"], x)
+            self.interpreter.invoke()
+            for output, detail in zip(outputs, self._output_details):
+                output.append(self.interpreter.get_tensor(detail["index"]))
+        outputs = [np.concatenate(output) for output in outputs]
+        return outputs[0] if len(outputs) == 1 else outputs
+
+
+def quantization_report(
+    model,
+    tflite_model,
+    inputs,
+    field_names=None,
+    batch_size=65536,
+    n_repeat=5,
+    tolerance=1e-2,
+):
+    """
+    Compares a quantized model with the float model on a set of inputs, e.g., the
+    points of a demo dataset, and warns if the error of a field is above a
+    tolerance.
+
+    Args:
+        model (tf.keras.Model): The float model.
+        tflite_model (bytes or TFLiteModel): The quantized model.
+        inputs (numpy.ndarray or list): One array with shape (n_samples, dim) per
+            model input.
+        field_names (list, optional): Names of the columns of the first output.
+            Defaults to None, i.e., their index.
+        batch_size (int, optional): Number of samples evaluated at once by both
+            models. Defaults to 65536.
+        n_repeat (int, optional): Number of timed evaluations, the fastest is kept.
+            Defaults to 5.
+        tolerance (float, optional): The fields whose relative L2 error is above it
+            are flagged. Defaults to 1e-2.
+
+    Returns:
+        dict: The `relative_errors` of the first output of the quantized model, the
+        names of the fields above the tolerance as `"flagged_fields"`, the seconds
+        per evaluation of all the inputs by the float model and by the quantized
+        one, as `"time_float"` and `"time_quantized"`, and the `"speedup"`.
+    """
+    inputs = [np.asarray(x, dtype=np.float32) for x in _as_list(inputs)]
+    if not isinstance(tflite_model, TFLiteModel):
+        tflite_model = TFLiteModel(tflite_model)
+
+    def predict_float():
+        return _as_list(model.predict(inputs, batch_size=batch_size, verbose=0))[0]
+
+    def predict_quantized():
+        return _as_list(tflite_model.predict(inputs, batch_size=batch_size))[0]
+
+    reference, time_float = _timed(predict_float, n_repeat)
+    prediction, time_quantized = _timed(predict_quantized, n_repeat)
+    report = relative_errors(reference, prediction, field_names)
+    flagged_fields = [
+        name
+        for name, error in report["relative_l2_error"].items()
+        if not error <= tolerance
+    ]
+    if flagged_fields:
+        warnings.warn(
+            "the relative L2 error of the quantized model is above {:g} for the "
+            "fields {}".format(tolerance, flagged_fields)
+        )
+    report.update(
+        {
+            "flagged_fields": flagged_fields,
+            "time_float": time_float,
+            "time_quantized": time_quantized,
+            "speedup": time_float / time_quantized,
+        }
+    )
+    return report
+
+
+def relative_errors(reference, prediction, field_names=None):
+    """
+    Computes the error of each field, i.e., output column, relative to the
+    magnitude of the reference.
+
+    Args:
+        reference (numpy.ndarray): The float output with shape (n_samples, n_fields).
+        prediction (numpy.ndarray): The quantized output with the same shape.
+        field_names (list, optional): Names of the fields. Defaults to None, i.e.,
+            their index.
+
+    Returns:
+        dict: For each field, the relative L2 error as `"relative_l2_error"` and the
+        largest error over the largest magnitude as `"relative_max_error"`.
+    """
+    reference = np.reshape(reference, [reference.shape[0], -1])
+    prediction = np.reshape(prediction, [prediction.shape[0], -1])
+    if field_names is None:
+        field_names = [str(i) for i in range(reference.shape[1])]
+    tiny = np.finfo(np.float32).tiny
+    error = prediction - reference
+    l2_error = np.linalg.norm(error, axis=0) / (
+        np.linalg.norm(reference, axis=0) + tiny
+    )
+    max_error = np.max(np.abs(error), 0) / (np.max(np.abs(reference), 0) + tiny)
+    return {
+        "relative_l2_error": dict(zip(field_names, l2_error)),
+        "relative_max_error": dict(zip(field_names, max_error)),
+    }
+
+
+def _as_list(x):
+    """
+    Wraps a single array in a list.
+    """
+    return list(x) if isinstance(x, (list, tuple)) else [x]
+
+
+def _constant(value, dtype):
+    """
+    Returns a numpy or eager value as a constant of the given dtype.
+    """
+    return tf.constant(np.asarray(value), dtype=dtype)
+
+
+def _specialized_weight(w, base=None):
+    """
+    Returns the weight matrix of a shape net layer for the only parameter value,
+    from the generated weight or its low-rank factors and the shared base matrix.
+    """
+    if isinstance(w, LowRankWeight):
+        kernel = np.matmul(w.u[0].numpy(), w.v[0].numpy())
+    else:
+        kernel = w[0].numpy()
+    if base is not None:
+        kernel = kernel + base.kernel.numpy()
+    return kernel
+
+
+def _timed(fn, n_repeat):
+    """
+    Returns the result of a function and its fastest time over `n_repeat` calls,
+    after a warm-up call.
+    """
+    result = fn()
+    elapsed = []
+    for _ in range(n_repeat):
+        t0 = time.perf_counter()
+        fn()
+        elapsed.append(time.perf_counter() - t0)
+    return result, min(elapsed)
+
+
+def _frozen_function(model, representative_data, per_channel):
+    """
+    Traces a model with a dynamic batch size and freezes its variables.
+
+    Returns:
+        tuple: The frozen concrete function, the object tracking its graph, and the
+        number of matmuls with constant weights.
+    """
+    specs = [
+        tf.TensorSpec([None] + list(x.shape[1:]), tf.float32, name="input_{}".format(i))
+        for i, x in enumerate(representative_data)
+    ]
+
+    @tf.function(input_signature=specs)
+    def serve(*inputs):
+        return _as_list(model(list(inputs)))
+
+    frozen = convert_variables_to_constants_v2(serve.get_concrete_function())
+    graph_def = frozen.graph.as_graph_def()
+    n_constant_weights = _count_constant_matmuls(graph_def)
+    if per_channel:
+        graph_def = _matmul_to_conv(graph_def)
+
+    def import_graph():
+        tf.compat.v1.import_graph_def(graph_def, name="")
+
+    wrapped = tf.compat.v1.wrap_function(import_graph, [])
+    function = wrapped.prune(
+        [wrapped.graph.as_graph_element(t.name) for t in frozen.inputs],
+        [wrapped.graph.as_graph_element(t.name) for t in frozen.outputs],
+    )
+    return function, wrapped, n_constant_weights
+
+
+def _count_constant_matmuls(graph_def):
+    """
+    Returns the number of matmuls, batched or not, whose right operand is a
+    constant, i.e., whose weights can be quantized.
+    """
+    nodes = {node.name: node for node in graph_def.node}
+
+    def source(name):
+        node = nodes[name.split(":")[0]]
+        while node.op == "Identity":
+            node = nodes[node.input[0].split(":")[0]]
+        return node
+
+    return sum(
+        node.op in ("MatMul", "BatchMatMulV2", "Einsum")
+        and source(node.input[1]).op == "Const"
+        for node in graph_def.node
+    )
+
+
+def _matmul_to_conv(graph_def):
+    """
+    Rewrites every float32 `MatMul` with a constant right operand as a 1x1
+    `Conv2D` between two reshapes, so the converter quantizes its weights per
+    output channel. The last reshape keeps the name of the `MatMul`.
+    """
+    nodes = {node.name: node for node in graph_def.node}
+
+    def source(name):
+        node = nodes[name.split(":")[0]]
+        while node.op == "Identity":
+            node = nodes[node.input[0].split(":")[0]]
+        return node
+
+    def add_node(name, op, inputs, **attrs):
+        node = new_graph_def.node.add()
+        node.name, node.op = name, op
+        node.input.extend(inputs)
+        for key, value in attrs.items():
+            if isinstance(value, tf.DType):
+                node.attr[key].type = value.as_datatype_enum
+            elif isinstance(value, np.ndarray):
+                node.attr[key].tensor.CopyFrom(tensor_util.make_tensor_proto(value))
+            elif isinstance(value, list):
+                node.attr[key].list.i.extend(value)
+            else:
+                node.attr[key].s = value
+
+    new_graph_def = tf.compat.v1.GraphDef()
+    new_graph_def.versions.CopyFrom(graph_def.versions)
+    new_graph_def.library.CopyFrom(graph_def.library)
+    for node in graph_def.node:
+        if (
+            node.op != "MatMul"
+            or node.attr["T"].type != tf.float32.as_datatype_enum
+            or node.attr["transpose_a"].b
+            or node.attr["transpose_b"].b
+            or source(node.input[1]).op != "Const"
+        ):
+            new_graph_def.node.add().CopyFrom(node)
+            continue
+        kernel = tensor_util.MakeNdarray(source(node.input[1]).attr["value"].tensor)
+        n_in, n_out = kernel.shape
+        prefix = node.name + "/conv_1x1"
+        for name, value in [
+            ("filter", kernel.reshape(1, 1, n_in, n_out)),
+            ("input_shape", np.array([-1, 1, 1, n_in], dtype=np.int32)),
+            ("output_shape", np.array([-1, n_out], dtype=np.int32)),
+        ]:
+            add_node(
+                prefix + "/" + name,
+                "Const",
+                [],
+                dtype=tf.as_dtype(value.dtype),
+                value=value,
+            )
+        add_node(
+            prefix + "/input",
+            "Reshape",
+            [node.input[0], prefix + "/input_shape"],
+            T=tf.float32,
+            Tshape=tf.int32,
+        )
+        add_node(
+            prefix + "/conv",
+            "Conv2D",
+            [prefix + "/input", prefix + "/filter"],
+            T=tf.float32,
+            strides=[1, 1, 1, 1],
+            padding=b"VALID",
+        )
+        add_node(
+            node.name,
+            "Reshape",
+            [prefix + "/conv", prefix + "/output_shape"],
+            T=tf.float32,
+            Tshape=tf.int32,
+        )
+    return new_graph_def
@@ -0,0 +1,65 @@
+import numpy as np
+
+from nif.data import PointBudgetCurriculum
+from nif.data import PointWiseData
+
+
+def cell_index(x, n_cells):
+    return np.minimum(np.floor(x * n_cells), n_cells - 1).astype(int)
+
+
+def test_sample_keeps_one_point_per_cell():
+    rng = np.random.default_rng(0)
+    # a time column, used as the group, and two spatial columns in [0, 1]
+    features = np.hstack(
+        [np.repeat([[0.0], [1.0]], 500, 0), rng.uniform(size=(1000, 2))]
+    ).astype(np.float32)
+    curriculum = PointBudgetCurriculum(
+        [1, 2], [0.0, 0.0], [1.0, 1.0], initial_cells=4, n_stages=2, group_columns=[0]
+    )
+    for epoch, n_cells in [(0, 4), (1, 8)]:
+        mask = curriculum.sample(features, epoch).numpy()
+        cells = cell_index(features[:, 1:], n_cells)
+        keys = features[:, 0] * n_cells**2 + cells[:, 0] * n_cells + cells[:, 1]
+        # every occupied cell of every group keeps exactly one point
+        np.testing.assert_array_equal(np.sort(keys[mask]), np.unique(keys))
+
+    # after the stages, all the points are kept
+    assert curriculum.sample(features, 2).numpy().all()
+
+
+def test_sample_depends_on_the_epoch():
+    features = np.random.default_rng(0).uniform(size=(1000, 1)).astype(np.float32)
+    curriculum = PointBudgetCurriculum([0], [0.0], [1.0], initial_cells=8)
+    mask_0 = curriculum.sample(features, 0).numpy()
+    np.testing.assert_array_equal(mask_0, curriculum.sample(features, 0).numpy())
+    assert mask_0.sum() == 8
+    # the next epoch is the next stage, with twice as many cells
+    assert curriculum.sample(features, 1).numpy().sum() == 16
+
+
+def test_curriculum_dataset_follows_the_epochs():
+    rng = np.random.default_rng(0)
+    raw = np.hstack(
+        [
+            rng.uniform(size=(1000, 1)),
+            rng.uniform(size=(1000, 1)),
+            rng.normal(size=(1000, 1)),
+        ]
+    ).astype(np.float32)
+    pw_data = PointWiseData(raw[:, :1], raw[:, 1:2], raw[:, 2:])
+    pw_data.data = raw
+    curriculum = PointBudgetCurriculum([1], [0.0], [1.0], initial_cells=4, n_stages=2)
+    make_dataset = pw_data.get_curriculum_dataset(curriculum, batch_size=64, seed=0)
+    for epoch, n_points in [(0, 4), (1, 8), (2, 1000), (3, 1000)]:
+        features = np.concatenate(
+            [f for f, _ in make_dataset(epoch).as_numpy_iterator()]
+        )
+        assert features.shape == (n_points, 2)
+    # the full data is reshuffled at every epoch
+    epoch_2, epoch_3 = [
+        np.concatenate([f for f, _ in make_dataset(e).as_numpy_iterator()])
+        for e in (2, 3)
+    ]
+    assert not np.array_equal(epoch_2, epoch_3)
+    np.testing.assert_array_equal(np.sort(epoch_2, 0), np.sort(raw[:, :2], 0))
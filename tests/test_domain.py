@@ -0,0 +1,64 @@
+import numpy as np
+import tensorflow as tf
+
+from nif.layers import GridPartition
+from nif.layers import KDTreePartition
+
+
+def test_grid_partition_locate():
+    partition = GridPartition([[0.0, 0.5, 1.0], [0.0, 1.0, 2.0, 3.0]])
+    points = np.array(
+        [
+            [0.25, 0.5],  # cell (0, 0)
+            [0.25, 2.5],  # cell (0, 2)
+            [0.75, 1.5],  # cell (1, 1)
+            [0.5, 1.0],  # on the edges, to the upper cell (1, 1)
+            [-1.0, 5.0],  # outside, to the closest cell (0, 2)
+        ],
+        np.float32,
+    )
+    # row-major, the last dimension being the fastest
+    np.testing.assert_array_equal(partition.locate(points).numpy(), [0, 2, 4, 4, 2])
+
+
+def test_grid_partition_local_coordinates():
+    partition = GridPartition([[0.0, 0.5, 1.0], [0.0, 1.0]])
+    head, x_local, inv_half_width = partition(np.array([[0.75, 0.5]], np.float32))
+    assert head.numpy()[0] == 1
+    # the cell [0.5, 1] x [0, 1] is centered at (0.75, 0.5) with a half width of 0.5
+    np.testing.assert_allclose(x_local.numpy(), [[0.0, 0.0]])
+    np.testing.assert_allclose(inv_half_width.numpy(), [2.0])
+
+
+def test_kdtree_partition_locate():
+    # root split at x = 0.5, then y = 0.25 on the left and y = 0.75 on the right
+    partition = KDTreePartition(
+        split_dim=[0, 1, 1],
+        split_value=[0.5, 0.25, 0.75],
+        lower=[[0.0, 0.0], [0.0, 0.25], [0.5, 0.0], [0.5, 0.75]],
+        upper=[[0.5, 0.25], [0.5, 1.0], [1.0, 0.75], [1.0, 1.0]],
+    )
+    points = np.array(
+        [
+            [0.1, 0.1],
+            [0.1, 0.9],
+            [0.9, 0.1],
+            [0.9, 0.9],
+            [0.5, 0.25],  # on both splits, to the left
+        ],
+        np.float32,
+    )
+    np.testing.assert_array_equal(partition.locate(points).numpy(), [0, 1, 2, 3, 0])
+
+
+def test_kdtree_partition_from_points_is_balanced():
+    points = np.random.default_rng(0).uniform(size=(1024, 2))
+    partition = KDTreePartition.from_points(points, depth=3)
+    sizes = [index.size for index in partition.group(points)]
+    assert partition.n_subdomains == 8
+    assert sum(sizes) == 1024
+    assert max(sizes) - min(sizes) <= 2
+    # every point lies in the box of its leaf
+    head = partition.locate(tf.constant(points, tf.float32)).numpy()
+    assert np.all(points >= partition.lower[head] - 1e-6)
+    assert np.all(points <= partition.upper[head] + 1e-6)
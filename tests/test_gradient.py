@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+import tensorflow as tf
+
+from nif.layers.gradient import compute_output_and_grad
+from nif.layers.gradient import HessianLayer
+
+
+@pytest.fixture
+def model():
+    tf.keras.utils.set_random_seed(0)
+    return tf.keras.Sequential(
+        [
+            tf.keras.layers.Dense(16, "tanh", dtype="float64"),
+            tf.keras.layers.Dense(16, "tanh", dtype="float64"),
+            tf.keras.layers.Dense(3, dtype="float64"),
+        ]
+    )
+
+
+@pytest.fixture
+def x():
+    return tf.constant(np.random.default_rng(0).normal(size=(8, 4)))
+
+
+def reference_jacobian(model, x):
+    with tf.GradientTape() as tape:
+        tape.watch(x)
+        y = model(x)
+    return y, tape.batch_jacobian(y, x)
+
+
+@pytest.mark.parametrize("mode", ["forward", "reverse", "auto"])
+@pytest.mark.parametrize(
+    "x_index, y_index",
+    [([1], [0, 1, 2]), ([0, 2], [0, 1, 2]), ([0, 1, 2, 3], [1]), (3, 0)],
+)
+def test_compute_output_and_grad(model, x, mode, x_index, y_index):
+    y_ref, jacobian = reference_jacobian(model, x)
+    y, dys_dxs = compute_output_and_grad(model, x, x_index, y_index, mode)
+    expected = tf.gather(
+        tf.gather(jacobian, np.atleast_1d(y_index), axis=1),
+        np.atleast_1d(x_index),
+        axis=2,
+    )
+    np.testing.assert_allclose(y, y_ref, rtol=1e-12)
+    np.testing.assert_allclose(dys_dxs, expected, rtol=1e-10, atol=1e-12)
+
+
+def test_compute_output_and_grad_invalid_mode(model, x):
+    with pytest.raises(ValueError):
+        compute_output_and_grad(model, x, [0], [0], "backward")
+
+
+def reference_hessian(model, x):
+    with tf.GradientTape() as outer:
+        outer.watch(x)
+        with tf.GradientTape() as inner:
+            inner.watch(x)
+            y = model(x)
+        jacobian = inner.batch_jacobian(y, x)
+    # (batch, y, x, x)
+    return y, jacobian, outer.batch_jacobian(jacobian, x)
+
+
+@pytest.mark.parametrize("mode", ["full", "diagonal", "hvp"])
+@pytest.mark.parametrize(
+    "x_index, y_index", [([0, 2], [0, 1, 2]), ([3], [1]), ([0, 1, 2, 3], [2])]
+)
+def test_hessian_layer(model, x, mode, x_index, y_index):
+    y_ref, jacobian, hessian = reference_hessian(model, x)
+    jacobian = tf.gather(tf.gather(jacobian, y_index, axis=1), x_index, axis=2)
+    # (batch, len(y_index), len(x_index), len(x_index))
+    hessian = tf.gather(
+        tf.gather(tf.gather(hessian, y_index, axis=1), x_index, axis=2),
+        x_index,
+        axis=3,
+    ).numpy()
+    vector = tf.constant(np.random.default_rng(1).normal(size=(8, len(x_index))))
+
+    layer = HessianLayer(model, y_index, x_index, mode)
+    if mode == "hvp":
+        y, dys_dxs, second = layer(x, vector)
+        expected = np.einsum("byij,bj->byi", hessian, vector.numpy())
+    else:
+        y, dys_dxs, second = layer(x)
+        if mode == "diagonal":
+            expected = np.diagonal(hessian, axis1=2, axis2=3)
+        else:
+            expected = hessian
+    # the layer casts its input to float32
+    np.testing.assert_allclose(y, y_ref, rtol=1e-5, atol=1e-6)
+    np.testing.assert_allclose(dys_dxs, jacobian, rtol=1e-5, atol=1e-6)
+    np.testing.assert_allclose(second, expected, rtol=1e-5, atol=1e-6)
+
+
+def test_hessian_layer_hvp_requires_vector(model, x):
+    with pytest.raises(ValueError):
+        HessianLayer(model, [0], [0], "hvp")(x)
@@ -0,0 +1,34 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def imports_tensorflow(statement):
+    """
+    Runs `statement` in a fresh interpreter and returns whether TensorFlow was
+    imported.
+    """
+    code = "{}\nimport sys\nprint('tensorflow' in sys.modules)".format(statement)
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=ROOT,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return output.split()[-1] == "True"
+
+
+@pytest.mark.parametrize(
+    "statement", ["import nif", "from nif.inference import NumpyModel"]
+)
+def test_import_does_not_import_tensorflow(statement):
+    assert not imports_tensorflow(statement)
+
+
+def test_model_access_imports_tensorflow():
+    assert imports_tensorflow("import nif\nnif.NIFMultiScale")
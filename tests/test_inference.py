@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+import tensorflow as tf
+
+from nif import NIF
+from nif import NIFMultiScale
+from nif import NIFMultiScaleLastLayerParameterized
+from nif.inference import export_numpy
+from nif.inference import NumpyModel
+
+CFG_PARAMETER_NET = {
+    "use_resblock": False,
+    "input_dim": 1,
+    "latent_dim": 2,
+    "units": 16,
+    "nlayers": 2,
+    "activation": "swish",
+}
+CFG_SHAPE_NET = {
+    "connectivity": "full",
+    "input_dim": 2,
+    "output_dim": 2,
+    "units": 16,
+    "nlayers": 2,
+    "weight_init_factor": 0.01,
+    "omega_0": 30.0,
+    "use_resblock": True,
+}
+
+
+@pytest.mark.parametrize(
+    "model_class, cfg_shape_net",
+    [
+        (
+            NIF,
+            {
+                "input_dim": 2,
+                "output_dim": 2,
+                "units": 16,
+                "nlayers": 2,
+                "activation": "tanh",
+            },
+        ),
+        (NIFMultiScale, CFG_SHAPE_NET),
+        (NIFMultiScale, dict(CFG_SHAPE_NET, use_resblock=False)),
+        (NIFMultiScale, dict(CFG_SHAPE_NET, rank=4, low_rank_base=True)),
+        (
+            NIFMultiScaleLastLayerParameterized,
+            dict(CFG_SHAPE_NET, connectivity="last_layer"),
+        ),
+    ],
+)
+@pytest.mark.parametrize("n_parameters", [3, 300])
+def test_numpy_model_matches_keras(tmp_path, model_class, cfg_shape_net, n_parameters):
+    tf.keras.utils.set_random_seed(0)
+    model_ori = model_class(cfg_shape_net, CFG_PARAMETER_NET)
+    model = model_ori.model()
+    # move away from the initialization, e.g., the zero shared base matrices
+    for variable in model.trainable_variables:
+        variable.assign(variable + 0.05 * tf.random.normal(variable.shape))
+
+    # few parameter values go through the grouped path, many through per-point
+    # weights
+    rng = np.random.default_rng(0)
+    parameters = rng.uniform(size=(n_parameters, 1))
+    inputs = np.hstack(
+        [np.repeat(parameters, 600 // n_parameters, 0), rng.uniform(-1, 1, (600, 2))]
+    ).astype(np.float32)
+    expected = model.predict(inputs, verbose=0)
+
+    filename = str(tmp_path / "model.npz")
+    export_numpy(model_ori, filename)
+    output = NumpyModel(filename, num_threads=2).predict(inputs, batch_size=128)
+    assert output.shape == expected.shape
+    # omega_0 = 30 amplifies the float32 rounding, in different orders in NumPy
+    # and TensorFlow
+    np.testing.assert_allclose(output, expected, rtol=0, atol=1e-3)
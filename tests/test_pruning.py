@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+import tensorflow as tf
+
+from nif import NIF
+from nif import NIFMultiScale
+from nif.pruning import neuron_importance
+from nif.pruning import prune_width
+
+CFG_PARAMETER_NET = {
+    "use_resblock": False,
+    "input_dim": 1,
+    "latent_dim": 2,
+    "units": 16,
+    "nlayers": 2,
+    "activation": "swish",
+}
+
+
+@pytest.fixture(
+    params=[
+        (
+            NIF,
+            {
+                "input_dim": 1,
+                "output_dim": 1,
+                "units": 8,
+                "nlayers": 2,
+                "activation": "tanh",
+            },
+        ),
+        (
+            NIFMultiScale,
+            {
+                "connectivity": "full",
+                "input_dim": 1,
+                "output_dim": 1,
+                "units": 8,
+                "nlayers": 2,
+                "weight_init_factor": 0.01,
+                "omega_0": 30.0,
+                "use_resblock": True,
+            },
+        ),
+    ]
+)
+def model_ori(request):
+    model_class, cfg_shape_net = request.param
+    tf.keras.utils.set_random_seed(0)
+    model_ori = model_class(cfg_shape_net, CFG_PARAMETER_NET)
+    model_ori.model()
+    return model_ori
+
+
+@pytest.fixture
+def data():
+    return np.random.default_rng(0).uniform(-1, 1, (512, 2)).astype(np.float32)
+
+
+def test_prune_width_without_pruning_preserves_outputs(model_ori, data):
+    model_new = prune_width(model_ori, data, parameter_net_units=16)
+    assert model_new is not model_ori
+    np.testing.assert_array_equal(
+        model_new.model().predict(data, verbose=0),
+        model_ori.model().predict(data, verbose=0),
+    )
+
+
+def test_prune_width_reduces_the_parameter_net(model_ori, data):
+    model_new = prune_width(model_ori, data, parameter_net_units=12)
+    assert model_new.n_st == 12
+    assert model_new.po_dim == model_ori.po_dim
+    assert model_new.model().count_params() < model_ori.model().count_params()
+    scores = neuron_importance(model_ori, data)
+    assert scores.shape[1] == 16
+    with pytest.raises(ValueError):
+        prune_width(model_ori, data, parameter_net_units=20)